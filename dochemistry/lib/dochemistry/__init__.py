@@ -7,6 +7,43 @@
   doChemistry is intended to be an abstraction layer for various NoSQL and
 document-oriented databases.
 
+@section Engines Engines
+  Stores are opened with create_engine(), given a URL whose scheme names
+the engine:
+    memory://            - dochemistry.memory, held in memory only
+    memory:///some/file  - dochemistry.memory, loaded from (and
+                           snapshotted to) a file
+    disk:///some/file    - dochemistry.disk, an embedded single file
+                           store with crash-safe commits
+More engines are added by register_engine().
 """
 
 __version__ = '0.0.1'
+
+from dochemistry.exc import EngineNotFoundError
+from dochemistry.index import Index
+
+# Scheme -> module name. Each module has a create(url, path) function.
+_engines = {
+    'memory' : 'dochemistry.memory',
+    'disk' : 'dochemistry.disk',
+}
+
+def register_engine(scheme, module_name):
+    """
+    Make create_engine() hand URLs with scheme to the module module_name,
+    which must have a create(url, path) function
+    """
+    _engines[scheme] = module_name
+
+def create_engine(url):
+    """
+    Returns a new engine for url (see Engines above)
+    """
+    if '://' not in url:
+        raise EngineNotFoundError("'%s' is not an engine URL" % url)
+    (scheme, path) = url.split('://', 1)
+    if scheme not in _engines:
+        raise EngineNotFoundError("No engine for scheme '%s'" % scheme)
+    module = __import__(_engines[scheme], globals(), locals(), ['create'])
+    return module.create(url, path or None)
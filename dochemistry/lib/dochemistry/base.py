@@ -0,0 +1,466 @@
+"""
+@package dochemistry.base
+
+The classes every dochemistry engine derives from.
+
+@section Documents Documents
+  A document is a flat dict. Every collection has a primary key field,
+which is unique within the collection. A collection made with
+auto_increment=True fills the primary key in with the next integer when a
+document is inserted without one.
+
+@section Queries Queries
+  Queries are given as a spec dict of field names to conditions, all of
+which must hold for a document to match. A condition is either a plain
+value (equality) or a dict of operators:
+    $eq, $ne, $gt, $gte, $lt, $lte  - comparison with a value
+    $in                             - the field is one of a list of values
+Documents always come back in primary key order, newest (highest) first
+if reverse is set. See dochemistry.index for the secondary indexes which
+serve queries without a scan.
+"""
+
+import time
+import bisect
+
+import dochemistry.planner as planner
+from dochemistry.index import Index, IndexData, __BATCH_RATIO__
+from dochemistry.exc import DoChemistryError, InvalidQueryError, \
+                            NoSuchCollectionError, CollectionExistsError, \
+                            DuplicateKeyError, NoSuchDocumentError
+
+def _op_eq(value, arg):
+    return value == arg
+
+def _op_ne(value, arg):
+    return value != arg
+
+def _op_gt(value, arg):
+    return value is not None and value > arg
+
+def _op_gte(value, arg):
+    return value is not None and value >= arg
+
+def _op_lt(value, arg):
+    return value is not None and value < arg
+
+def _op_lte(value, arg):
+    return value is not None and value <= arg
+
+def _op_in(value, arg):
+    return value in arg
+
+operators = {
+    '$eq' : _op_eq,
+    '$ne' : _op_ne,
+    '$gt' : _op_gt,
+    '$gte' : _op_gte,
+    '$lt' : _op_lt,
+    '$lte' : _op_lte,
+    '$in' : _op_in,
+}
+
+def normalize_spec(spec):
+    """
+    Returns spec with every condition as an operator dict, so
+    {'a' : 1} becomes {'a' : {'$eq' : 1}}. Raises InvalidQueryError for
+    unknown operators.
+    """
+    normal = {}
+    for (field, condition) in (spec or {}).items():
+        if isinstance(condition, dict):
+            for op in condition.keys():
+                if op not in operators:
+                    raise InvalidQueryError("Unknown operator '%s' on field '%s'" % (op, field))
+            normal[field] = condition
+        else:
+            normal[field] = {'$eq' : condition}
+    return normal
+
+def matches(doc, spec):
+    """
+    Returns True if doc satisfies every condition of the normalized spec
+    """
+    for (field, condition) in spec.items():
+        value = doc.get(field)
+        for (op, arg) in condition.items():
+            if not operators[op](value, arg):
+                return False
+    return True
+
+class Collection(object):
+    """
+    A named set of documents sharing a primary key field. Engines derive
+    from this and fill in the storage methods.
+    """
+    def __init__(self, engine, name, primary_key='_id', auto_increment=False):
+        self.engine = engine
+        self.name = name
+        self.primary_key = primary_key
+        self.auto_increment = auto_increment
+
+    def insert(self, doc):
+        """
+        Add doc to the collection, returning its primary key. Raises
+        DuplicateKeyError if the key is taken.
+        """
+        raise NotImplementedError
+
+    def save(self, doc):
+        """
+        Add doc to the collection, replacing any document with the same
+        primary key. Returns the primary key.
+        """
+        raise NotImplementedError
+
+    def update(self, key, changes):
+        """
+        Set the fields in the changes dict on the document with primary
+        key key. Raises NoSuchDocumentError if there is no such document.
+        """
+        raise NotImplementedError
+
+    def delete(self, key):
+        """
+        Remove the document with primary key key, if there is one
+        """
+        raise NotImplementedError
+
+    def get(self, key):
+        """
+        Returns the document with primary key key, or None
+        """
+        raise NotImplementedError
+
+    def bulk_write(self, docs, upsert=False):
+        """
+        Add every document in docs, returning their primary keys. With
+        upsert set, documents replace any with the same key (the last one
+        wins within docs), otherwise a key which is taken raises
+        DuplicateKeyError. Either every document is written or, on error,
+        none are.
+        """
+        raise NotImplementedError
+
+    def find(self, spec=None, reverse=False, limit=None):
+        """
+        Generator over the documents matching spec (see Queries above), in
+        primary key order. The collection mustn't be changed while the
+        generator is in use.
+        """
+        raise NotImplementedError
+
+    def find_one(self, spec=None):
+        """
+        Returns the first document matching spec, or None
+        """
+        for doc in self.find(spec, limit=1):
+            return doc
+        return None
+
+    def count(self, spec=None):
+        """
+        Returns the number of documents matching spec
+        """
+        total = 0
+        for doc in self.find(spec):
+            total = total + 1
+        return total
+
+    def create_index(self, index):
+        """
+        Maintain the secondary index index (a dochemistry.index.Index, or a
+        field name for a single field index named after it), which find()
+        then uses where it can. Returns the Index. Creating an index which
+        already exists does nothing.
+        """
+        raise NotImplementedError
+
+    def indexes(self):
+        """
+        Returns the Index declarations of the collection
+        """
+        raise NotImplementedError
+
+    def explain(self, spec=None, reverse=False, limit=None):
+        """
+        Run the query, returning a dochemistry.planner.Explain of how it
+        was answered
+        """
+        raise NotImplementedError
+
+class KeyedCollection(Collection):
+    """
+    A collection which keeps a sorted list of its primary keys and its
+    secondary indexes in memory, so documents come back in key order, key
+    range conditions are answered with a bisect rather than a scan, and
+    indexed conditions only visit the documents the index points at.
+
+    Engines derive from this and provide the document storage:
+    _fetch(key), _store(key, doc) and _erase(key).
+    """
+    def __init__(self, engine, name, primary_key='_id', auto_increment=False):
+        Collection.__init__(self, engine, name, primary_key, auto_increment)
+        self._keys = []
+        self._indexes = {}
+        self._next_id = 1
+
+    def _fetch(self, key):
+        """
+        Returns the stored document for key, or None
+        """
+        raise NotImplementedError
+
+    def _store(self, key, doc):
+        raise NotImplementedError
+
+    def _erase(self, key):
+        raise NotImplementedError
+
+    def __len__(self):
+        return len(self._keys)
+
+    def _has_key(self, key):
+        i = bisect.bisect_left(self._keys, key)
+        return i < len(self._keys) and self._keys[i] == key
+
+    def _add_key(self, key):
+        # Keys nearly always arrive in order, append when they do
+        if not self._keys or key > self._keys[-1]:
+            self._keys.append(key)
+        else:
+            bisect.insort(self._keys, key)
+
+    def _remove_key(self, key):
+        i = bisect.bisect_left(self._keys, key)
+        if i < len(self._keys) and self._keys[i] == key:
+            del self._keys[i]
+
+    def _index_add(self, key, doc):
+        for data in self._indexes.values():
+            data.add(key, doc)
+
+    def _index_remove(self, key, doc):
+        for data in self._indexes.values():
+            data.remove(key, doc)
+
+    def _prepare(self, doc):
+        """
+        Returns a copy of doc with its primary key filled in
+        """
+        doc = dict(doc)
+        key = doc.get(self.primary_key)
+        if key is None and self.auto_increment:
+            key = self._next_id
+            doc[self.primary_key] = key
+        if key is None:
+            raise DoChemistryError("Document has no '%s' and '%s' doesn't auto increment" % (self.primary_key, self.name))
+        if self.auto_increment and isinstance(key, (int, long)) and key >= self._next_id:
+            self._next_id = key + 1
+        return doc
+
+    def insert(self, doc):
+        doc = self._prepare(doc)
+        key = doc[self.primary_key]
+        if self._has_key(key):
+            raise DuplicateKeyError("Key '%s' already in '%s'" % (key, self.name))
+        self._store(key, doc)
+        self._add_key(key)
+        self._index_add(key, doc)
+        return key
+
+    def save(self, doc):
+        doc = self._prepare(doc)
+        key = doc[self.primary_key]
+        if self._has_key(key):
+            self._index_remove(key, self._fetch(key))
+        else:
+            self._add_key(key)
+        self._store(key, doc)
+        self._index_add(key, doc)
+        return key
+
+    def update(self, key, changes):
+        old = None
+        if self._has_key(key):
+            old = self._fetch(key)
+        if old is None:
+            raise NoSuchDocumentError("No key '%s' in '%s'" % (key, self.name))
+        doc = dict(old)
+        doc.update(changes)
+        doc[self.primary_key] = key
+        self._index_remove(key, old)
+        self._store(key, doc)
+        self._index_add(key, doc)
+
+    def delete(self, key):
+        if self._has_key(key):
+            self._index_remove(key, self._fetch(key))
+            self._remove_key(key)
+            self._erase(key)
+
+    def get(self, key):
+        if not self._has_key(key):
+            return None
+        return dict(self._fetch(key))
+
+    def find(self, spec=None, reverse=False, limit=None):
+        spec = normalize_spec(spec)
+        keys = planner.keys_for(self, spec, planner.choose(self, spec), reverse)
+        found = 0
+        for key in keys:
+            if limit is not None and found >= limit:
+                return
+            doc = self._fetch(key)
+            if doc is not None and matches(doc, spec):
+                found = found + 1
+                yield dict(doc)
+
+    def bulk_write(self, docs, upsert=False):
+        # Everything is checked before anything is touched, then the key
+        # list and each index take the whole batch in one merge
+        next_id = self._next_id
+        try:
+            prepared = [self._prepare(doc) for doc in docs]
+        except DoChemistryError:
+            self._next_id = next_id
+            raise
+        latest = {}
+        order = []
+        for doc in prepared:
+            key = doc[self.primary_key]
+            if key in latest or self._has_key(key):
+                if not upsert:
+                    self._next_id = next_id
+                    raise DuplicateKeyError("Key '%s' already in '%s'" % (key, self.name))
+            if key not in latest:
+                order.append(key)
+            latest[key] = doc
+
+        replaced = [(key, self._fetch(key)) for key in order if self._has_key(key)]
+        added = [key for key in order if not self._has_key(key)]
+        pairs = [(key, latest[key]) for key in order]
+        for data in self._indexes.values():
+            data.remove_many(replaced)
+            data.add_many(pairs)
+        if len(added) * __BATCH_RATIO__ < len(self._keys):
+            for key in added:
+                self._add_key(key)
+        else:
+            self._keys.extend(added)
+            self._keys.sort()
+        for (key, doc) in pairs:
+            self._store(key, doc)
+        return [doc[self.primary_key] for doc in prepared]
+
+    def explain(self, spec=None, reverse=False, limit=None):
+        """
+        Run the query, returning a dochemistry.planner.Explain of the plan
+        it used and what running it took
+        """
+        candidates = planner.plans(self, normalize_spec(spec))
+        start = time.time()
+        actual = 0
+        for doc in self.find(spec, reverse, limit):
+            actual = actual + 1
+        return planner.Explain(self.name, spec, candidates[0], candidates,
+                               actual, time.time() - start)
+
+    def create_index(self, index):
+        if not isinstance(index, Index):
+            index = Index(index, index)
+        if index.name in self._indexes:
+            return self._indexes[index.name].index
+        data = IndexData(index)
+        for key in self._keys:
+            data.add(key, self._fetch(key))
+        self._indexes[index.name] = data
+        return index
+
+    def indexes(self):
+        return [data.index for data in self._indexes.values()]
+
+class Engine(object):
+    """
+    A store of collections. Engines are made with
+    dochemistry.create_engine(), not directly.
+    """
+    collection_class = Collection
+
+    def __init__(self, url):
+        self.url = url
+        self._collections = {}
+
+    def create_collection(self, name, primary_key='_id', auto_increment=False,
+                          indexes=None):
+        """
+        Create and return a new collection, with the secondary indexes in
+        the list indexes (see create_index). Raises CollectionExistsError
+        if there is one of that name already.
+        """
+        if name in self._collections:
+            raise CollectionExistsError("Collection '%s' already exists" % name)
+        collection = self.collection_class(self, name, primary_key,
+                                           auto_increment)
+        self._collections[name] = collection
+        for index in indexes or []:
+            collection.create_index(index)
+        return collection
+
+    def collection(self, name):
+        """
+        Returns the collection called name. Raises NoSuchCollectionError
+        if there isn't one.
+        """
+        try:
+            return self._collections[name]
+        except KeyError:
+            raise NoSuchCollectionError("No collection '%s'" % name)
+
+    def has_collection(self, name):
+        return name in self._collections
+
+    def collection_names(self):
+        return sorted(self._collections.keys())
+
+    def bulk_write(self, collection, docs, upsert=False):
+        """
+        Write every document in docs to the collection called collection
+        at once (see Collection.bulk_write), returning their primary keys.
+        Like any other change, this is made durable by the next commit(),
+        so a batch costs one sync however many documents it has.
+        """
+        return self.collection(collection).bulk_write(docs, upsert)
+
+    def drop_collection(self, name):
+        """
+        Remove the collection called name and every document in it
+        """
+        self.collection(name)
+        del self._collections[name]
+
+    def lock(self):
+        """
+        Take the write lock now rather than at the first change, catching
+        up with what other engines have committed, so that everything read
+        until the next commit() or rollback() is one state of the store.
+        Engines which aren't shared between processes have nothing to do.
+        """
+        pass
+
+    def commit(self):
+        """
+        Make every change so far durable. Engines which don't persist
+        anything have nothing to do.
+        """
+        pass
+
+    def rollback(self):
+        """
+        Throw away every change since the last commit. Engines which don't
+        persist anything can't, and raise DoChemistryError.
+        """
+        raise DoChemistryError("'%s' engines can't roll back" % self.__class__.__name__)
+
+    def close(self):
+        pass
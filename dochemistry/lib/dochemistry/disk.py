@@ -0,0 +1,467 @@
+"""
+@package dochemistry.disk
+
+The embedded on-disk engine: a whole store in one file, with no server.
+
+URLs are 'disk:///path/to/file'. The file is created if it doesn't exist.
+
+@section Format File format
+  The file is a write-ahead log, and nothing else. It is a sequence of
+records, each a header (length and crc32 of the body) followed by the
+body, a binary pickle of one operation:
+    ('create', collection, primary_key, auto_increment)
+    ('drop', collection)
+    ('index', collection, name, fields)
+    ('put', collection, key, doc)
+    ('delete', collection, key)
+    ('commit', sequence)
+Changes are held in memory until commit(), which appends their records
+followed by a commit record and fsyncs. On open, the file is replayed up
+to the last complete commit record; anything after it (a commit cut short
+by a crash) is cut off. So a commit either happened in full or not at
+all. A commit which fails partway (a document which won't pickle, a full
+disk) cuts the file back to where it started before raising, so nothing
+it wrote can end up ahead of a later commit.
+
+@section Locking Locking
+  Several engines, in one process or many, may have the same file open.
+Writers take turns on an exclusive flock() of a lock file next to it
+(path + '.lock'): an engine takes the lock at its first change after a
+commit and holds it until commit() or rollback(). On taking it, the engine
+first replays whatever other engines committed since it last looked, so
+auto increment keys and updates always start from the newest state. An
+engine only sees other engines' commits when it next starts a change, is
+rolled back or is reopened.
+
+@section Indexes Indexes
+  Opening a store replays the log into, for each collection, a sorted list
+of the primary keys and a map from each key to the offset of its newest
+'put' record (so a document is read with a single seek), plus the
+secondary indexes. Documents themselves stay on disk; the most recently
+read are kept in a small cache.
+
+  As documents are replaced the file keeps their old versions; compact()
+rewrites it with only the live documents.
+"""
+
+import os
+import zlib
+import fcntl
+import struct
+import cPickle as pickle
+
+from dochemistry.base import Engine, KeyedCollection
+from dochemistry.index import Index
+from dochemistry.exc import DoChemistryError
+
+__HEADER__ = struct.Struct('>II')
+
+# How many documents each collection keeps in its read cache
+__CACHE_SIZE__ = 256
+
+class DiskCollection(KeyedCollection):
+    def __init__(self, engine, name, primary_key='_id', auto_increment=False):
+        KeyedCollection.__init__(self, engine, name, primary_key,
+                                 auto_increment)
+        # key -> file offset of the newest 'put' record
+        self._offsets = {}
+        # key -> doc (or None if deleted) written since the last commit
+        self._dirty = {}
+        self._cache = {}
+
+    def _reset(self):
+        """
+        Forget everything, before the file is replayed again
+        """
+        self._keys = []
+        self._indexes = {}
+        self._next_id = 1
+        self._offsets = {}
+        self._dirty = {}
+        self._cache = {}
+
+    def _fetch(self, key):
+        if key in self._dirty:
+            return self._dirty[key]
+        doc = self._cache.get(key)
+        if doc is None:
+            offset = self._offsets.get(key)
+            if offset is None:
+                return None
+            doc = self.engine._read(offset)[3]
+            if len(self._cache) >= __CACHE_SIZE__:
+                self._cache.clear()
+            self._cache[key] = doc
+        return doc
+
+    def _store(self, key, doc):
+        self._dirty[key] = doc
+        self._cache.pop(key, None)
+        self.engine._changed(self)
+
+    def _erase(self, key):
+        self._dirty[key] = None
+        self._cache.pop(key, None)
+        self.engine._changed(self)
+
+    # Every change starts by bringing the collection up to date with the
+    # file, under the write lock
+
+    def insert(self, doc):
+        self.engine._begin()
+        return KeyedCollection.insert(self, doc)
+
+    def save(self, doc):
+        self.engine._begin()
+        return KeyedCollection.save(self, doc)
+
+    def update(self, key, changes):
+        self.engine._begin()
+        KeyedCollection.update(self, key, changes)
+
+    def delete(self, key):
+        self.engine._begin()
+        KeyedCollection.delete(self, key)
+
+    def bulk_write(self, docs, upsert=False):
+        self.engine._begin()
+        return KeyedCollection.bulk_write(self, docs, upsert)
+
+    def create_index(self, index):
+        if not isinstance(index, Index):
+            index = Index(index, index)
+        if index.name not in self._indexes:
+            self.engine._begin()
+            KeyedCollection.create_index(self, index)
+            self.engine._log(('index', self.name, index.name, index.fields))
+        return self._indexes[index.name].index
+
+class DiskEngine(Engine):
+    collection_class = DiskCollection
+
+    def __init__(self, url, path):
+        Engine.__init__(self, url)
+        if not path:
+            raise DoChemistryError("'%s' doesn't name a file" % url)
+        self.path = path
+        self._fp = None
+        self._lock_fp = open(path + '.lock', 'a')
+        self._locked = False
+        # Where the last commit this engine knows of ends
+        self._end = 0
+        # Collections from before a reopen, by name, until it is done
+        self._previous = {}
+        self._sequence = 0
+        self._pending = []
+        self._changed_collections = []
+        self._open()
+
+    def _acquire(self):
+        """
+        Take the write lock, returning False if this engine already had it
+        """
+        if self._locked:
+            return False
+        fcntl.flock(self._lock_fp.fileno(), fcntl.LOCK_EX)
+        self._locked = True
+        return True
+
+    def _release(self):
+        if self._locked:
+            fcntl.flock(self._lock_fp.fileno(), fcntl.LOCK_UN)
+            self._locked = False
+
+    def _begin(self):
+        """
+        Called before every change. The first change after a commit takes
+        the write lock and catches up with the file.
+        """
+        if self._locked:
+            return
+        self._acquire()
+        try:
+            self._catch_up()
+        except:
+            self._release()
+            raise
+
+    def lock(self):
+        self._begin()
+
+    def _catch_up(self):
+        """
+        Replay what other engines have committed since this one last read
+        the file. Needs the write lock.
+        """
+        try:
+            replaced = os.stat(self.path).st_ino != os.fstat(self._fp.fileno()).st_ino
+        except OSError:
+            replaced = True
+        if replaced or os.path.getsize(self.path) < self._end:
+            # Compacted (or otherwise rewritten) by another engine
+            self._open()
+        elif os.path.getsize(self.path) > self._end:
+            self._replay_from(self._end)
+
+    def _open(self):
+        """
+        Replay the file into the in-memory key lists and indexes, and cut
+        off anything after the last complete commit. Collections keep
+        their identity across a reopen, so callers holding one aren't left
+        with a stale copy.
+        """
+        acquired = self._acquire()
+        try:
+            self._previous = self._collections
+            self._collections = {}
+            self._pending = []
+            self._changed_collections = []
+            if not os.path.exists(self.path):
+                open(self.path, 'ab').close()
+            if self._fp:
+                self._fp.close()
+            # Replaying a delete or a replacement reads the document it
+            # drops, so the scan goes through the same file object as every
+            # read
+            self._fp = open(self.path, 'r+b')
+            self._sequence = 0
+            self._replay_from(0)
+            self._previous = {}
+        finally:
+            if acquired:
+                self._release()
+
+    def _replay_from(self, offset):
+        """
+        Replay the committed records from offset on, and cut off anything
+        after the last complete commit. Needs the write lock, so that what
+        follows the last commit can only be left over from a crash.
+        """
+        fp = self._fp
+        size = os.fstat(fp.fileno()).st_size
+        good = offset
+        batch = []
+        while offset + __HEADER__.size <= size:
+            fp.seek(offset)
+            (length, crc) = __HEADER__.unpack(fp.read(__HEADER__.size))
+            body = fp.read(length)
+            if len(body) < length or zlib.crc32(body) & 0xffffffff != crc:
+                break
+            op = pickle.loads(body)
+            offset = offset + __HEADER__.size + length
+            if op[0] == 'commit':
+                for (op_offset, batch_op) in batch:
+                    self._replay(op_offset, batch_op)
+                batch = []
+                good = offset
+                self._sequence = op[1]
+            else:
+                batch.append((offset - __HEADER__.size - length, op))
+        if good < size:
+            fp.truncate(good)
+            fp.flush()
+            os.fsync(fp.fileno())
+        self._end = good
+
+    def _replay(self, offset, op):
+        """
+        Apply one committed operation from the file
+        """
+        if op[0] == 'create':
+            collection = self._previous.pop(op[1], None)
+            if collection is not None and \
+               (collection.primary_key, collection.auto_increment) == (op[2], op[3]):
+                collection._reset()
+                self._collections[op[1]] = collection
+            else:
+                Engine.create_collection(self, op[1], op[2], op[3])
+        elif op[0] == 'drop':
+            del self._collections[op[1]]
+        elif op[0] == 'index':
+            if len(op) == 3:
+                # Written before compound indexes, a single field index
+                index = Index(op[2], op[2])
+            else:
+                index = Index(op[2], *op[3])
+            KeyedCollection.create_index(self._collections[op[1]], index)
+        else:
+            collection = self._collections[op[1]]
+            key = op[2]
+            if collection._has_key(key):
+                collection._index_remove(key, collection._fetch(key))
+                collection._remove_key(key)
+                del collection._offsets[key]
+                collection._cache.pop(key, None)
+            if op[0] == 'put':
+                collection._offsets[key] = offset
+                collection._cache[key] = op[3]
+                collection._add_key(key)
+                collection._index_add(key, op[3])
+                # Keeps the auto increment counter past every key
+                collection._prepare(op[3])
+            if len(collection._cache) >= __CACHE_SIZE__:
+                collection._cache.clear()
+
+    def _read(self, offset):
+        """
+        Returns the operation recorded at offset
+        """
+        return self._read_from(self._fp, offset)
+
+    def _read_from(self, fp, offset):
+        fp.seek(offset)
+        (length, crc) = __HEADER__.unpack(fp.read(__HEADER__.size))
+        return pickle.loads(fp.read(length))
+
+    def _log(self, op):
+        """
+        Queue a collection level operation for the next commit
+        """
+        self._pending.append(op)
+
+    def _changed(self, collection):
+        if collection not in self._changed_collections:
+            self._changed_collections.append(collection)
+
+    def create_collection(self, name, primary_key='_id', auto_increment=False,
+                          indexes=None):
+        self._begin()
+        collection = Engine.create_collection(self, name, primary_key,
+                                              auto_increment)
+        self._log(('create', name, primary_key, auto_increment))
+        for index in indexes or []:
+            collection.create_index(index)
+        return collection
+
+    def drop_collection(self, name):
+        self._begin()
+        collection = self.collection(name)
+        if collection in self._changed_collections:
+            self._changed_collections.remove(collection)
+        Engine.drop_collection(self, name)
+        self._log(('drop', name))
+
+    def _record(self, op):
+        """
+        Returns the bytes of the record for op
+        """
+        body = pickle.dumps(op, 2)
+        return __HEADER__.pack(len(body), zlib.crc32(body) & 0xffffffff) + body
+
+    def _write(self, op):
+        """
+        Append op to the file, returning its offset
+        """
+        offset = self._fp.tell()
+        self._fp.write(self._record(op))
+        return offset
+
+    def commit(self):
+        """
+        Write every change since the last commit, then a commit record, and
+        fsync. Nothing is visible to the next open until the fsync is done.
+        If writing fails, the file is cut back to the last commit and the
+        changes are still pending (roll them back, or fix and commit
+        again).
+        """
+        if not self._pending and not self._changed_collections:
+            self._release()
+            return
+        # Every record is made before the file is touched, so a document
+        # which can't be pickled costs nothing
+        records = [self._record(op) for op in self._pending]
+        offset = self._end + sum([len(record) for record in records])
+        written = []
+        for collection in self._changed_collections:
+            for (key, doc) in collection._dirty.items():
+                if doc is None:
+                    record = self._record(('delete', collection.name, key))
+                else:
+                    record = self._record(('put', collection.name, key, doc))
+                    written.append((collection, key, offset))
+                records.append(record)
+                offset = offset + len(record)
+        records.append(self._record(('commit', self._sequence + 1)))
+        offset = offset + len(records[-1])
+
+        try:
+            self._fp.seek(self._end)
+            self._fp.write(''.join(records))
+            self._fp.flush()
+            os.fsync(self._fp.fileno())
+        except:
+            self._fp.seek(self._end)
+            self._fp.truncate(self._end)
+            self._fp.flush()
+            raise
+        self._end = offset
+        self._sequence = self._sequence + 1
+
+        # Only now is it safe to point the key maps at the new records
+        for collection in self._changed_collections:
+            for (key, doc) in collection._dirty.items():
+                if doc is None:
+                    collection._offsets.pop(key, None)
+            collection._dirty = {}
+        for (collection, key, offset) in written:
+            collection._offsets[key] = offset
+        self._pending = []
+        self._changed_collections = []
+        self._release()
+
+    def rollback(self):
+        """
+        Throw away every change since the last commit, and pick up what
+        other engines have committed since
+        """
+        self._acquire()
+        try:
+            self._open()
+        finally:
+            self._release()
+
+    def compact(self):
+        """
+        Rewrite the file with just the live documents (committing first).
+        The new file replaces the old one atomically.
+        """
+        self.commit()
+        self._begin()
+        temp_path = self.path + '.compact'
+        old_fp = self._fp
+        try:
+            self._fp = open(temp_path, 'wb')
+            for name in self.collection_names():
+                collection = self._collections[name]
+                self._write(('create', name, collection.primary_key,
+                             collection.auto_increment))
+                for index in collection.indexes():
+                    self._write(('index', name, index.name, index.fields))
+                for key in collection._keys:
+                    doc = self._read_from(old_fp, collection._offsets[key])[3]
+                    self._write(('put', name, key, doc))
+            self._write(('commit', self._sequence))
+            self._fp.flush()
+            os.fsync(self._fp.fileno())
+            self._fp.close()
+            os.rename(temp_path, self.path)
+        finally:
+            if self._fp is not old_fp:
+                self._fp.close()
+                self._fp = old_fp
+            try:
+                self._open()
+            finally:
+                self._release()
+
+    def close(self):
+        self._release()
+        if self._fp:
+            self._fp.close()
+            self._fp = None
+        if self._lock_fp:
+            self._lock_fp.close()
+            self._lock_fp = None
+
+def create(url, path):
+    return DiskEngine(url, path)
@@ -0,0 +1,47 @@
+"""
+@package dochemistry.exc
+
+Exceptions raised by dochemistry and its engines.
+"""
+
+class DoChemistryError(Exception):
+    """
+    Base class of every dochemistry error
+    """
+    pass
+
+class EngineNotFoundError(DoChemistryError):
+    """
+    No engine is registered for the scheme of an engine URL
+    """
+    pass
+
+class NoSuchCollectionError(DoChemistryError):
+    """
+    The collection asked for doesn't exist
+    """
+    pass
+
+class CollectionExistsError(DoChemistryError):
+    """
+    A collection of that name already exists
+    """
+    pass
+
+class DuplicateKeyError(DoChemistryError):
+    """
+    A document with that primary key is already in the collection
+    """
+    pass
+
+class NoSuchDocumentError(DoChemistryError):
+    """
+    No document with that primary key is in the collection
+    """
+    pass
+
+class InvalidQueryError(DoChemistryError):
+    """
+    A query spec uses an unknown operator or is otherwise malformed
+    """
+    pass
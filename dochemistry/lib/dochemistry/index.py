@@ -0,0 +1,208 @@
+"""
+@package dochemistry.index
+
+Secondary indexes.
+
+An Index is declared with a name and one or more fields, either when a
+collection is created or later with create_index():
+
+    nodes = engine.create_collection('nodes', 'hash_id', indexes=[
+        Index('ix_nodes_issue_id', 'issue_id'),
+    ])
+    xlog.create_index(Index('ix_xlog_root_id', 'root', 'id'))
+
+Engines maintain every index of a collection as its documents are
+inserted, updated and deleted, and find() uses them by itself: an index
+serves a query which has equality conditions on a leading run of its
+fields, optionally followed by a range condition ($gt, $gte, $lt, $lte)
+on the next field. So the compound index above answers both
+{'root' : r} and {'root' : r, 'id' : {'$gt' : x}} without a scan.
+"""
+
+import bisect
+
+__RANGE_OPERATORS__ = ('$gt', '$gte', '$lt', '$lte')
+
+# Batches of at least 1/__BATCH_RATIO__ the size of an index are merged
+# into it wholesale, smaller ones an entry at a time
+__BATCH_RATIO__ = 8
+
+class _Max(object):
+    """
+    Compares greater than anything else, to bound index searches
+    """
+    def __cmp__(self, other):
+        if isinstance(other, _Max):
+            return 0
+        return 1
+
+    def __eq__(self, other):
+        return isinstance(other, _Max)
+
+    def __ne__(self, other):
+        return not isinstance(other, _Max)
+
+    def __lt__(self, other):
+        return False
+
+    def __le__(self, other):
+        return isinstance(other, _Max)
+
+    def __gt__(self, other):
+        return not isinstance(other, _Max)
+
+    def __ge__(self, other):
+        return True
+
+_MAX = _Max()
+
+class Index(object):
+    """
+    The declaration of a secondary index: its name and the fields it
+    covers, in order
+    """
+    def __init__(self, name, *fields):
+        if not fields:
+            raise ValueError("Index '%s' has no fields" % name)
+        self.name = name
+        self.fields = tuple(fields)
+
+    def __repr__(self):
+        return "Index(%r, %s)" % (self.name, ', '.join([repr(f) for f in self.fields]))
+
+    def __eq__(self, other):
+        return isinstance(other, Index) and self.name == other.name and \
+               self.fields == other.fields
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def usable_prefix(self, spec):
+        """
+        For the normalized spec, returns (eq, ranged): eq is the number of
+        leading fields with an equality condition, ranged is True if the
+        field after them has a range condition. (0, False) means this
+        index can't serve spec.
+        """
+        eq = 0
+        for field in self.fields:
+            condition = spec.get(field)
+            if condition and '$eq' in condition:
+                eq = eq + 1
+            else:
+                break
+        ranged = False
+        if eq < len(self.fields):
+            condition = spec.get(self.fields[eq])
+            if condition:
+                for op in __RANGE_OPERATORS__:
+                    if op in condition:
+                        ranged = True
+        return (eq, ranged)
+
+class IndexData(object):
+    """
+    The entries of an Index over one collection: a sorted list of
+    (values, key) pairs, where values is the tuple of the indexed fields
+    of the document with primary key key
+    """
+    def __init__(self, index):
+        self.index = index
+        self._entries = []
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _values(self, doc):
+        return tuple([doc.get(field) for field in self.index.fields])
+
+    def add(self, key, doc):
+        entry = (self._values(doc), key)
+        if not self._entries or entry > self._entries[-1]:
+            self._entries.append(entry)
+        else:
+            bisect.insort(self._entries, entry)
+
+    def remove(self, key, doc):
+        entry = (self._values(doc), key)
+        i = bisect.bisect_left(self._entries, entry)
+        if i < len(self._entries) and self._entries[i] == entry:
+            del self._entries[i]
+
+    def add_many(self, pairs):
+        """
+        Add the (key, doc) pairs. A large batch is appended and sorted in
+        one go (two sorted runs, which sort merges in linear time) rather
+        than bisected in one entry at a time.
+        """
+        if len(pairs) * __BATCH_RATIO__ < len(self._entries):
+            for (key, doc) in pairs:
+                self.add(key, doc)
+        else:
+            self._entries.extend([(self._values(doc), key) for (key, doc) in pairs])
+            self._entries.sort()
+
+    def remove_many(self, pairs):
+        """
+        Remove the (key, doc) pairs, with a single pass over the entries
+        for a large batch
+        """
+        if len(pairs) * __BATCH_RATIO__ < len(self._entries):
+            for (key, doc) in pairs:
+                self.remove(key, doc)
+        else:
+            drop = set([(self._values(doc), key) for (key, doc) in pairs])
+            self._entries = [entry for entry in self._entries if entry not in drop]
+
+    def _bounds(self, spec):
+        """
+        Returns the (lo, hi) slice of the entries which may match spec
+        """
+        (eq, ranged) = self.index.usable_prefix(spec)
+        prefix = tuple([spec[field]['$eq'] for field in self.index.fields[:eq]])
+        lower = (prefix,)
+        upper = (prefix + (_MAX,),)
+        if ranged:
+            condition = spec[self.index.fields[eq]]
+            if '$gte' in condition:
+                lower = max(lower, (prefix + (condition['$gte'],),))
+            if '$gt' in condition:
+                lower = max(lower, (prefix + (condition['$gt'], _MAX),))
+            if '$lte' in condition:
+                upper = min(upper, (prefix + (condition['$lte'], _MAX),))
+            if '$lt' in condition:
+                upper = min(upper, (prefix + (condition['$lt'],),))
+        lo = bisect.bisect_left(self._entries, lower)
+        hi = bisect.bisect_left(self._entries, upper)
+        return (lo, max(lo, hi))
+
+    def count(self, spec):
+        """
+        Returns how many entries may match spec, without visiting them
+        """
+        (lo, hi) = self._bounds(spec)
+        return hi - lo
+
+    def lookup(self, spec, reverse=False):
+        """
+        Generator over the keys of the documents which may match spec, in
+        key order (last first if reverse). When spec has an equality
+        condition on every indexed field, the entries of the slice differ
+        only by key and are walked in place, as far as the caller goes.
+        Otherwise the slice is in the order of the indexed values, and its
+        keys have to be sorted first.
+        """
+        (lo, hi) = self._bounds(spec)
+        if self.index.usable_prefix(spec)[0] == len(self.index.fields):
+            if reverse:
+                indices = xrange(hi - 1, lo - 1, -1)
+            else:
+                indices = xrange(lo, hi)
+            for i in indices:
+                yield self._entries[i][1]
+            return
+        keys = sorted([key for (values, key) in self._entries[lo:hi]])
+        if reverse:
+            keys.reverse()
+        for key in keys:
+            yield key
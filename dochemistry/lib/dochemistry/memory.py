@@ -0,0 +1,179 @@
+"""
+@package dochemistry.memory
+
+The in-memory engine, for tests, benchmarks and short-lived stores.
+
+Everything is held in plain dicts. URLs are 'memory://' for a store which
+lives only as long as the process, or 'memory:///some/file' to load the
+store from a snapshot file on creation; snapshot() writes it back.
+
+Each collection keeps its documents in a dict by primary key, next to the
+key list and indexes of dochemistry.base.KeyedCollection.
+
+rollback() works from an undo journal: the first time a document is
+touched after a commit its old version (or its absence) is noted, along
+with each collection's auto increment counter and indexes, and the
+collections created or dropped. Rolling back puts all of that back and
+rebuilds the key lists and indexes of the collections it touched.
+"""
+
+import os
+import bisect
+import cPickle as pickle
+
+from dochemistry.base import Engine, KeyedCollection
+from dochemistry.index import Index, IndexData
+
+# Stands in the undo journal for a document which didn't exist
+_MISSING = object()
+
+class MemoryCollection(KeyedCollection):
+    def __init__(self, engine, name, primary_key='_id', auto_increment=False):
+        KeyedCollection.__init__(self, engine, name, primary_key,
+                                 auto_increment)
+        self._docs = {}
+
+    def _fetch(self, key):
+        return self._docs.get(key)
+
+    def _store(self, key, doc):
+        self.engine._touch(self, key)
+        self._docs[key] = doc
+
+    def _erase(self, key):
+        self.engine._touch(self, key)
+        del self._docs[key]
+
+    def create_index(self, index):
+        self.engine._touch(self)
+        return KeyedCollection.create_index(self, index)
+
+    def _prepare(self, doc):
+        # The auto increment counter moves before any document is stored
+        self.engine._touch(self)
+        return KeyedCollection._prepare(self, doc)
+
+class MemoryEngine(Engine):
+    collection_class = MemoryCollection
+
+    def __init__(self, url, path=None):
+        Engine.__init__(self, url)
+        self.path = path
+        self._forget()
+        if path and os.path.isfile(path):
+            self.load(path)
+
+    def _forget(self):
+        """
+        Start a new undo journal, at a commit
+        """
+        # id(collection) -> (collection, {key : old doc}, next_id, index names)
+        self._journal = {}
+        self._created = []
+        self._dropped = []
+
+    def _touch(self, collection, key=_MISSING):
+        """
+        Note what collection (and the document key in it) looked like at
+        the last commit, the first time either changes
+        """
+        entry = self._journal.get(id(collection))
+        if entry is None:
+            entry = (collection, {}, collection._next_id,
+                     list(collection._indexes.keys()))
+            self._journal[id(collection)] = entry
+        if key is not _MISSING and key not in entry[1]:
+            entry[1][key] = collection._docs.get(key, _MISSING)
+
+    def create_collection(self, name, primary_key='_id', auto_increment=False,
+                          indexes=None):
+        collection = Engine.create_collection(self, name, primary_key,
+                                              auto_increment, indexes)
+        self._created.append(collection)
+        return collection
+
+    def drop_collection(self, name):
+        collection = self.collection(name)
+        Engine.drop_collection(self, name)
+        self._dropped.append(collection)
+
+    def commit(self):
+        """
+        Snapshot the store if it was created with a file, otherwise there
+        is nothing to do beyond forgetting how to roll back
+        """
+        if self.path:
+            self.snapshot()
+        self._forget()
+
+    def rollback(self):
+        """
+        Throw away every change since the last commit
+        """
+        for collection in self._created:
+            if self._collections.get(collection.name) is collection:
+                del self._collections[collection.name]
+        for collection in self._dropped:
+            self._collections[collection.name] = collection
+        for (collection, docs, next_id, index_names) in self._journal.values():
+            for (key, doc) in docs.items():
+                if doc is _MISSING:
+                    collection._docs.pop(key, None)
+                else:
+                    collection._docs[key] = doc
+            collection._next_id = next_id
+            collection._keys = sorted(collection._docs.keys())
+            indexes = {}
+            for name in index_names:
+                data = IndexData(collection._indexes[name].index)
+                data.add_many([(key, collection._docs[key]) for key in collection._keys])
+                indexes[name] = data
+            collection._indexes = indexes
+        self._forget()
+
+    def snapshot(self, path=None):
+        """
+        Write every collection, with its documents and index definitions,
+        to path (by default the path the engine was created with). The file
+        is replaced atomically, so a crash leaves the previous snapshot.
+        """
+        path = path or self.path
+        state = {'collections' : []}
+        for name in self.collection_names():
+            collection = self._collections[name]
+            state['collections'].append({
+                'name' : name,
+                'primary_key' : collection.primary_key,
+                'auto_increment' : collection.auto_increment,
+                'next_id' : collection._next_id,
+                'indexes' : [(index.name, index.fields) for index in collection.indexes()],
+                'docs' : [collection._docs[key] for key in collection._keys],
+            })
+        temp_path = path + '.tmp'
+        fp = open(temp_path, 'wb')
+        pickle.dump(state, fp, 2)
+        fp.flush()
+        os.fsync(fp.fileno())
+        fp.close()
+        os.rename(temp_path, path)
+
+    def load(self, path):
+        """
+        Replace every collection with those in the snapshot at path
+        """
+        fp = open(path, 'rb')
+        state = pickle.load(fp)
+        fp.close()
+        self._collections = {}
+        for saved in state['collections']:
+            collection = self.create_collection(saved['name'],
+                saved['primary_key'], saved['auto_increment'])
+            for (index_name, fields) in saved['indexes']:
+                collection.create_index(Index(index_name, *fields))
+            for doc in saved['docs']:
+                collection.insert(doc)
+            collection._next_id = saved['next_id']
+        self._forget()
+
+def create(url, path):
+    return MemoryEngine(url, path)
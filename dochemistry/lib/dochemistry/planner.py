@@ -0,0 +1,145 @@
+"""
+@package dochemistry.planner
+
+Picks how a KeyedCollection answers a query, and explains it.
+
+A query can be answered by:
+    key      - a primary key lookup, for an equality condition on the key
+    keyrange - a slice of the sorted primary keys, for a range on the key
+    index    - a slice of a secondary index (see dochemistry.index)
+    scan     - every document in the collection
+Every possible plan is costed by how many documents it would visit, which
+is counted exactly from the key list and index entries (a bisect each,
+no documents are read), and the cheapest wins. So of two usable indexes
+the more selective one is chosen, and an index which would visit most of
+the collection loses to a key range which visits less.
+"""
+
+import bisect
+
+from dochemistry.index import __RANGE_OPERATORS__
+
+# Every kind of plan, cheapest per row first
+__KINDS__ = ['key', 'keyrange', 'index', 'scan']
+
+class Plan(object):
+    """
+    How a query is answered: the access path (kind, and the index for
+    'index' plans) and how many documents it visits
+    """
+    def __init__(self, kind, estimated_rows, index=None):
+        self.kind = kind
+        self.estimated_rows = estimated_rows
+        self.index = index
+
+    def describe(self):
+        if self.kind == 'index':
+            return "index %s (%s)" % (self.index.name, ', '.join(self.index.fields))
+        return self.kind
+
+    def __repr__(self):
+        return "<Plan %s, %i rows>" % (self.describe(), self.estimated_rows)
+
+class Explain(object):
+    """
+    The result of KeyedCollection.explain(): the chosen plan, the other
+    plans considered, and what running the query actually took
+    """
+    def __init__(self, collection, spec, plan, candidates, actual_rows,
+                 elapsed):
+        self.collection = collection
+        self.spec = spec
+        self.plan = plan
+        self.candidates = candidates
+        self.estimated_rows = plan.estimated_rows
+        self.actual_rows = actual_rows
+        self.elapsed = elapsed
+
+    def __str__(self):
+        lines = ["Collection: %s" % self.collection,
+                 "Query: %r" % self.spec,
+                 "Plan: %s" % self.plan.describe(),
+                 "Estimated rows: %i" % self.estimated_rows,
+                 "Actual rows: %i" % self.actual_rows,
+                 "Time: %.6fs" % self.elapsed,
+                 "Considered:"]
+        for plan in self.candidates:
+            lines.append("    %-50s %i rows" % (plan.describe(), plan.estimated_rows))
+        return '\n'.join(lines)
+
+def _key_range(keys, condition):
+    """
+    Returns the (lo, hi) slice of the sorted keys list satisfying the range
+    operators of condition
+    """
+    lo = 0
+    hi = len(keys)
+    if '$gt' in condition:
+        lo = bisect.bisect_right(keys, condition['$gt'])
+    if '$gte' in condition:
+        lo = max(lo, bisect.bisect_left(keys, condition['$gte']))
+    if '$lt' in condition:
+        hi = min(hi, bisect.bisect_left(keys, condition['$lt']))
+    if '$lte' in condition:
+        hi = min(hi, bisect.bisect_right(keys, condition['$lte']))
+    return (lo, max(lo, hi))
+
+def plans(collection, spec):
+    """
+    Returns every usable Plan for the normalized spec on collection,
+    cheapest first
+    """
+    keys = collection._keys
+    candidates = [Plan('scan', len(keys))]
+    pk_condition = spec.get(collection.primary_key)
+    if pk_condition:
+        if '$eq' in pk_condition:
+            candidates.append(Plan('key', int(collection._has_key(pk_condition['$eq']))))
+        else:
+            for op in __RANGE_OPERATORS__:
+                if op in pk_condition:
+                    (lo, hi) = _key_range(keys, pk_condition)
+                    candidates.append(Plan('keyrange', hi - lo))
+                    break
+    for data in collection._indexes.values():
+        if data.index.usable_prefix(spec) != (0, False):
+            candidates.append(Plan('index', data.count(spec), data.index))
+    # On a tie, prefer the access path which does the least work per row
+    candidates.sort(key=lambda plan: (plan.estimated_rows, __KINDS__.index(plan.kind)))
+    return candidates
+
+def choose(collection, spec):
+    """
+    Returns the cheapest Plan for the normalized spec on collection
+    """
+    return plans(collection, spec)[0]
+
+def _walk(keys, lo, hi, reverse=False):
+    """
+    Generator over keys[lo:hi], last first if reverse, without copying the
+    slice
+    """
+    if reverse:
+        indices = xrange(hi - 1, lo - 1, -1)
+    else:
+        indices = xrange(lo, hi)
+    for i in indices:
+        yield keys[i]
+
+def keys_for(collection, spec, plan, reverse=False):
+    """
+    Returns an iterator over the keys plan visits for the normalized spec,
+    in key order (last first if reverse). Keys are produced as they are
+    walked, so a caller which stops early, at a limit, never touches the
+    rest; the collection mustn't be changed while it is walked.
+    """
+    if plan.kind == 'key':
+        if plan.estimated_rows:
+            return iter([spec[collection.primary_key]['$eq']])
+        return iter([])
+    if plan.kind == 'keyrange':
+        (lo, hi) = _key_range(collection._keys, spec[collection.primary_key])
+        return _walk(collection._keys, lo, hi, reverse)
+    if plan.kind == 'index':
+        return collection._indexes[plan.index.name].lookup(spec, reverse)
+    return _walk(collection._keys, 0, len(collection._keys), reverse)
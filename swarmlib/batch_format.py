@@ -0,0 +1,255 @@
+#!/usr/bin/env python
+
+# Copyright 2007 Sam Hart
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+# Author: Sam Hart
+
+# The framed batch format replication streams use between processes and
+# hosts (see stream_replication in swarmlib.hive_server).
+#
+# A stream is a sequence of frames, each a batch of transaction log
+# entries with the issues and nodes they create. A frame is a header
+#   magic 'SB', format version, codec        (2 bytes, 1 byte, 1 byte)
+#   body length, raw length, crc32 of raw    (3 unsigned 32 bit, big endian)
+# and then the body: the raw (JSON) batch, compressed with the frame's
+# codec. Codecs are chosen per frame:
+#   0 none    1 zlib    2 bz2    3 lzma (where the lzma module exists)
+# The checksum is over the raw batch, so it also catches a body which
+# decompresses to the wrong thing, and readers refuse frames whose raw
+# length is over __MAX_RAW_SIZE__ before decompressing anything.
+#
+# Frames of a stream share a symbol table. Transaction names and issue
+# hashes recur in nearly every entry, so they are sent once, the first
+# time a frame uses them, in that frame's 'symbols' list, and as their
+# index in the table from then on. Entries are
+#   [xid, root symbol, time, xaction symbol, xdata]
+# and the issue_id of nodes is a symbol too. A batch_writer and the
+# batch_reader reading its frames must see the same frames in the same
+# order.
+#
+# Text and ASCII byte strings are carried as JSON strings. Any other byte
+# string is sent as {"__bytes__" : base64 of its bytes} (see to_wire()),
+# so node details and attachments survive whatever they hold and text
+# comes back as text.
+
+import bz2
+import zlib
+import base64
+import json
+import struct
+
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+from swarmlib.exceptions import BatchFormatError
+
+__MAGIC__ = 'SB'
+__VERSION__ = 1
+__HEADER__ = struct.Struct('>2sBBIII')
+
+# Largest raw batch a reader accepts, in bytes
+__MAX_RAW_SIZE__ = 256 * 1024 * 1024
+
+# Node fields sent as symbols
+__SYMBOL_FIELDS__ = ('issue_id',)
+
+def _lzma_compress(data, level):
+    return lzma.compress(data, preset=level)
+
+codecs = {
+    'none' : (0, lambda data, level: data, lambda data: data),
+    'zlib' : (1, zlib.compress, zlib.decompress),
+    'bz2' : (2, bz2.compress, bz2.decompress),
+}
+if lzma is not None:
+    codecs['lzma'] = (3, _lzma_compress, lzma.decompress)
+
+# Codec names by their number in the header
+_codec_names = dict([(number, name) for (name, (number, c, d)) in codecs.items()])
+
+__DEFAULT_CODEC__ = 'zlib'
+__DEFAULT_LEVEL__ = 6
+
+# The key of the object a byte string is sent as
+__BYTES_TAG__ = '__bytes__'
+
+def _is_ascii(value):
+    try:
+        value.decode('ascii')
+    except UnicodeError:
+        return False
+    return True
+
+def to_wire(value):
+    """
+    Returns value made fit for JSON: byte strings which aren't ASCII
+    tagged and base64 encoded, and database rows made dicts
+    """
+    if isinstance(value, str):
+        if _is_ascii(value):
+            return value
+        return {__BYTES_TAG__ : base64.b64encode(value)}
+    if isinstance(value, (list, tuple)):
+        return [to_wire(v) for v in value]
+    if isinstance(value, dict) or hasattr(value, 'items'):
+        return dict([(to_wire(k), to_wire(v)) for (k, v) in value.items()])
+    return value
+
+def from_wire(value):
+    """
+    The reverse of to_wire(). ASCII text comes back as byte strings, like
+    it is everywhere else in swarm, other text as unicode.
+    """
+    if isinstance(value, unicode):
+        try:
+            return value.encode('ascii')
+        except UnicodeError:
+            return value
+    if isinstance(value, list):
+        return [from_wire(v) for v in value]
+    if isinstance(value, dict):
+        if len(value) == 1 and __BYTES_TAG__ in value:
+            try:
+                return base64.b64decode(value[__BYTES_TAG__])
+            except (TypeError, ValueError):
+                raise BatchFormatError("Badly encoded byte string")
+        return dict([(from_wire(k), from_wire(v)) for (k, v) in value.items()])
+    return value
+
+class batch_writer:
+    def __init__(self, codec=__DEFAULT_CODEC__, level=__DEFAULT_LEVEL__):
+        """
+        Makes the frames of one stream
+        codec == The name of the codec to compress frames with, see codecs
+        level == The compression level, 1 (fastest) to 9 (smallest)
+        """
+        if codec not in codecs:
+            raise BatchFormatError("Unknown codec '%s'" % codec)
+        self.codec = codec
+        self.level = level
+        self._symbols = {}
+
+    def _symbol(self, value, new):
+        index = self._symbols.get(value)
+        if index is None:
+            index = len(self._symbols)
+            self._symbols[value] = index
+            new.append(value)
+        return index
+
+    def frame(self, entries, issues, nodes):
+        """
+        Returns the frame (a string) for a batch of (xid, root, time,
+        xaction, xdata) entries and the issue and node dicts they create
+        """
+        new = []
+        wire_entries = [[xid, self._symbol(root, new), time,
+                         self._symbol(xaction, new), xdata]
+                        for (xid, root, time, xaction, xdata) in entries]
+        wire_nodes = []
+        for node in nodes:
+            node = dict(node)
+            for field in __SYMBOL_FIELDS__:
+                if node.get(field) is not None:
+                    node[field] = self._symbol(node[field], new)
+            wire_nodes.append(node)
+        raw = json.dumps(to_wire({'symbols' : new, 'entries' : wire_entries,
+                                  'issues' : issues, 'nodes' : wire_nodes}),
+                         separators=(',', ':'))
+        (number, compress, decompress) = codecs[self.codec]
+        body = compress(raw, self.level)
+        return __HEADER__.pack(__MAGIC__, __VERSION__, number, len(body),
+                               len(raw), zlib.crc32(raw) & 0xffffffff) + body
+
+class batch_reader:
+    def __init__(self):
+        """
+        Reads the frames of one stream, in order
+        """
+        self._symbols = []
+        # The uncompressed size of the last frame read
+        self.raw_size = 0
+
+    def header(self, data):
+        """
+        Returns the length of the body following the frame header data
+        (the first __HEADER__.size bytes of a frame)
+        """
+        return self._parse_header(data)[1]
+
+    def _parse_header(self, data):
+        if len(data) < __HEADER__.size:
+            raise BatchFormatError("Truncated frame header")
+        (magic, version, number, body_length, raw_length, crc) = \
+            __HEADER__.unpack(data[:__HEADER__.size])
+        if magic != __MAGIC__:
+            raise BatchFormatError("Not a batch frame")
+        if version > __VERSION__:
+            raise BatchFormatError("Batch format version '%i' is newer than this swarm understands" % version)
+        if number not in _codec_names:
+            raise BatchFormatError("Frame compressed with unknown or unavailable codec '%i'" % number)
+        if raw_length > __MAX_RAW_SIZE__:
+            raise BatchFormatError("Frame of '%i' bytes is too big" % raw_length)
+        return (number, body_length, raw_length, crc)
+
+    def read(self, frame):
+        """
+        Returns (entries, issues, nodes) from a whole frame
+        """
+        (number, body_length, raw_length, crc) = self._parse_header(frame)
+        body = frame[__HEADER__.size:]
+        if len(body) != body_length:
+            raise BatchFormatError("Truncated frame")
+        try:
+            raw = codecs[_codec_names[number]][2](body)
+        except Exception, e:
+            raise BatchFormatError("Corrupt frame: %s" % e)
+        if len(raw) != raw_length or zlib.crc32(raw) & 0xffffffff != crc:
+            raise BatchFormatError("Frame checksum mismatch")
+        batch = from_wire(json.loads(raw))
+
+        self._symbols.extend(batch['symbols'])
+        symbols = self._symbols
+        try:
+            entries = [(xid, symbols[root], time, symbols[xaction], xdata)
+                       for (xid, root, time, xaction, xdata) in batch['entries']]
+            nodes = batch['nodes']
+            for node in nodes:
+                for field in __SYMBOL_FIELDS__:
+                    if node.get(field) is not None:
+                        node[field] = symbols[node[field]]
+        except IndexError:
+            raise BatchFormatError("Frame refers to a symbol it hasn't been sent")
+
+        self.raw_size = raw_length
+        return (entries, batch['issues'], nodes)
+
+    def read_from(self, fp):
+        """
+        Returns (entries, issues, nodes) from the next frame in the file
+        object fp, or None at the end of the file
+        """
+        header = fp.read(__HEADER__.size)
+        if not header:
+            return None
+        body = fp.read(self.header(header))
+        return self.read(header + body)
@@ -42,26 +42,28 @@ class branch:
 
         self._logger.register("run")
 
-        # get the transaction log from the source_sw
-        # FIXME: This isn't very scalable, we probably should
-        # do this in clumps of xaction log entries
-        xlog = self._source_sw.get_transaction_log(issue=self._ticket_number)
-        self._logger.entry("Processing '%i' transactions" % len(xlog), 0)
+        # If an earlier branch from this source was interrupted, the dest_sw
+        # holds a checkpoint of the last xid it committed, and we pick up
+        # right after it
+        tracker_id = self._rep.get_tracker_id(self._ticket_number)
+        since_xid = self._rep.get_checkpoint(tracker_id)
+        if since_xid:
+            self._logger.entry("Resuming branch after transaction '%i'" % since_xid, 0)
 
-        # Now, run through each xaction, and replay it
-        # into the dest_sw
-        errors = 0
-        for (xid, root, time, xaction, xdata) in xlog:
-            errors = errors + self._rep.run(xid, root, time, xaction, xdata)
+        # Walk the transaction log from the source_sw a chunk at a
+        # time, replaying each chunk into the dest_sw and committing it
+        # (along with the checkpoint) before the next one is fetched
+        (errors, total) = self._rep.replay(tracker_id, issue=self._ticket_number, since_xid=since_xid)
 
         if errors > 0:
             self._logger.error("There were '%i' errors in the branch transaction" % errors)
-            # FIXME
-            # We should bail here, probably, since the cloned hive will be in an
-            # unknown state
+            self._logger.error("Re-run the branch to resume from the last checkpoint")
         else:
-            # add this clone to tbe upstream tracker
-            self._rep.add_tracker(self._ticket_number)
+            # add this branch to the upstream tracker, unless a previous
+            # (resumed) run already did
+            if not self._rep.has_tracker(tracker_id):
+                self._rep.add_tracker(self._ticket_number)
+                self._dest_sw.db.backend.commit()
             self._logger.entry("No errors in the branch transaction", 0)
 
         self._logger.unregister()
@@ -21,12 +21,24 @@
 import sys
 import os
 import getopt
+import socket
 import tempfile
 
 import swarmlib.log as Log
+import swarmlib.db.migrate as migrate
 import swarmlib.swarm_time as swarm_time
 import cli_thread
 import cli_util
+import swarmlib.swarmd as swarmd
+from swarmlib.config import Config
+from swarmlib.clone import clone
+from swarmlib.pull import pull
+from swarmlib.snapshot import snapshot
+from swarmlib.hive_server import hive_server
+from swarmlib.objects import get_store
+from swarmlib.remote import remote_hive
+from swarmlib.exceptions import HiveServerError
+from swarmlib.taxonomy import get_cache
 from swarmlib.db import taxonomy_terms
 from swarmlib.swarm import master_init
 from swarmlib.swarm import swarm as Swarm
@@ -41,6 +53,10 @@ from swarmlib.swarm import swarm as Swarm
 log = Log.log()
 logger = log.get_logger("swarm_cli")
 
+# Set by swarmd, which keeps hives open between commands (see
+# swarmlib.swarmd)
+hive_pool = None
+
 #########################
 # Informative Interfaces
 #########################
@@ -105,55 +121,87 @@ def cli_log(pre_options, pre_args, command, post_options):
     verbose = 0
     working_dir = os.getcwd()
     ticket_number = None
+    limit = None
+    since = None
+    until = None
+    xaction = None
+    reverse = False
+    bad_option = None
 
     for o, a in pre_options:
         if o in ("-v", "--verbose"):
             verbose = verbose + 1
+        try:
+            if o in ("-n", "--limit"):
+                limit = int(a)
+            if o == "--since":
+                since = swarm_time.parse(a)
+            if o == "--until":
+                until = swarm_time.parse(a, end=True)
+        except ValueError:
+            bad_option = (a, o)
+        if o in ("-t", "--type"):
+            xaction = a
+        if o in ("-r", "--reverse"):
+            reverse = True
 
     log.set_universal_loglevel(verbose)
     logger.register("cli_log")
 
+    if bad_option:
+        logger.error("Bad value '%s' for '%s'. See 'help log' for more information" % bad_option)
+        sys.exit(2)
+
     if len(post_options) == 2:
         # swarm log ##### directory
         working_dir = post_options[1]
         ticket_number = post_options[0]
-        sw = Swarm(working_dir, log)
+        sw = open_hive(working_dir)
     elif len(post_options) == 1:
         # 1) swarm log #####
         # OR
         # 2) swarm log directory
         logger.entry("Ambiguous request, trying local directory for Swarm hive", 0)
         ticket_number = post_options[0]
-        sw = Swarm(working_dir, log)
-        if not sw.loaded:
+        if not is_hive(working_dir):
             # Try #2
             logger.entry("Local directory not Swarm hive, trying parameter as directory", 0)
-            sw.close()
             ticket_number = None
             working_dir = post_options[0]
-            sw = Swarm(working_dir, log)
-            if not sw.loaded:
-                logger.error("Problem accessing Swarm hive '%s'." % working_dir)
+        sw = open_hive(working_dir)
+        if not sw.loaded:
+            logger.error("Problem accessing Swarm hive '%s'." % working_dir)
     else:
         # Default is to use the last issue
-        sw = Swarm(working_dir, log)
+        sw = open_hive(working_dir)
 
     if ticket_number == 0:
         ticket_number = None
-    if sw.loaded:
-        xlog = sw.get_transaction_log(issue=ticket_number)
-        # FIXME
-        # This is ugly, was just an early hack that
-        # is still around
-        for entry in xlog:
-            message = "[%i] %s - %s" % (entry[0], swarm_time.human_readable_from_stamp(entry[2]), sw.xactions.dispatch[entry[3]].description)
+    if xaction and not sw.xactions.dispatch.has_key(xaction):
+        logger.error("Unknown transaction type '%s'" % xaction)
+    elif sw.loaded:
+        # The log is printed a page at a time as it is read, and every
+        # filter goes to the storage query, so output starts straight away
+        # however big the hive is
+        for page in sw.iter_transaction_log(issue=ticket_number,
+                since=since, until=until, xaction=xaction, reverse=reverse,
+                limit=limit):
             if verbose > 0:
-                message = message + " : %s" % sw.xactions.dispatch[entry[3]].decode_human_readable(entry[1], entry[4])
-            print message
+                details = sw.xactions.decode_human_readable_batch(page)
+            # FIXME
+            # This is ugly, was just an early hack that
+            # is still around
+            for i in range(len(page)):
+                entry = page[i]
+                message = "[%i] %s - %s" % (entry[0], swarm_time.human_readable_from_stamp(entry[2]), sw.xactions.dispatch[entry[3]].description)
+                if verbose > 0:
+                    message = message + " : %s" % details[i]
+                print message
+            sys.stdout.flush()
     else:
         logger.error("Problem accessing Swarm hive '%s'." % working_dir)
 
-    sw.close()
+    close_hive(sw)
     logger.unregister()
 
 def cli_last(pre_options, pre_args, command, post_options):
@@ -173,14 +221,14 @@ def cli_last(pre_options, pre_args, command, post_options):
     log.set_universal_loglevel(verbose)
     logger.register("cli_last")
 
-    sw = Swarm(working_dir, log)
+    sw = open_hive(working_dir)
     if sw.config.has_section('cli'):
         last_id = sw.config.get('cli', 'last_issue')
         logger.entry("The last issue was #%s." % last_id, 0)
     else:
         logger.entry("There is no last issue set.", 0)
 
-    sw.close()
+    close_hive(sw)
     logger.unregister()
 
 #########################
@@ -212,6 +260,159 @@ def cli_init(pre_options, pre_args, command, post_options):
     master_init(project_name, working_dir, log, force)
     logger.unregister()
 
+def cli_migrate(pre_options, pre_args, command, post_options):
+    """
+    Migrates an existing hive to the current database format
+    """
+    verbose = 0
+    working_dir = os.getcwd()
+
+    for o, a in pre_options:
+        if o in ("-v", "--verbose"):
+            verbose = verbose + 1
+
+    if post_options:
+        working_dir = post_options[0]
+
+    log.set_universal_loglevel(verbose)
+    logger.register("cli_migrate")
+
+    sw = open_hive(working_dir)
+    if sw.loaded:
+        backend = sw.db.backend
+        if getattr(backend, 'connection', None) is None:
+            # Document store hives have no SQL schema to migrate
+            logger.error("Hive '%s' doesn't use an SQL database, there is nothing to migrate." % working_dir)
+        else:
+            migrate.run(backend.connection, sw.config, sw.xactions, log,
+                        backend.commit)
+    else:
+        logger.error("Problem accessing Swarm hive '%s'." % working_dir)
+
+    close_hive(sw)
+    logger.unregister()
+
+def cli_debug(pre_options, pre_args, command, post_options):
+    """
+    Debugging tools for a hive
+    """
+    verbose = 0
+    working_dir = os.getcwd()
+    arg = None
+
+    for o, a in pre_options:
+        if o in ("-v", "--verbose"):
+            verbose = verbose + 1
+
+    log.set_universal_loglevel(verbose)
+    logger.register("cli_debug")
+
+    if len(post_options) < 2 or post_options[0] != 'explain':
+        cli_help(None, None, 'help', ['debug'])
+        sys.exit(2)
+    query = post_options[1]
+    if len(post_options) > 2 and post_options[2] != '0':
+        arg = post_options[2]
+    if len(post_options) > 3:
+        working_dir = post_options[3]
+
+    sw = open_hive(working_dir)
+    if not sw.loaded:
+        logger.error("Problem accessing Swarm hive '%s'." % working_dir)
+    elif not hasattr(sw.db.backend, 'explain'):
+        logger.error("Query plans are only available for hives with a dochemistry database")
+    elif query in ('get_issue', 'get_lineage') and not arg:
+        logger.error("'%s' needs an issue. See 'help debug' for more information" % query)
+    else:
+        try:
+            print sw.db.backend.explain(query, arg)
+        except ValueError, e:
+            logger.error(str(e))
+
+    close_hive(sw)
+    logger.unregister()
+
+def cli_snapshot(pre_options, pre_args, command, post_options):
+    """
+    Writes a snapshot of a hive, and optionally compacts its log
+    """
+    verbose = 0
+    compact = False
+    working_dir = os.getcwd()
+
+    for o, a in pre_options:
+        if o in ("-v", "--verbose"):
+            verbose = verbose + 1
+        if o in ("-c", "--compact"):
+            compact = True
+
+    if post_options:
+        working_dir = post_options[0]
+
+    log.set_universal_loglevel(verbose)
+    logger.register("cli_snapshot")
+
+    sw = open_hive(working_dir)
+    if sw.loaded:
+        snap = snapshot(sw, log)
+        xid = snap.write()
+        if compact and xid is not None:
+            snap.compact(xid)
+            sw.db.backend.commit()
+    else:
+        logger.error("Problem accessing Swarm hive '%s'." % working_dir)
+
+    close_hive(sw)
+    logger.unregister()
+
+def cli_serve(pre_options, pre_args, command, post_options):
+    """
+    Serves a hive to other processes until interrupted
+    """
+    verbose = 0
+    working_dir = os.getcwd()
+    host = 'localhost'
+    port = None
+    bad_option = None
+
+    for o, a in pre_options:
+        if o in ("-v", "--verbose"):
+            verbose = verbose + 1
+        if o in ("-p", "--port"):
+            try:
+                port = int(a)
+            except ValueError:
+                bad_option = (a, o)
+        if o in ("-b", "--bind"):
+            host = a
+
+    if post_options:
+        working_dir = post_options[0]
+
+    log.set_universal_loglevel(verbose)
+    logger.register("cli_serve")
+
+    if bad_option:
+        logger.error("Bad value '%s' for '%s'. See 'help serve' for more information" % bad_option)
+        sys.exit(2)
+
+    sw = open_hive(working_dir)
+    if sw.loaded:
+        address = None
+        if port is not None:
+            address = (host, port)
+        try:
+            server = hive_server(sw, log, address=address)
+        except socket.error, e:
+            logger.error("Can't serve '%s': %s" % (working_dir, e))
+        else:
+            server.serve()
+    else:
+        logger.error("Problem accessing Swarm hive '%s'." % working_dir)
+
+    close_hive(sw)
+    logger.unregister()
+
 def cli_taxonomy(pre_options, pre_args, command, post_options):
     """
     The CLI Taxonomy subcommand interpreter
@@ -243,8 +444,9 @@ def cli_taxonomy(pre_options, pre_args, command, post_options):
         cli_help(None, None, 'help', ['taxonomy'])
         sys.exit(2)
 
-    sw = Swarm(working_dir, log)
-    components = sw.get_taxonomy(tax_term)
+    sw = open_hive(working_dir)
+    taxonomy = get_cache(sw, log)
+    components = taxonomy.get(tax_term)
     util = cli_util.util(sw, log)
 
     if tax_command.lower() == 'list':
@@ -271,13 +473,13 @@ def cli_taxonomy(pre_options, pre_args, command, post_options):
         (bhash, ahash, bsize, asize) = util.launch_editor(name)
         if bhash != ahash:
             new_components = util.parse_datafile(name, ['id', 'name', 'isdefault'])
-            sw.set_taxonomy(tax_term, new_components)
+            taxonomy.set(tax_term, new_components)
         else:
             logger.entry("'%s' list unchanged." % tax_term, 0)
 
         os.remove(name)
 
-    sw.close()
+    close_hive(sw)
     logger.unregister()
 
 def cli_thread_run(pre_options, pre_args, command, post_options):
@@ -300,22 +502,20 @@ def cli_thread_run(pre_options, pre_args, command, post_options):
         # swarm thread ##### directory
         working_dir = post_options[1]
         ticket_number = post_options[0]
-        sw = Swarm(working_dir, log)
+        sw = open_hive(working_dir)
     elif len(post_options) == 1:
         # 1) swarm thread #####
         # OR
         # 2) swarm thread directory
         ticket_number = post_options[0]
-        sw = Swarm(working_dir, log)
-        if not sw.loaded:
+        if not is_hive(working_dir):
             # Try #2
-            sw.close()
             ticket_number = None
             working_dir = post_options[0]
-            sw = Swarm(working_dir, log)
+        sw = open_hive(working_dir)
     else:
         # Default is to use the last issue
-        sw = Swarm(working_dir, log)
+        sw = open_hive(working_dir)
 
     util = cli_util.util(sw, log)
 
@@ -332,7 +532,7 @@ def cli_thread_run(pre_options, pre_args, command, post_options):
         else:
             logger.error("No swarm hive found.")
 
-        sw.close()
+        close_hive(sw)
     logger.unregister()
 
 def cli_new(pre_options, pre_args, command, post_options):
@@ -352,8 +552,9 @@ def cli_new(pre_options, pre_args, command, post_options):
     log.set_universal_loglevel(verbose)
     logger.register("cli_new")
 
-    sw = Swarm(working_dir, log)
+    sw = open_hive(working_dir)
     util = cli_util.util(sw, log)
+    taxonomy = get_cache(sw, log)
 
     schema_issue = sw.get_schema('issue')
     schema_node = sw.get_schema('node')
@@ -377,7 +578,7 @@ def cli_new(pre_options, pre_args, command, post_options):
     for element in meta_data:
         if schema_issue.has_key(element):
             if element in taxonomy_terms:
-                tax = sw.get_taxonomy(element)
+                tax = taxonomy.get(element)
                 if tax:
                     temp = os.write(fp, "\n# %s, possible values\n# " % element)
                     for item in tax:
@@ -402,6 +603,9 @@ def cli_new(pre_options, pre_args, command, post_options):
         parsed_data['issue']['reporter'] = reporter
         parsed_data['node']['time'] = timestamp
         parsed_data['node']['poster'] = reporter
+        # The attachment goes into the object store, the node row only
+        # keeps a reference to it
+        parsed_data['node'] = get_store(sw, log).store_attachment(parsed_data['node'])
         new_id = sw.new_issue(parsed_data)
         logger.entry("Ticket #%s has been created." % str(new_id), 0)
         if not sw.config.has_section('cli'):
@@ -413,7 +617,7 @@ def cli_new(pre_options, pre_args, command, post_options):
 
     os.remove(name)
 
-    sw.close()
+    close_hive(sw)
     logger.unregister()
 
 def cli_clone(pre_options, pre_args, command, post_options):
@@ -445,12 +649,26 @@ def cli_clone(pre_options, pre_args, command, post_options):
         # Wrong number of arguments
         logger.error("clone requires at least one argument. See 'help clone' for more information")
 
+    sw_from = None
     if from_url and to_url:
-        # First, we bootstrap the clone destination
-        cli_init(pre_options, pre_args, "cli_init", [to_url])
-        sw_to = Swarm(to_url, log)
-        # Next, we need a swarm instance for the source
-        sw_from = Swarm(from_url, log)
+        # We need a swarm instance for the source
+        sw_from = open_source(from_url)
+    if sw_from:
+        sw_to = None
+        if Config(to_url, log).config_set:
+            # The destination may be left over from an interrupted clone of
+            # this same source, in which case the clone resumes from its
+            # checkpoint. Otherwise, cli_init decides what to do with it.
+            sw_to = Swarm(to_url, log)
+            if clone(sw_from, sw_to, log).checkpoint() is None:
+                sw_to.close()
+                sw_to = None
+            else:
+                logger.entry("Resuming interrupted clone into '%s'" % to_url, 0)
+        if not sw_to:
+            # Bootstrap the clone destination
+            cli_init(pre_options, pre_args, "cli_init", [to_url])
+            sw_to = Swarm(to_url, log)
         # Finally, activate the clone
         sw_to.clone(sw_from)
 
@@ -491,9 +709,11 @@ def cli_branch(pre_options, pre_args, command, post_options):
         # Wrong number of arguments
         logger.error("branch requires at least two arguments. See 'help branch' for more information")
 
+    sw_from = None
     if from_url and to_url:
+        sw_from = open_source(from_url)
+    if sw_from:
         sw_to = Swarm(to_url, log)
-        sw_from = Swarm(from_url, log)
 
         sw_to.branch(ticket_number, sw_from)
 
@@ -502,18 +722,104 @@ def cli_branch(pre_options, pre_args, command, post_options):
 
     logger.unregister()
 
+def cli_pull(pre_options, pre_args, command, post_options):
+    """
+    Pull new transactions from an upstream hive
+    """
+    ticket_number = None
+    verbose = 0
+    to_url = os.getcwd()
+    from_url = None
+
+    for o, a in pre_options:
+        if o in ("-v", "--verbose"):
+            verbose = verbose + 1
+        if o in ('-t', '--ticket'):
+            ticket_number = a
+
+    log.set_universal_loglevel(verbose)
+    logger.register('cli_pull')
+
+    if len(post_options) == 2:
+        # pull FROM TO
+        from_url = post_options[0]
+        to_url = post_options[1]
+    elif len(post_options) == 1:
+        # pull FROM -- TO is cwd
+        from_url = post_options[0]
+    else:
+        # Wrong number of arguments
+        logger.error("pull requires at least one argument. See 'help pull' for more information")
+
+    sw_from = None
+    if from_url and to_url:
+        sw_from = open_source(from_url)
+    if sw_from:
+        sw_to = Swarm(to_url, log)
+
+        pull(sw_from, sw_to, log, ticket_number).run()
+
+        sw_from.close()
+        sw_to.close()
+
+    logger.unregister()
+
 #########################
 # Internal Interfaces
 #########################
 
+def is_hive(working_dir):
+    """
+    Whether working_dir looks like a hive, without opening it
+    """
+    return os.path.isfile("%s/.swarm/swarmrc" % working_dir)
+
+def open_hive(working_dir):
+    """
+    Returns the Swarm instance for the hive in working_dir, from the pool
+    when running in swarmd
+    """
+    if hive_pool:
+        return hive_pool.acquire(os.path.abspath(working_dir))
+    return Swarm(working_dir, log)
+
+def open_source(url):
+    """
+    Returns the Swarm instance for the source hive of a clone, branch or
+    pull, which may be on another host (a swarm:// URL). Returns None,
+    having said why, if it can't be reached.
+    """
+    if url.lower().startswith('swarm://'):
+        try:
+            return remote_hive(url, log)
+        except HiveServerError, e:
+            logger.error("Problem accessing Swarm hive '%s': %s" % (url, e))
+            return None
+    return Swarm(url, log)
+
+def close_hive(sw):
+    """
+    Done with a Swarm instance from open_hive()
+    """
+    if hive_pool:
+        hive_pool.release(sw, sw.loaded)
+    else:
+        sw.close()
+
 class Command:
-    def __init__(self, short_opts, long_opts, usage, summary, desc, callback):
+    def __init__(self, short_opts, long_opts, usage, summary, desc, callback,
+                 proxy=False):
+        """
+        proxy == Whether the command may run in swarmd rather than here.
+                 Only for commands which never need the terminal.
+        """
         self.short_opts = short_opts
         self.long_opts = long_opts
         self.usage = usage
         self.summary = summary
         self.desc = desc
         self.callback = callback
+        self.proxy = proxy
 
 # Defines
 option_dispatch = {
@@ -537,6 +843,78 @@ option_dispatch = {
          '  -v|--verbose    Be verbose about actions',
          "  -f|--force      Force even if directory isn't empty"],
         cli_init),
+    'migrate' : Command(
+        ['v'],
+        ['verbose'],
+        'swarm [OPTIONS] migrate [DIR]',
+        'Migrate a hive to the current database format',
+        ['  Brings the database of the hive in [DIR] (or the current',
+         '  directory if nothing is specified) up to date. Run this',
+         '  after upgrading swarm.',
+         '',
+         '  OPTIONS:',
+         '  -v|--verbose    Be verbose about actions'],
+        cli_migrate),
+    'debug' : Command(
+        ['v'],
+        ['verbose'],
+        'swarm [OPTIONS] debug explain [QUERY] [ISSUE] [DIR]',
+        'Show how a hive answers a query',
+        ['  Runs the database query behind [QUERY] against the hive in',
+         '  [DIR] (or the current directory if nothing is specified)',
+         '  and shows the plan it used: the index picked (if any), the',
+         '  estimated and actual number of rows, and the time taken.',
+         '  Only hives with a dochemistry database have query plans.',
+         '',
+         '  [QUERY] is one of:',
+         '   get_issue              Look up [ISSUE]',
+         '   get_lineage            The node lineage of [ISSUE]',
+         '   get_transaction_log    The log of [ISSUE], or the whole',
+         '                            log if [ISSUE] is empty (or 0)',
+         '',
+         '  OPTIONS:',
+         '  -v|--verbose    Be verbose about actions'],
+        cli_debug,
+        proxy=True),
+    'snapshot' : Command(
+        ['v', 'c'],
+        ['verbose', 'compact'],
+        'swarm [OPTIONS] snapshot [DIR]',
+        'Write a snapshot of a hive',
+        ['  Writes a snapshot of the current state of the hive in',
+         '  [DIR] (or the current directory if nothing is specified).',
+         '  Clones of the hive load the newest snapshot and only',
+         '  replay the transactions made after it.',
+         '',
+         '  OPTIONS:',
+         '  -v|--verbose    Be verbose about actions',
+         '  -c|--compact    Also drop transactions the snapshot makes',
+         '                    redundant (all but the last set_taxonomy',
+         '                    per term and update_issue per issue)'],
+        cli_snapshot,
+        proxy=True),
+    'serve' : Command(
+        ['v', 'p:', 'b:'],
+        ['verbose', 'port=', 'bind='],
+        'swarm [OPTIONS] serve [DIR]',
+        'Serve a hive to other processes',
+        ['  Serves the hive in [DIR] (or the current directory if',
+         '  nothing is specified) until interrupted. Clients reach it',
+         '  as swarm+unix://[DIR], through the socket .swarm/hive.sock,',
+         '  and share the one open copy of the hive. Writes from every',
+         '  client are made one at a time by the server.',
+         '',
+         '  With --port, other hosts can clone, branch and pull the',
+         '  hive as swarm://HOST:PORT/[DIR] (PORT defaults to 7317).',
+         "  TCP clients aren't authenticated, so they may only read:",
+         '  new issues and comments sent over TCP are refused.',
+         '',
+         '  OPTIONS:',
+         '  -v|--verbose      Be verbose about actions',
+         '  -p|--port=PORT    Listen on TCP port PORT instead',
+         '  -b|--bind=HOST    The address to listen on with --port',
+         '                      (default localhost)'],
+        cli_serve),
     'taxonomy' : Command(
         ['v'],
         ['verbose'],
@@ -565,8 +943,8 @@ option_dispatch = {
          '   -v|--verbose   Be verbose about actions',],
         cli_taxonomy),
     'log' : Command(
-        ['v'],
-        ['verbose'],
+        ['v', 'n:', 't:', 'r'],
+        ['verbose', 'limit=', 'since=', 'until=', 'type=', 'reverse'],
         'swarm [OPTIONS] log [ISSUE] [DIR]',
         'Displays the log (master log or for a given issue)',
         ['  Will display the log. If [ISSUE] is empty (or 0), will',
@@ -575,8 +953,18 @@ option_dispatch = {
          '  pertaining to it.'
          '',
          '  OPTIONS:',
-         '  -v|--verbose    Be verbose about actions'],
-        cli_log),
+         '  -v|--verbose      Be verbose about actions',
+         '  -n|--limit=N      Display at most N entries',
+         '  --since=TIME      Only display entries made at or after TIME',
+         '  --until=TIME      Only display entries made at or before TIME',
+         '  -t|--type=XACTION Only display XACTION transactions',
+         '  -r|--reverse      Display the newest entries first',
+         '',
+         '  TIME is either a timestamp or a local date, as',
+         '  YYYY-MM-DD, YYYY-MM-DD HH:MM or YYYY-MM-DD HH:MM:SS.',
+         '  --until=YYYY-MM-DD includes the whole of that day.'],
+        cli_log,
+        proxy=True),
     'last' : Command(
         ['v'],
         ['verbose'],
@@ -587,7 +975,8 @@ option_dispatch = {
          '',
          '  OPTIONS:',
          '  -v|--verbose    Be verbose about actions'],
-        cli_last),
+        cli_last,
+        proxy=True),
     'thread' : Command(
         ['v'],
         ['verbose'],
@@ -635,7 +1024,12 @@ option_dispatch = {
         'Clones a hive',
         ['   Clones an existing Swarm DITS hive from the [FROM]',
          '   URI to the [TO] URI. If [TO] is not specified, will',
-         '   default to the current working directory.',
+         '   default to the current working directory. [FROM] may be',
+         '   a swarm://HOST:PORT/DIR URI for a hive served with',
+         "   'swarm serve --port' on another host.",
+         '',
+         '   If an earlier clone of [FROM] into [TO] was interrupted,',
+         '   the clone resumes from where it left off.',
          '',
          '   OPTIONS:',
          '   -v|--verbose    Be verbose about actions',
@@ -650,10 +1044,29 @@ option_dispatch = {
          '   URI to the [TO] URI. If the [TO] URI is not specified it will',
          '   default to the current working directory.',
          '',
+         '   If an earlier branch of [TICKET] was interrupted, the',
+         '   branch resumes from where it left off.',
+         '',
          '   OPTIONS:',
          '   -v|--verbose    Be verbose about actions',
          "   -f|--force      Force even if [TO] directory isn't empty"],
         cli_branch),
+    'pull' : Command(
+        ['v', 't:'],
+        ['verbose', 'ticket='],
+        'swarm [OPTIONS] pull [FROM] [TO]',
+        'Pull new transactions from an upstream hive.',
+        ['   Replays the transactions made in the hive at [FROM]',
+         '   since the last clone, branch or pull into the hive at',
+         '   [TO]. [FROM] must already be an upstream of [TO]. If [TO]',
+         '   is not specified it will default to the current working',
+         '   directory.',
+         '',
+         '   OPTIONS:',
+         '   -v|--verbose          Be verbose about actions',
+         '   -t|--ticket=TICKET    Pull only TICKET, for hives made',
+         '                           with "branch"'],
+        cli_pull),
 
 }
 
@@ -693,4 +1106,8 @@ def run(argv):
     The main CLI run trigger
     """
     (pre_options, pre_args, command, post_options)= cli_parse(argv)
+    if option_dispatch[command].proxy and not hive_pool:
+        status = swarmd.proxy(argv)
+        if status is not None:
+            sys.exit(status)
     option_dispatch[command].callback(pre_options, pre_args, command, post_options)
@@ -25,6 +25,10 @@ import os
 import swarmlib.swarm_time as swarm_time
 
 from swarmlib.db import taxonomy_terms
+from swarmlib.taxonomy import get_cache
+from swarmlib.lineage import node_dag, node_cache, __CACHE_SIZE__
+from swarmlib.util import get_node_id
+from swarmlib.objects import get_store
 
 class thread:
     def __init__(self, sw, log, util, ticket_number):
@@ -35,6 +39,9 @@ class thread:
         self.logger = self.log.get_logger("cli_thread")
         [self.issue] = self.sw.get_issue(self.ticket_number)
         self.node = None
+        self.dag = None
+        self.cache = self.new_cache()
+        self.taxonomy = get_cache(sw, log)
         self.schema_issue = self.sw.get_schema('issue')
         self.schema_node = self.sw.get_schema('node')
 
@@ -49,35 +56,58 @@ class thread:
         os.close(fp)
         os.remove(name)
 
+    def new_cache(self):
+        """
+        Set up the node cache. The 'cli' section of the config may set
+        'node_cache' (how many nodes to keep) and 'prefetch' (whether to
+        fetch neighbouring nodes in the background, off unless the hive's
+        backend can be used from another thread).
+        """
+        size = __CACHE_SIZE__
+        background = False
+        if self.sw.config.has_option('cli', 'node_cache'):
+            size = int(self.sw.config.get('cli', 'node_cache'))
+        if self.sw.config.has_option('cli', 'prefetch'):
+            background = self.sw.config.get('cli', 'prefetch').lower() in ('1', 'yes', 'true', 'on')
+        return node_cache(self.sw, self.log, size, background)
+
+    def load_thread(self):
+        """
+        (Re)load the node DAG of the issue
+        """
+        (nodes, edges) = self.sw.get_thread(self.issue['hash_id'])
+        self.dag = node_dag(nodes, edges)
+
     def run(self):
         self.logger.register('run')
         #[issue] = self.sw.get_issue(self.ticket_number)
         #schema_issue = self.sw.get_schema('issue')
         #schema_node = self.sw.get_schema('node')
         if len(self.issue):
+            # Load the whole thread up front, everything below navigates
+            # it in memory
+            self.load_thread()
             cur_node_id = self.issue['root_node']
             more_nodes = True
             while more_nodes:
-                self.node = self.sw.get_node(cur_node_id)
+                if self.dag.get_node(cur_node_id):
+                    self.node = [self.cache.get(cur_node_id)]
+                else:
+                    self.node = []
                 if len(self.node):
+                    # While the node is being read, fetch its neighbours,
+                    # which are the only places to go from here
+                    neighbours = [get_node_id(n) for n in self.dag.get_parents(cur_node_id) + self.dag.get_children(cur_node_id)]
+                    self.cache.prefetch(neighbours)
                     self.page_node()
-                    children = self.sw.get_lineage(parent_id=cur_node_id)
-                    parents = self.sw.get_lineage(child_id=cur_node_id)
-                    #if parents : print "Parents\n" + str(parents) + "\n"
-                    #print
-                    #if children: print "Children\n" + str(children) + "\n"
                     parent_entry = {}
                     child_entry = {}
                     parent_keys = None
                     child_keys = None
-                    if parents:
-                        for p in parents:
-                            [temp_node] = self.sw.get_node(p['parent_id'])
-                            parent_entry[temp_node['time']] = [temp_node['poster'], temp_node['summary'], temp_node['node_id']]
-                    if children:
-                        for c in children:
-                            [temp_node] = self.sw.get_node(c['child_id'])
-                            child_entry[temp_node['time']] = [temp_node['poster'], temp_node['summary'], temp_node['node_id']]
+                    for temp_node in self.dag.get_parents(cur_node_id):
+                        parent_entry[temp_node['time']] = [temp_node['poster'], temp_node['summary'], get_node_id(temp_node)]
+                    for temp_node in self.dag.get_children(cur_node_id):
+                        child_entry[temp_node['time']] = [temp_node['poster'], temp_node['summary'], get_node_id(temp_node)]
 
                     output_text = ""
 
@@ -158,7 +188,7 @@ class thread:
     def new_comment(self):
         node = self.node[0]
         self.logger.register('new_comment')
-        self.logger.entry("Comment on node '%s'" % node['node_id'], 2)
+        self.logger.entry("Comment on node '%s'" % get_node_id(node), 2)
 
         (fp, name) = tempfile.mkstemp()
         timestamp = swarm_time.timestamp()
@@ -180,7 +210,7 @@ class thread:
         for element in meta_data:
             if self.schema_issue.has_key(element):
                 if element in taxonomy_terms:
-                    tax = self.sw.get_taxonomy(element)
+                    tax = self.taxonomy.get(element)
                     if tax:
                         temp = os.write(fp, "\n# %s, possible values\n# " % element)
                         for item in tax:
@@ -226,7 +256,12 @@ class thread:
             if parsed_data['issue'] != self.issue:
                 self.sw.update_issue(parsed_data['issue'])
 
+            # The attachment goes into the object store, the node row only
+            # keeps a reference to it
+            parsed_data['node'] = get_store(self.sw, self.log).store_attachment(parsed_data['node'])
             self.sw.add_node(parsed_data, self.node[0])
+            # Pick up the new node and its lineage
+            self.load_thread()
     #        new_id = sw.new_issue(parsed_data)
     #        logger.entry("Ticket #%s has been created." % str(new_id), 0)
     #        if not sw.config.has_section('cli'):
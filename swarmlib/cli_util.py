@@ -25,12 +25,15 @@ import swarmlib.swarm_time as swarm_time
 import md5
 
 from swarmlib.db import taxonomy_terms
+from swarmlib.taxonomy import get_cache
+from swarmlib.objects import get_store, reference_id
 
 class util:
     def __init__(self, sw, log):
         self.sw = sw
         self.log = log
         self.logger = self.log.get_logger("cli_util.util")
+        self.taxonomy = get_cache(sw, log)
 
     def space_filler(self, text, size):
         """
@@ -139,7 +142,7 @@ class util:
                 if i == 'time':
                     data = data + "Time: %s\n" % swarm_time.human_readable_from_stamp(issue['time'])
                 elif i in taxonomy_terms:
-                    tax = self.sw.get_taxonomy(i)
+                    tax = self.taxonomy.get(i)
                     if tax:
                         data = data + "\n# %s, possible values\n# " % i
                         for item in tax:
@@ -154,17 +157,39 @@ class util:
 
         data = data + "\n---------------------------\n\n"
 
-        # Now do the node data
+        # Now do the node data. An attachment kept in the object store is
+        # copied out in place of its reference a chunk at a time, rather
+        # than read whole.
+        object_id = reference_id(node.get('attachment'))
         for i in node_order['short']:
             if i == 'time':
                 data = data + "Post time: %s\n" % swarm_time.human_readable_from_stamp(node['time'])
+            elif i == 'attachment' and object_id:
+                data = self._write_object(fp, data + "%s : " % i, object_id) + "\n"
             else:
                 data = data + "%s : %s\n" % (i, node[i])
 
         for i in node_order['long']:
-            data = data + "\n%s:\n%s\n" % (i, node[i])
+            if i == 'attachment' and object_id:
+                data = self._write_object(fp, data + "\n%s:\n" % i, object_id) + "\n"
+            else:
+                data = data + "\n%s:\n%s\n" % (i, node[i])
+
+        self._write(fp, data)
+
+    def _write(self, fp, data):
+        while data:
+            data = data[os.write(fp, data):]
 
-        temp = os.write(fp, data)
+    def _write_object(self, fp, data, object_id):
+        """
+        Write data, and then the object object_id, to the file descriptor
+        fp. Returns '', for the caller to go on adding to.
+        """
+        self._write(fp, data)
+        for chunk in get_store(self.sw, self.log).iter_chunks(object_id):
+            self._write(fp, chunk)
+        return ''
 
     def launch_editor(self, name):
         """
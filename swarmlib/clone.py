@@ -18,7 +18,9 @@
 #
 # Author: Sam Hart
 
+import swarmlib.swarm_time as swarm_time
 from swarmlib.replicate import replicate
+from swarmlib.snapshot import snapshot, backend_tables
 from swarmlib.db import __MASTER_ISSUE__
 
 class clone:
@@ -34,6 +36,66 @@ class clone:
         self._logger = log.get_logger("clone")
         self._rep = replicate(self._source_sw, self._dest_sw, self._log)
 
+    def checkpoint(self):
+        """
+        Returns the last source xid an earlier clone from the source_sw
+        committed to the dest_sw, or None if there is no such clone
+        """
+        return self._rep.get_checkpoint(self._rep.get_tracker_id(__MASTER_ISSUE__))
+
+    def _copy_log(self, xid):
+        """
+        Copy the source_sw's transaction log up to xid into the dest_sw as
+        it is, so that the dest_sw has the whole history behind a snapshot
+        and can itself be cloned or pulled from. Each chunk is committed
+        on its own, and a copy which was cut short picks up after the
+        last entry it committed.
+        """
+        backend = self._dest_sw.db.backend
+        since_xid = backend_tables(backend).get_last_xid()
+        for chunk in self._source_sw.iter_transaction_log(since_xid=since_xid,
+                                                          chunk_size=self._rep.chunk_size):
+            entries = [(root, xaction, xdata, entry_xid, time)
+                       for (entry_xid, root, time, xaction, xdata) in chunk
+                       if entry_xid <= xid]
+            if hasattr(backend, 'log_transactions'):
+                backend.log_transactions(entries)
+            else:
+                for (root, xaction, xdata, entry_xid, time) in entries:
+                    backend.log_transaction(root, xaction, xdata, entry_xid, time, True)
+            backend.commit()
+            if len(entries) < len(chunk):
+                break
+
+    def _bootstrap(self, tracker_id):
+        """
+        Load the newest snapshot of the source_sw (if it has any) into the
+        dest_sw along with the source's log up to it, and checkpoint it.
+        The snapshot itself is copied too. Returns the xid of the
+        snapshot, or None if there was nothing to load.
+        """
+        self._logger.register("_bootstrap")
+
+        if getattr(self._source_sw, 'remote', False):
+            # Snapshots are files in the source hive, which a remote hive
+            # doesn't share. Its whole log is streamed instead.
+            self._logger.unregister()
+            return None
+
+        snap = snapshot(self._source_sw, self._log)
+        xid = snap.latest()
+        if xid is not None:
+            self._logger.entry("Bootstrapping from the snapshot at transaction '%i'" % xid, 0)
+            snap.restore(xid, self._dest_sw)
+            self._dest_sw.db.backend.commit()
+            self._copy_log(xid)
+            self._dest_sw.db.backend.set_checkpoint(tracker_id, xid, swarm_time.timestamp())
+            self._dest_sw.db.backend.commit()
+            snap.copy_to(xid, self._dest_sw)
+
+        self._logger.unregister()
+        return xid
+
     def run(self):
         """
         Run the clone transaction
@@ -49,26 +111,30 @@ class clone:
         self._dest_sw.config.set('main', 'project_name', self._source_sw.config.get('main', 'project_name', 'swarm'))
         self._dest_sw.config.save()
 
-        # Next, get the transaction log from the source_sw
-        # FIXME: This isn't very scalable, we probably should
-        # do this in clumps of xaction log entries
-        xlog = self._source_sw.get_transaction_log()
-        self._logger.entry("Processing '%i' transactions" % len(xlog), 0)
+        # If an earlier clone from this source was interrupted, the dest_sw
+        # holds a checkpoint of the last xid it committed, and we pick up
+        # right after it
+        tracker_id = self._rep.get_tracker_id(__MASTER_ISSUE__)
+        since_xid = self._rep.get_checkpoint(tracker_id)
+        if since_xid:
+            self._logger.entry("Resuming clone after transaction '%i'" % since_xid, 0)
+        else:
+            since_xid = self._bootstrap(tracker_id)
 
-        # Now, run through each xaction, and replay it
-        # into the dest_sw
-        errors = 0
-        for (xid, root, time, xaction, xdata) in xlog:
-            errors = errors + self._rep.run(xid, root, time, xaction, xdata)
+        # Next, walk the transaction log from the source_sw a chunk at a
+        # time, replaying each chunk into the dest_sw and committing it
+        # (along with the checkpoint) before the next one is fetched
+        (errors, total) = self._rep.replay(tracker_id, since_xid=since_xid)
 
         if errors > 0:
             self._logger.error("There were '%i' errors in the clone transaction" % errors)
-            # FIXME
-            # We should bail here, probably, since the cloned hive will be in an
-            # unknown state
+            self._logger.error("Re-run the clone to resume from the last checkpoint")
         else:
-            # add this clone to tbe upstream tracker
-            self._rep.add_tracker(__MASTER_ISSUE__)
+            # add this clone to the upstream tracker, unless a previous
+            # (resumed) run already did
+            if not self._rep.has_tracker(tracker_id):
+                self._rep.add_tracker(__MASTER_ISSUE__)
+                self._dest_sw.db.backend.commit()
             self._logger.entry("No errors in the clone transaction", 0)
 
         self._logger.unregister()
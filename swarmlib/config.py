@@ -75,8 +75,8 @@ class Config(object):
         filenames_read = self._config['system'].read(system_configs)
 
         if len(filenames_read):
-            self._logger.enty("Read the following system-wide config files", 3)
-            for filename in filenames:
+            self._logger.entry("Read the following system-wide config files", 3)
+            for filename in filenames_read:
                 self._logger.entry(filename, 3)
 
         # Read the user config file
@@ -249,6 +249,22 @@ class Config(object):
         else:
             return self._config[self._config['regions'][-1]].has_section(section)
 
+    def has_option(self, section, setting, config_region=None):
+        """
+        Returns true if a setting exists in a section
+
+        If config_region is not specified, will check every
+        config file.
+        """
+        local_regions = self._config['regions']
+        if config_region and config_region in local_regions:
+            local_regions = [config_region]
+
+        for region in local_regions:
+            if self._config[region].has_option(section, setting):
+                return True
+        return False
+
     def save(self):
         """
         Save the project's swarmrc file.
@@ -22,12 +22,16 @@ Swarm Hive Connection utilities
 Contains various utilities dealing with hive connections
 """
 
-from i18n import _
+from swarmlib.i18n import _
 from swarmlib.exceptions import SchemeNotFoundError
 from swarmlib.connect.schemes.local import Local
+from swarmlib.connect.schemes.unix import UnixScheme
+from swarmlib.connect.schemes.network import NetworkScheme
 
 __scheme_lookup = {
-    '' : Local
+    '' : Local,
+    'swarm+unix' : UnixScheme,
+    'swarm' : NetworkScheme,
 }
 
 def get_connection(parsed_url, log, force=False):
@@ -39,7 +43,7 @@ def get_connection(parsed_url, log, force=False):
     scheme_classifer = parsed_url.scheme.lower()
 
     if scheme_classifer in __scheme_lookup.keys():
-        return __scheme_lookup[scheme_classifer](parsed_url, config, log,
+        return __scheme_lookup[scheme_classifer](parsed_url, None, log,
                                                     force)
     else:
         raise SchemeNotFoundError(_("'%s' scheme not defined.") %
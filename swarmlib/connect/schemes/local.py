@@ -20,7 +20,7 @@
 Local connections
 """
 
-from swarmlib.connect.base_schema import BaseScheme
+from swarmlib.connect.schemes.base_scheme import BaseScheme
 
 class Local(BaseScheme):
     scheme_name = 'Local'
@@ -0,0 +1,60 @@
+# Copyright 2007 Sam Hart
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+# Author: Sam Hart
+
+"""
+Hive server connections over the network
+
+'swarm://host:port/path/to/hive' reaches the hive server (see
+swarmlib.hive_server) started with 'swarm serve --port=port' in
+/path/to/hive on host. The port defaults to __DEFAULT_PORT__. Nothing of
+the hive is read directly, so the hive can be on another machine.
+"""
+
+from swarmlib.connect.schemes.base_scheme import BaseScheme
+from swarmlib.hive_server import connect_tcp, remote_config
+
+__DEFAULT_PORT__ = 7317
+
+class NetworkScheme(BaseScheme):
+    scheme_name = 'swarm'
+
+    def address(self):
+        return (self._parsed_url.hostname or 'localhost',
+                self._parsed_url.port or __DEFAULT_PORT__)
+
+    def get_client(self):
+        """
+        Returns a hive_client connected to the hive server. Raises
+        HiveServerError if it can't be reached.
+        """
+        self._logger.register("get_client")
+        self._logger.entry("Connecting to '%s:%i'" % self.address(), 2)
+        client = connect_tcp(*self.address())
+        self._logger.unregister()
+        return client
+
+    def get_config(self):
+        """
+        The config of a remote hive is only what its server tells us
+        """
+        client = self.get_client()
+        try:
+            self._config = remote_config(client.call('hive_info'))
+        finally:
+            client.close()
+        return self._config
@@ -0,0 +1,46 @@
+# Copyright 2007 Sam Hart
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+# Author: Sam Hart
+
+"""
+Hive server connections over a Unix socket
+
+'swarm+unix:///path/to/hive' reaches the hive server (see
+swarmlib.hive_server) serving the hive in /path/to/hive, through the
+socket in its .swarm directory. The hive's own config is still read from
+the directory itself.
+"""
+
+from swarmlib.connect.schemes.base_scheme import BaseScheme
+from swarmlib.hive_server import socket_path, connect_unix
+
+class UnixScheme(BaseScheme):
+    scheme_name = 'swarm+unix'
+
+    def socket_path(self):
+        return socket_path(self._parsed_url.path)
+
+    def get_client(self):
+        """
+        Returns a hive_client connected to the hive server. Raises
+        HiveServerError if it isn't running.
+        """
+        self._logger.register("get_client")
+        self._logger.entry("Connecting to '%s'" % self.socket_path(), 2)
+        client = connect_unix(self.socket_path())
+        self._logger.unregister()
+        return client
@@ -216,6 +216,17 @@ class Node(object):
     def __repr__(self):
         return "<Node('%s', '%s')>" % (self.hash_id, self.summary)
 
+class LineageEntry(object):
+    def __init__(self, root, parent_id, child_id, time=None):
+        self.root = root
+        self.parent_id = parent_id
+        self.child_id = child_id
+        self.time = time
+
+    def __repr__(self):
+        return "<LineageEntry(parent:'%s', child:'%s')>" % (self.parent_id,
+                self.child_id)
+
 class TransactionEntry(object):
     def __init__(self, root, time, transaction, transaction_data):
         self.root = root
@@ -254,3 +265,12 @@ class Upstream(object):
 
     def __repr__(self):
         return "<Upstream('%s')>" % self.uri
+
+class Checkpoint(object):
+    def __init__(self, tracker_id, xid, time=None):
+        self.tracker_id = tracker_id
+        self.xid = xid
+        self.time = time
+
+    def __repr__(self):
+        return "<Checkpoint('%s', xid:'%s')>" % (self.tracker_id, self.xid)
@@ -0,0 +1,559 @@
+# Copyright 2007 Sam Hart
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+# Author: Sam Hart
+
+"""
+Swarm Document Store backend
+
+Keeps a hive in a dochemistry engine instead of an SQL database. Swarm
+itself still opens hives with the SQL backend; a docstore is made
+directly, from an engine URL (see dochemistry.create_engine), or by
+from_config() from the 'db' section of a hive's swarmrc, e.g.:
+    [db]
+    url = disk://swarm.dcs
+A relative path in the url is taken from the hive's .swarm directory, so
+a hive can be moved or copied along with its store.
+
+Each table of swarmlib.db.schema becomes a collection of the same name,
+with a document per row and the same column names as fields. The methods
+here take the same arguments, and return the same things, as their
+counterparts in the SQL backend and swarmlib.db.queries (less the
+connection). Like the SQL backend, each change to an issue, node, lineage
+or upstream tracker also adds its entry to the transaction log, in the
+same commit.
+
+Where many documents arrive at once (replication, imports) the plural
+methods, new_issues(), new_nodes(), add_lineages(),
+link_issues_to_nodes() and log_transactions(), write them with a single
+dochemistry bulk_write(). Each takes a list of the argument tuples of its
+singular counterpart.
+
+The transaction log can be kept in a swarmlib.db.segment_log instead of
+the 'transaction_log' collection (from_config() does so for 'xlog =
+segment' in the 'db' section).
+Every change then locks the segment log before touching the engine, so
+that writers always lock the two in the same order, and commit() writes
+the log first and commits the engine before letting go of it. If the
+engine commit fails, the log entries are cut off again.
+"""
+
+import os
+
+from swarmlib.exceptions import BackendNotAvailableError
+from swarmlib.xaction import xaction_dispatch
+
+try:
+    import dochemistry
+    from dochemistry import Index
+except ImportError:
+    dochemistry = None
+
+__DEFAULT_URL__ = 'memory://'
+
+# These match swarmlib.db.queries, which isn't imported so that this
+# backend works without sqlalchemy
+__CHUNK_SIZE__ = 1000
+__NODE_BODY_COLUMNS__ = ('details', 'attachment')
+
+# name -> (primary key, auto increment, indexes as (name, fields)). The
+# indexes follow swarmlib.db.schema, plus the issue fields searches go by.
+__COLLECTIONS__ = {
+    'issues' : ('hash_id', False, [
+        ('ix_issues_status', ('status',)),
+        ('ix_issues_owner', ('owner',)),
+        ('ix_issues_reporter', ('reporter',)),
+    ]),
+    'nodes' : ('hash_id', False, [
+        ('ix_nodes_issue_id', ('issue_id',)),
+        ('ix_nodes_parent_node_id', ('parent_node_id',)),
+    ]),
+    'lineage' : ('id', True, [
+        ('ix_lineage_root', ('root',)),
+        ('ix_lineage_parent_id', ('parent_id',)),
+        ('ix_lineage_child_id', ('child_id',)),
+    ]),
+    'transaction_log' : ('id', True, [
+        ('ix_transaction_log_root_id', ('root', 'id')),
+        ('ix_transaction_log_time', ('time',)),
+        ('ix_transaction_log_transaction_id', ('transaction', 'id')),
+    ]),
+    'upstream' : ('tracker_id', False, []),
+    'checkpoint' : ('tracker_id', False, []),
+}
+
+# The taxonomy tables, all alike
+for name in ('components', 'versions', 'milestones', 'severities',
+             'priorities', 'status', 'resolutions'):
+    __COLLECTIONS__[name] = ('id', True, [])
+
+class docstore:
+    def __init__(self, url, log, xactions=None, xlog=None):
+        """
+        url == The dochemistry engine URL
+        log == The log instance
+        xactions == The xaction_dispatch encoding transaction data, by
+                    default a new one
+        xlog == A swarmlib.db.segment_log to keep the transaction log in,
+                or None for the 'transaction_log' collection
+        """
+        self._logger = log.get_logger("docstore")
+        if dochemistry is None:
+            raise BackendNotAvailableError("dochemistry could not be imported")
+        self.url = url
+        self.engine = dochemistry.create_engine(url)
+        self.xactions = xactions or xaction_dispatch()
+        self.xlog = xlog
+
+    def init(self):
+        """
+        Create any of the collections (and their indexes) which don't
+        exist yet
+        """
+        self._logger.register("init")
+        for (name, (primary_key, auto_increment, indexes)) in __COLLECTIONS__.items():
+            if name == 'transaction_log' and self.xlog is not None:
+                continue
+            indexes = [Index(index_name, *fields) for (index_name, fields) in indexes]
+            if self.engine.has_collection(name):
+                # Hives made before an index was declared get it here
+                collection = self.engine.collection(name)
+                for index in indexes:
+                    collection.create_index(index)
+            else:
+                self._logger.entry("Creating collection '%s'" % name, 2)
+                self.engine.create_collection(name, primary_key,
+                                              auto_increment, indexes)
+        self._logger.unregister()
+
+    def _collection(self, name):
+        return self.engine.collection(name)
+
+    def _begin(self):
+        """
+        Called before every change, see the segment log above
+        """
+        if self.xlog is not None:
+            self.xlog.begin()
+
+    def lock(self):
+        """
+        Take the write locks (the segment log's first, as every change
+        does) and catch up, so that what is read until the next commit()
+        or rollback() is one state of the hive. Nothing else can commit in
+        the meantime.
+        """
+        self._begin()
+        self.engine.lock()
+
+    def commit(self):
+        if self.xlog is None:
+            self.engine.commit()
+            return
+        self.xlog.prepare()
+        try:
+            self.engine.commit()
+        except:
+            self.xlog.unprepare()
+            raise
+        self.xlog.finish()
+
+    def rollback(self):
+        self.engine.rollback()
+        if self.xlog is not None:
+            self.xlog.rollback()
+
+    def close(self):
+        self.engine.close()
+        if self.xlog is not None:
+            self.xlog.close()
+
+    def _log(self, entries):
+        """
+        Add a list of transaction log documents (see _entry()) to the log,
+        returning their xids
+        """
+        if self.xlog is None:
+            return self.engine.bulk_write('transaction_log', entries)
+        return [self.xlog.append(entry['root'], entry['transaction'],
+                                 entry['transaction_data'], entry.get('id'),
+                                 entry['time'])
+                for entry in entries]
+
+    def _entry(self, root, xaction, data, time):
+        """
+        Returns the transaction log document for a change
+        """
+        return {'root' : root, 'time' : time, 'transaction' : xaction,
+                'transaction_data' : self.xactions.dispatch[xaction].encode(data)}
+
+    # Issues, nodes and lineage
+
+    def _issue_entry(self, issue, time):
+        return self._entry(issue['hash_id'], 'new_issue',
+                           {'short_hash_id' : issue.get('issue_id')}, time)
+
+    def new_issue(self, issue, time=None):
+        self._begin()
+        self._collection('issues').insert(issue)
+        self._log([self._issue_entry(issue, time)])
+
+    def new_issues(self, issues):
+        """
+        Add a list of (issue, time) at once
+        """
+        self._begin()
+        self.engine.bulk_write('issues', [issue for (issue, time) in issues])
+        self._log([self._issue_entry(issue, time) for (issue, time) in issues])
+
+    def update_issue(self, hash_id, changes):
+        self._begin()
+        self._collection('issues').update(hash_id, changes)
+
+    def _node_entry(self, node, root, time):
+        return self._entry(root or node.get('issue_id'), 'new_node',
+                           {'node_id' : node['hash_id']}, time)
+
+    def new_node(self, node, root=None, time=None):
+        """
+        Add node to the thread of the issue root
+        """
+        self._begin()
+        self._collection('nodes').insert(node)
+        self._log([self._node_entry(node, root, time)])
+
+    def new_nodes(self, nodes):
+        """
+        Add a list of (node, root, time) at once
+        """
+        self._begin()
+        self.engine.bulk_write('nodes', [node for (node, root, time) in nodes])
+        self._log([self._node_entry(node, root, time) for (node, root, time) in nodes])
+
+    def _lineage(self, data, root, time):
+        return {'root' : root, 'parent_id' : data['parent_id'],
+                'child_id' : data['child_id'], 'time' : time}
+
+    def add_lineage(self, data, root, time=None):
+        """
+        Add the edge data ({'parent_id' : ..., 'child_id' : ...}) to the
+        node DAG of the issue root
+        """
+        self._begin()
+        self._collection('lineage').insert(self._lineage(data, root, time))
+        self._log([self._entry(root, 'add_lineage', data, time)])
+
+    def add_lineages(self, lineages):
+        """
+        Add a list of (data, root, time) at once
+        """
+        self._begin()
+        self.engine.bulk_write('lineage',
+            [self._lineage(data, root, time) for (data, root, time) in lineages])
+        self._log([self._entry(root, 'add_lineage', data, time)
+                   for (data, root, time) in lineages])
+
+    def _link(self, linking):
+        nodes = self._collection('nodes')
+        if nodes.get(linking['node_id']) is not None:
+            nodes.update(linking['node_id'], {'issue_id' : linking['issue_id']})
+
+    def link_issue_to_node(self, linking, time=None):
+        """
+        Make the node linking['node_id'] part of the issue
+        linking['issue_id']
+        """
+        self._begin()
+        self._link(linking)
+        self._log([self._entry(linking['issue_id'], 'link_issue_to_node',
+                               linking, time)])
+
+    def link_issues_to_nodes(self, linkings):
+        """
+        Make a list of (linking, time) at once
+        """
+        self._begin()
+        for (linking, time) in linkings:
+            self._link(linking)
+        self._log([self._entry(linking['issue_id'], 'link_issue_to_node',
+                               linking, time) for (linking, time) in linkings])
+
+    def _get_by_ids(self, name, ids):
+        collection = self._collection(name)
+        docs = []
+        for key in set(ids):
+            doc = collection.get(key)
+            if doc is not None:
+                docs.append(doc)
+        return docs
+
+    def get_issues(self, hash_ids):
+        return self._get_by_ids('issues', hash_ids)
+
+    def get_nodes(self, hash_ids):
+        return self._get_by_ids('nodes', hash_ids)
+
+    def get_thread(self, issue_id):
+        nodes = list(self._collection('nodes').find({'issue_id' : issue_id}))
+        edges = [(edge['parent_id'], edge['child_id']) for edge in
+                 self._collection('lineage').find({'root' : issue_id})]
+        # A root node only gets its issue_id from the link_issue_to_node
+        # after it, so the issue's root_node and the nodes on its edges
+        # are fetched by id as well
+        found = set([node['hash_id'] for node in nodes])
+        wanted = set([issue.get('root_node') for issue in
+                      self.get_issues([issue_id])])
+        for edge in edges:
+            wanted.update(edge)
+        nodes.extend(self.get_nodes([node_id for node_id in wanted
+                                     if node_id and node_id not in found]))
+        for node in nodes:
+            for column in __NODE_BODY_COLUMNS__:
+                node.pop(column, None)
+        return (nodes, edges)
+
+    # Upstream trackers
+
+    def add_upstream_tracker(self, upstream, issue_id, time=None):
+        """
+        Record upstream (see swarmlib.tracker) as the source of issue_id
+        """
+        self._begin()
+        self._collection('upstream').save(upstream)
+        self._log([self._entry(issue_id, 'add_tracker',
+                               {'tracker_id' : upstream['tracker_id']}, time)])
+
+    def get_upstream_tracker(self, tracker_id):
+        """
+        Returns a list of the upstream trackers with tracker_id
+        """
+        return self._get_by_ids('upstream', [tracker_id])
+
+    # The transaction log
+
+    def log_transaction(self, root, xaction, xdata, xid=None, time=None,
+                        replicated=False):
+        """
+        Add an entry to the transaction log, returning its xid
+
+        replicated == The entry is copied as it is from another hive's
+                      log. If this log already has its xid, it is left
+                      alone.
+        """
+        if replicated and xid is not None and self._has_xid(xid):
+            return xid
+        self._begin()
+        entry = {'root' : root, 'time' : time, 'transaction' : xaction,
+                 'transaction_data' : xdata}
+        if xid is not None:
+            entry['id'] = xid
+        [xid] = self._log([entry])
+        return xid
+
+    def _has_xid(self, xid):
+        if self.xlog is not None:
+            return self.xlog.has(xid)
+        return self._collection('transaction_log').get(xid) is not None
+
+    def log_transactions(self, entries):
+        """
+        Add a list of (root, xaction, xdata, xid, time) entries to the
+        transaction log at once, returning their xids. xid may be None for
+        the next one.
+        """
+        docs = []
+        for (root, xaction, xdata, xid, time) in entries:
+            entry = {'root' : root, 'time' : time, 'transaction' : xaction,
+                     'transaction_data' : xdata}
+            if xid is not None:
+                entry['id'] = xid
+            docs.append(entry)
+        self._begin()
+        return self._log(docs)
+
+    def _xlog_spec(self, issue=None, since_xid=None, since=None, until=None,
+                   xaction=None, before_xid=None):
+        """
+        Returns the query spec for the transaction log filters
+        """
+        spec = {}
+        if issue:
+            spec['root'] = issue
+        if xaction:
+            spec['transaction'] = xaction
+        xid_range = {}
+        if since_xid:
+            xid_range['$gt'] = since_xid
+        if before_xid:
+            xid_range['$lt'] = before_xid
+        if xid_range:
+            spec['id'] = xid_range
+        time_range = {}
+        if since is not None:
+            time_range['$gte'] = since
+        if until is not None:
+            time_range['$lte'] = until
+        if time_range:
+            spec['time'] = time_range
+        return spec
+
+    def get_transaction_log(self, issue=None, since_xid=None, limit=None,
+                            since=None, until=None, xaction=None,
+                            reverse=False, before_xid=None):
+        if self.xlog is not None:
+            return self.xlog.get_transaction_log(issue, since_xid, limit,
+                since, until, xaction, reverse, before_xid)
+        spec = self._xlog_spec(issue, since_xid, since, until, xaction,
+                               before_xid)
+        return [(entry['id'], entry['root'], entry['time'],
+                 entry['transaction'], entry['transaction_data'])
+                for entry in self._collection('transaction_log').find(spec,
+                    reverse=reverse, limit=limit)]
+
+    def iter_transaction_log(self, issue=None, since_xid=None,
+                             chunk_size=__CHUNK_SIZE__, since=None,
+                             until=None, xaction=None, reverse=False,
+                             limit=None):
+        if self.xlog is not None:
+            for chunk in self.xlog.iter_transaction_log(issue, since_xid,
+                    chunk_size, since, until, xaction, reverse, limit):
+                yield chunk
+            return
+        last_xid = since_xid
+        before_xid = None
+        remaining = limit
+        while True:
+            size = chunk_size
+            if remaining is not None:
+                size = min(size, remaining)
+                if size <= 0:
+                    break
+            chunk = self.get_transaction_log(issue, last_xid, size, since,
+                                             until, xaction, reverse,
+                                             before_xid)
+            if not chunk:
+                break
+            yield chunk
+            if len(chunk) < size:
+                break
+            if remaining is not None:
+                remaining = remaining - len(chunk)
+            if reverse:
+                before_xid = chunk[-1][0]
+            else:
+                last_xid = chunk[-1][0]
+
+    def get_last_xid(self):
+        if self.xlog is not None:
+            return self.xlog.get_last_xid()
+        for entry in self._collection('transaction_log').find(reverse=True, limit=1):
+            return entry['id']
+        return None
+
+    def delete_transactions(self, xids):
+        if self.xlog is not None:
+            self.xlog.delete_transactions(xids)
+            return
+        self._begin()
+        collection = self._collection('transaction_log')
+        for xid in xids:
+            collection.delete(xid)
+
+    # Whole tables, by name (see swarmlib.snapshot)
+
+    def iter_table(self, name, chunk_size=__CHUNK_SIZE__):
+        """
+        Generator yielding every document of the collection name as lists
+        of at most chunk_size dicts
+        """
+        rows = []
+        for doc in self._collection(name).find():
+            rows.append(doc)
+            if len(rows) >= chunk_size:
+                yield rows
+                rows = []
+        if rows:
+            yield rows
+
+    def clear_table(self, name):
+        """
+        Empty the collection name, by making it anew
+        """
+        (primary_key, auto_increment, indexes) = __COLLECTIONS__[name]
+        self._begin()
+        self.engine.drop_collection(name)
+        self.engine.create_collection(name, primary_key, auto_increment,
+            [Index(index_name, *fields) for (index_name, fields) in indexes])
+
+    def insert_rows(self, name, rows):
+        if rows:
+            self._begin()
+            self.engine.bulk_write(name, rows)
+
+    # Query plans
+
+    def explain(self, query, arg=None):
+        """
+        Runs the query behind one of the Swarm calls below, returning a
+        dochemistry.planner.Explain of how it was answered:
+            get_issue            - arg is the issue hash id
+            get_lineage          - arg is the issue hash id
+            get_transaction_log  - arg is the issue hash id, or None for
+                                   the whole log
+        """
+        if query == 'get_issue':
+            return self._collection('issues').explain({'hash_id' : arg})
+        elif query == 'get_lineage':
+            return self._collection('lineage').explain({'root' : arg})
+        elif query == 'get_transaction_log':
+            if self.xlog is not None:
+                raise ValueError("The segment log has no query plans")
+            return self._collection('transaction_log').explain(
+                self._xlog_spec(issue=arg))
+        raise ValueError("Can't explain '%s'" % query)
+
+    # Replication checkpoints
+
+    def get_checkpoint(self, tracker_id):
+        checkpoint = self._collection('checkpoint').get(tracker_id)
+        if checkpoint:
+            return checkpoint['xid']
+        return None
+
+    def set_checkpoint(self, tracker_id, xid, time=None):
+        self._begin()
+        self._collection('checkpoint').save({'tracker_id' : tracker_id,
+                                             'xid' : xid, 'time' : time})
+
+def from_config(config, log, xactions=None):
+    """
+    from_config(config, log, xactions=None)
+    Returns a docstore for the hive whose Config is config. A relative
+    path in the url is taken from the hive's .swarm directory, and
+    'xlog = segment' keeps the transaction log in .swarm/xlog.
+    """
+    xlog = None
+    if config.has_option('db', 'xlog') and config.get('db', 'xlog') == 'segment':
+        from swarmlib.db.segment_log import segment_log
+        xlog = segment_log(os.path.join(config.dot_swarm, 'xlog'), log)
+    url = __DEFAULT_URL__
+    if config.has_option('db', 'url'):
+        url = config.get('db', 'url')
+    if '://' in url:
+        (scheme, path) = url.split('://', 1)
+        if path and not os.path.isabs(path):
+            url = "%s://%s" % (scheme, os.path.join(os.path.abspath(config.dot_swarm), path))
+    return docstore(url, log, xactions, xlog)
@@ -0,0 +1,145 @@
+# Copyright 2007 Sam Hart
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+# Author: Sam Hart
+
+"""
+Swarm DB Migrations
+
+Brings the database of an existing hive up to date with the current
+code. Migrations run in order, and each one runs only once per hive: the
+number of migrations applied is kept as 'migration' in the 'db' section
+of the hive's swarmrc.
+
+Add new migrations to the end of the 'migrations' list, never in the
+middle, and never remove one.
+"""
+
+from sqlalchemy import MetaData, Table, select, func
+
+from swarmlib.db.schema import transaction_log_table, lineage_table, \
+                               nodes_table
+from swarmlib.db.queries import iter_transaction_log, add_lineage
+
+def compact_transaction_data(connection, xactions, logger):
+    """
+    Rewrites the set_taxonomy, link_issue_to_node and add_lineage entries
+    of the transaction log from hexlified pickles into the compact
+    encoding (see swarmlib.xaction)
+    """
+    recoded = 0
+    for chunk in iter_transaction_log(connection):
+        for (xid, root, time, xaction, xdata) in chunk:
+            if xaction in ('set_taxonomy', 'link_issue_to_node', 'add_lineage') \
+                    and xdata and not xactions.is_compact(xdata):
+                data = xactions.dispatch[xaction].decode(xdata)
+                connection.execute(transaction_log_table.update(
+                    transaction_log_table.c.id == xid),
+                    transaction_data=xactions.dispatch[xaction].encode(data))
+                recoded = recoded + 1
+    logger.entry("Re-encoded '%i' transactions" % recoded, 1)
+
+def _create_missing_indexes(connection, table, logger):
+    """
+    Creates the indexes declared on table which the hive's copy of it
+    doesn't have yet
+    """
+    existing = Table(table.name, MetaData(), autoload=True,
+                     autoload_with=connection)
+    existing_names = [index.name for index in existing.indexes]
+    for index in table.indexes:
+        if index.name in existing_names:
+            logger.entry("Index '%s' already exists" % index.name, 2)
+        else:
+            logger.entry("Creating index '%s'" % index.name, 1)
+            index.create(bind=connection)
+
+def index_transaction_log(connection, xactions, logger):
+    """
+    Creates the transaction log indexes on (root, id) and time for hives
+    made before they were part of the schema
+    """
+    _create_missing_indexes(connection, transaction_log_table, logger)
+
+def index_transaction_type(connection, xactions, logger):
+    """
+    Creates the transaction log index on (transaction, id), used when the
+    log is filtered by transaction type
+    """
+    _create_missing_indexes(connection, transaction_log_table, logger)
+
+def _backfill_lineage(connection, xactions, logger):
+    """
+    Fills an empty lineage table from the add_lineage entries of the
+    transaction log
+    """
+    result = connection.execute(select([func.count()], from_obj=[lineage_table]))
+    existing = result.scalar()
+    result.close()
+    if existing:
+        logger.entry("Lineage table already has '%i' edges" % existing, 2)
+        return
+    added = 0
+    for chunk in iter_transaction_log(connection, xaction='add_lineage'):
+        for (xid, root, time, xaction, xdata) in chunk:
+            data = xactions.dispatch[xaction].decode(xdata)
+            add_lineage(connection, root, data['parent_id'], data['child_id'], time)
+            added = added + 1
+    logger.entry("Added '%i' lineage edges from the transaction log" % added, 1)
+
+def index_lineage(connection, xactions, logger):
+    """
+    Creates the lineage table and its adjacency indexes, and the index of
+    nodes by issue, for hives made before they were part of the schema,
+    and fills the table from the transaction log
+    """
+    lineage_table.create(bind=connection, checkfirst=True)
+    _create_missing_indexes(connection, lineage_table, logger)
+    _create_missing_indexes(connection, nodes_table, logger)
+    _backfill_lineage(connection, xactions, logger)
+
+migrations = [
+    ('compact_transaction_data', compact_transaction_data),
+    ('index_transaction_log', index_transaction_log),
+    ('index_lineage', index_lineage),
+    ('index_transaction_type', index_transaction_type),
+]
+
+def run(connection, config, xactions, log, commit):
+    """
+    run(connection, config, xactions, log, commit)
+    Apply every migration the hive hasn't had yet. commit() is called
+    after each migration, and only once it has returned is the migration
+    counted in the swarmrc, so a failed migration is tried again next time.
+    """
+    logger = log.get_logger("migrate")
+    logger.register("run")
+
+    applied = 0
+    if config.has_option('db', 'migration'):
+        applied = int(config.get('db', 'migration'))
+
+    if applied >= len(migrations):
+        logger.entry("Hive is up to date", 0)
+    for (name, migration) in migrations[applied:]:
+        logger.entry("Applying migration '%s'" % name, 0)
+        migration(connection, xactions, logger)
+        commit()
+        applied = applied + 1
+        config.set('db', 'migration', str(applied))
+        config.save()
+
+    logger.unregister()
@@ -0,0 +1,304 @@
+# Copyright 2007 Sam Hart
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+# Author: Sam Hart
+
+"""
+Swarm DB Queries
+
+This module contains the queries the backends run against the tables
+defined in swarmlib.db.schema.
+
+You will find the following functions:
+    * get_transaction_log   - Fetch (part of) the transaction log
+    * iter_transaction_log  - Walk the transaction log in chunks
+    * get_checkpoint        - Last xid replayed from an upstream tracker
+    * set_checkpoint        - Record the last xid replayed from an upstream
+    * get_issues            - Fetch many issues by hash id in one go
+    * get_nodes             - Fetch many nodes by hash id in one go
+    * get_thread            - Every node and lineage edge of an issue
+    * add_lineage           - Add an edge to the lineage of an issue
+    * get_last_xid          - The xid of the newest transaction
+    * delete_transactions   - Drop entries from the transaction log
+    * iter_table            - Walk every row of a table in chunks
+    * clear_table           - Delete every row of a table
+    * insert_rows           - Insert many rows into a table at once
+"""
+
+from sqlalchemy import select, and_, or_, func
+
+from swarmlib.db.schema import transaction_log_table, checkpoint_table, \
+                               issues_table, nodes_table, lineage_table
+
+# The default number of transaction log entries fetched per chunk
+__CHUNK_SIZE__ = 1000
+
+# The most ids we put in a single IN (...) clause. SQLite, for one, will
+# not take more than 999 bound parameters in a statement.
+__IN_CLAUSE_SIZE__ = 500
+
+# The node columns left out of the node headers returned by get_thread
+__NODE_BODY_COLUMNS__ = ('details', 'attachment')
+
+def _xlog_select(issue=None, since_xid=None, limit=None, since=None,
+                 until=None, xaction=None, reverse=False, before_xid=None):
+    """
+    Build the select for the transaction log. Entries are returned in xid
+    order, newest first if reverse is set. since_xid and before_xid are
+    exclusive, since and until (timestamps) are inclusive.
+    """
+    xlog = transaction_log_table.c
+    where = []
+    if issue:
+        where.append(xlog.root == issue)
+    if xaction:
+        where.append(xlog.transaction == xaction)
+    if since_xid:
+        where.append(xlog.id > since_xid)
+    if before_xid:
+        where.append(xlog.id < before_xid)
+    if since is not None:
+        where.append(xlog.time >= since)
+    if until is not None:
+        where.append(xlog.time <= until)
+
+    s = select([xlog.id, xlog.root, xlog.time, xlog.transaction,
+                xlog.transaction_data])
+    if where:
+        s = s.where(and_(*where))
+    if reverse:
+        s = s.order_by(xlog.id.desc())
+    else:
+        s = s.order_by(xlog.id)
+    if limit:
+        s = s.limit(limit)
+    return s
+
+def get_transaction_log(connection, issue=None, since_xid=None, limit=None,
+                        since=None, until=None, xaction=None, reverse=False,
+                        before_xid=None):
+    """
+    get_transaction_log(connection, issue=None, since_xid=None, limit=None,
+                        since=None, until=None, xaction=None,
+                        reverse=False, before_xid=None)
+    Returns a list of (xid, root, time, xaction, xdata) tuples. If issue
+    is set, only the entries rooted at that issue are returned. If
+    xaction is set, only entries of that transaction type are returned.
+    If since_xid and/or before_xid are set, only entries after and/or
+    before those xids are returned. If since and/or until are set, only
+    entries logged in that time range are returned. The newest entries
+    come first if reverse is set.
+    """
+    result = connection.execute(_xlog_select(issue, since_xid, limit, since,
+                                             until, xaction, reverse,
+                                             before_xid))
+    xlog = [tuple(row) for row in result.fetchall()]
+    result.close()
+    return xlog
+
+def iter_transaction_log(connection, issue=None, since_xid=None,
+                         chunk_size=__CHUNK_SIZE__, since=None, until=None,
+                         xaction=None, reverse=False, limit=None):
+    """
+    iter_transaction_log(connection, issue=None, since_xid=None,
+                         chunk_size=__CHUNK_SIZE__, since=None, until=None,
+                         xaction=None, reverse=False, limit=None)
+    Generator walking the transaction log in xid order (newest first if
+    reverse is set). Yields lists of at most chunk_size (xid, root, time,
+    xaction, xdata) tuples, so only one chunk is ever held in memory, and
+    stops after limit entries if limit is set. Takes the same filters as
+    get_transaction_log.
+
+    Each chunk is fetched with its own query keyed on the last xid seen,
+    rather than holding a cursor open, so the caller is free to write to
+    (and commit) other hives between chunks.
+    """
+    last_xid = since_xid
+    before_xid = None
+    remaining = limit
+    while True:
+        size = chunk_size
+        if remaining is not None:
+            size = min(size, remaining)
+            if size <= 0:
+                break
+        chunk = get_transaction_log(connection, issue, last_xid, size,
+                                    since, until, xaction, reverse,
+                                    before_xid)
+        if not chunk:
+            break
+        yield chunk
+        if len(chunk) < size:
+            break
+        if remaining is not None:
+            remaining = remaining - len(chunk)
+        if reverse:
+            before_xid = chunk[-1][0]
+        else:
+            last_xid = chunk[-1][0]
+
+def get_checkpoint(connection, tracker_id):
+    """
+    get_checkpoint(connection, tracker_id)
+    Returns the last source xid replayed into this hive from the upstream
+    tracker_id, or None if nothing has been replayed from it yet.
+    """
+    s = select([checkpoint_table.c.xid],
+               checkpoint_table.c.tracker_id == tracker_id)
+    result = connection.execute(s)
+    row = result.fetchone()
+    result.close()
+    if row:
+        return row[0]
+    return None
+
+def set_checkpoint(connection, tracker_id, xid, time=None):
+    """
+    set_checkpoint(connection, tracker_id, xid, time=None)
+    Records xid as the last source xid replayed from the upstream
+    tracker_id. This does not commit, so it should be called inside the
+    same transaction as the replayed entries it describes.
+    """
+    u = checkpoint_table.update(checkpoint_table.c.tracker_id == tracker_id)
+    result = connection.execute(u, xid=xid, time=time)
+    if not result.rowcount:
+        connection.execute(checkpoint_table.insert(), tracker_id=tracker_id,
+                           xid=xid, time=time)
+
+def _get_by_ids(connection, table, column, ids):
+    """
+    Returns the rows of table whose column is in ids as a list of dicts,
+    using one query per __IN_CLAUSE_SIZE__ ids.
+    """
+    ids = list(set(ids))
+    rows = []
+    for i in range(0, len(ids), __IN_CLAUSE_SIZE__):
+        result = connection.execute(select([table],
+            column.in_(ids[i:i + __IN_CLAUSE_SIZE__])))
+        rows.extend([dict(row) for row in result.fetchall()])
+        result.close()
+    return rows
+
+def get_issues(connection, hash_ids):
+    """
+    get_issues(connection, hash_ids)
+    Returns the issues with the given hash ids as a list of dicts. Ids
+    which don't exist are skipped, and the order is not defined.
+    """
+    return _get_by_ids(connection, issues_table, issues_table.c.hash_id,
+                       hash_ids)
+
+def get_nodes(connection, hash_ids):
+    """
+    get_nodes(connection, hash_ids)
+    Returns the nodes with the given hash ids as a list of dicts. Ids
+    which don't exist are skipped, and the order is not defined.
+    """
+    return _get_by_ids(connection, nodes_table, nodes_table.c.hash_id,
+                       hash_ids)
+
+def get_thread(connection, issue_id):
+    """
+    get_thread(connection, issue_id)
+    Returns (nodes, edges) for the issue with hash id issue_id, where
+    nodes is a list of node dicts and edges a list of (parent_id,
+    child_id) tuples. This is the whole node DAG of the issue, in one
+    query for the nodes and one for the edges.
+
+    A root node only gets its issue_id from the link_issue_to_node after
+    it, so the nodes on the issue's edges are selected as well.
+
+    Only the node headers are loaded: the (possibly large) details and
+    attachment are left out, fetch them with get_nodes as needed.
+    """
+    edges_in_thread = lineage_table.c.root == issue_id
+    header = [column for column in nodes_table.c
+              if column.name not in __NODE_BODY_COLUMNS__]
+    result = connection.execute(select(header, or_(
+        nodes_table.c.issue_id == issue_id,
+        nodes_table.c.hash_id.in_(select([lineage_table.c.parent_id],
+                                         edges_in_thread)),
+        nodes_table.c.hash_id.in_(select([lineage_table.c.child_id],
+                                         edges_in_thread)))))
+    nodes = [dict(row) for row in result.fetchall()]
+    result.close()
+
+    result = connection.execute(select([lineage_table.c.parent_id,
+        lineage_table.c.child_id], edges_in_thread,
+        order_by=[lineage_table.c.id]))
+    edges = [tuple(row) for row in result.fetchall()]
+    result.close()
+
+    return (nodes, edges)
+
+def add_lineage(connection, root, parent_id, child_id, time=None):
+    """
+    add_lineage(connection, root, parent_id, child_id, time=None)
+    Adds the edge parent_id -> child_id to the lineage of the issue root.
+    The add_lineage transaction itself is logged by the caller.
+    """
+    connection.execute(lineage_table.insert(), root=root, parent_id=parent_id,
+                       child_id=child_id, time=time)
+
+def get_last_xid(connection):
+    """
+    get_last_xid(connection)
+    Returns the xid of the newest transaction log entry, or None if the
+    log is empty
+    """
+    result = connection.execute(select([func.max(transaction_log_table.c.id)]))
+    xid = result.scalar()
+    result.close()
+    return xid
+
+def delete_transactions(connection, xids):
+    """
+    delete_transactions(connection, xids)
+    Deletes the transaction log entries with the given xids
+    """
+    xids = list(xids)
+    for i in range(0, len(xids), __IN_CLAUSE_SIZE__):
+        connection.execute(transaction_log_table.delete(
+            transaction_log_table.c.id.in_(xids[i:i + __IN_CLAUSE_SIZE__])))
+
+def iter_table(connection, table, chunk_size=__CHUNK_SIZE__):
+    """
+    iter_table(connection, table, chunk_size=__CHUNK_SIZE__)
+    Generator yielding every row of table as lists of at most chunk_size
+    dicts
+    """
+    result = connection.execute(select([table]))
+    while True:
+        rows = result.fetchmany(chunk_size)
+        if not rows:
+            break
+        yield [dict(row) for row in rows]
+    result.close()
+
+def clear_table(connection, table):
+    """
+    clear_table(connection, table)
+    Deletes every row of table
+    """
+    connection.execute(table.delete())
+
+def insert_rows(connection, table, rows):
+    """
+    insert_rows(connection, table, rows)
+    Inserts a list of row dicts into table with a single executemany
+    """
+    if rows:
+        connection.execute(table.insert(), rows)
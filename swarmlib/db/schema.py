@@ -23,7 +23,7 @@ This package defines the database schema used in a Swarm Hive.
 """
 
 from sqlalchemy import Table, Column, Integer, String, MetaData, ForeignKey, \
-                       Float, PickleType, Text, Binary, Boolean
+                       Float, PickleType, Text, Binary, Boolean, Index
 
 #from sqlalchemy.orm import mapper, relation, backref
 #import sqlalchemy.types as types
@@ -100,6 +100,32 @@ mapper(dobj.Node, nodes_table, properties={
             remote_side=[nodes_table.c.hash_id])),
 })
 
+###################################
+# Define the node lineage table
+###################################
+
+# A node may have several parents and several children, so lineage is
+# kept as an edge list rather than in nodes.parent_node_id. The indexes
+# make it an adjacency index: all edges of a thread (by root), or the
+# edges into or out of one node, without a scan.
+lineage_table = Table('lineage', metadata,
+    Column('id', Integer, primary_key=True, auto_increment=True),
+    Column('root', String(__HASH_ID_LENGTH__),
+            ForeignKey('issues.hash_id')),
+    Column('parent_id', String(__HASH_ID_LENGTH__),
+            ForeignKey('nodes.hash_id'), nullable=False),
+    Column('child_id', String(__HASH_ID_LENGTH__),
+            ForeignKey('nodes.hash_id'), nullable=False),
+    Column('time', Float),
+)
+
+Index('ix_lineage_root', lineage_table.c.root)
+Index('ix_lineage_parent_id', lineage_table.c.parent_id)
+Index('ix_lineage_child_id', lineage_table.c.child_id)
+Index('ix_nodes_issue_id', nodes_table.c.issue_id)
+
+mapper(dobj.LineageEntry, lineage_table)
+
 ###################################
 # Define the Transaction log table
 ###################################
@@ -112,6 +138,14 @@ transaction_log_table = Table('transaction_log', metadata,
     Column('transaction_data', PickleType),
 )
 
+# Per-issue log reads (swarm log ISSUE, branch, pull -t) walk one root in
+# xid order, and log views can be limited to a time range
+Index('ix_transaction_log_root_id', transaction_log_table.c.root,
+        transaction_log_table.c.id)
+Index('ix_transaction_log_time', transaction_log_table.c.time)
+Index('ix_transaction_log_transaction_id', transaction_log_table.c.transaction,
+        transaction_log_table.c.id)
+
 mapper(dobj.TransactionEntry, transaction_log_table)
 
 ############################################
@@ -195,3 +229,17 @@ upstream_table = Table('upstream', metadata
 )
 
 mapper(dobj.Upstream, upstream_table)
+
+#####################################
+# Replication checkpoint definition
+#####################################
+# One row per upstream tracker, holding the last source xid which has been
+# replayed (and committed) into this hive from that upstream
+checkpoint_table = Table('checkpoint', metadata,
+    Column('tracker_id', String(__HASH_ID_LENGTH__),
+            primary_key=True, unique=True, nullable=False),
+    Column('xid', Integer, nullable=False),
+    Column('time', Float),
+)
+
+mapper(dobj.Checkpoint, checkpoint_table)
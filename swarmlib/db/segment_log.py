@@ -0,0 +1,736 @@
+# Copyright 2007 Sam Hart
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+# Author: Sam Hart
+
+"""
+Swarm Segment Log
+
+An append-only transaction log storage engine. A docstore backend given
+one keeps its transaction log here instead of in a collection (see
+swarmlib.db.docstore.from_config, which makes one for 'xlog = segment' in
+the 'db' section of a hive's swarmrc).
+
+The log is a series of segment files in a directory (.swarm/xlog), each
+named after the first xid it holds, in xid order. A record is
+    header      length of the body      uint32
+                crc32                   uint32
+                xid                     uint64
+                time                    double
+                flags                   uint8
+                xaction length          uint8
+                root length             uint16
+    body        root, xaction name, transaction data
+    trailer     length of the record    uint32
+The crc covers everything in the header after it, and the body. The
+trailer lets the log be walked backwards, newest first. The last record
+of every commit carries __FLAG_COMMIT__; readers only go as far as the
+last of those, so a commit is seen whole or not at all.
+
+Segments are read through mmap. Records are parsed where they lie in the
+mapping, with struct.unpack_from(), so the entries a filter skips are
+never copied; only the fields of the entries returned are sliced out.
+
+Each segment has a sparse index file next to it, of (xid, offset) pairs
+for the first record of a commit every __INDEX_SPACING__ bytes or so, so
+a read from some xid seeks close to it and scans forward from there. A
+new segment is started once the last one is over __SEGMENT_SIZE__. Reads filtered by issue,
+transaction type or time have no index of their own and scan the log from
+the requested xid.
+
+Writers take turns on an exclusive flock() of the 'lock' file in the
+directory, taken by begin() (or the first append after a commit) and held
+until commit() or rollback(), as dochemistry.disk does. Appends are held in
+memory until then, so rollback() only has to forget them. Before
+appending, a writer catches up with what others committed and cuts off
+anything a crash left after the last commit.
+"""
+
+import os
+import mmap
+import zlib
+import fcntl
+import bisect
+import struct
+import cPickle as pickle
+
+__HEADER__ = struct.Struct('>IIQdBBH')
+__TRAILER__ = struct.Struct('>I')
+__INDEX_ENTRY__ = struct.Struct('>QQ')
+
+# Record flags
+__FLAG_COMMIT__ = 0x01      # The last record of a commit
+__FLAG_NO_DATA__ = 0x02     # The transaction data is None
+__FLAG_PICKLED__ = 0x04     # The transaction data wasn't a string
+__FLAG_NO_TIME__ = 0x08     # The time is None
+__FLAG_NO_ROOT__ = 0x10     # The root is None
+
+# Start a new segment once the last one is this big
+__SEGMENT_SIZE__ = 64 * 1024 * 1024
+# Bytes of records between sparse index entries
+__INDEX_SPACING__ = 64 * 1024
+
+__SEGMENT_SUFFIX__ = '.seg'
+__INDEX_SUFFIX__ = '.idx'
+__LOCK_NAME__ = 'lock'
+
+# The default number of entries per chunk, as in swarmlib.db.queries
+__CHUNK_SIZE__ = 1000
+
+class _segment:
+    """
+    What a segment_log knows of one segment file
+    """
+    def __init__(self, first_xid, path):
+        self.first_xid = first_xid
+        self.path = path
+        # The sparse index, as parallel lists
+        self.xids = []
+        self.offsets = []
+        # Where the last commit in the file ends, and the xid of its last
+        # record (None while empty)
+        self.end = 0
+        self.last_xid = None
+        self.inode = None
+
+    def add_index(self, xid, offset):
+        if not self.offsets or offset - self.offsets[-1] >= __INDEX_SPACING__:
+            self.xids.append(xid)
+            self.offsets.append(offset)
+            return True
+        return False
+
+    def seek(self, xid):
+        """
+        Returns the offset of the last indexed record at or before xid.
+        Indexed records start a commit, so everything before them is
+        committed.
+        """
+        i = bisect.bisect_right(self.xids, xid) - 1
+        if i < 0:
+            return 0
+        return self.offsets[i]
+
+class _view:
+    """
+    A read only mapping of the committed part of a segment
+    """
+    def __init__(self, segment):
+        self.end = segment.end
+        self.map = None
+        if self.end:
+            fp = open(segment.path, 'rb')
+            try:
+                self.map = mmap.mmap(fp.fileno(), self.end, access=mmap.ACCESS_READ)
+            finally:
+                fp.close()
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+
+def _record(xid, root, time, xaction, xdata, commit=False):
+    """
+    Returns the bytes of a record
+    """
+    flags = 0
+    if commit:
+        flags = flags | __FLAG_COMMIT__
+    if xdata is None:
+        flags = flags | __FLAG_NO_DATA__
+        xdata = ''
+    elif not isinstance(xdata, str):
+        flags = flags | __FLAG_PICKLED__
+        xdata = pickle.dumps(xdata, 2)
+    if time is None:
+        flags = flags | __FLAG_NO_TIME__
+        time = 0.0
+    if root is None:
+        flags = flags | __FLAG_NO_ROOT__
+        root = ''
+    body = root + xaction + xdata
+    fields = __HEADER__.pack(len(body), 0, xid, time, flags, len(xaction),
+                             len(root))[8:]
+    crc = zlib.crc32(body, zlib.crc32(fields)) & 0xffffffff
+    return struct.pack('>II', len(body), crc) + fields + body + \
+        __TRAILER__.pack(__HEADER__.size + len(body) + __TRAILER__.size)
+
+def _mark_commit(record):
+    """
+    Returns record with __FLAG_COMMIT__ set (and its crc fixed up)
+    """
+    (length, crc, xid, time, flags, xaction_len, root_len) = \
+        __HEADER__.unpack_from(record)
+    fields = __HEADER__.pack(length, 0, xid, time, flags | __FLAG_COMMIT__,
+                             xaction_len, root_len)[8:]
+    body = record[__HEADER__.size:__HEADER__.size + length]
+    crc = zlib.crc32(body, zlib.crc32(fields)) & 0xffffffff
+    return struct.pack('>II', length, crc) + fields + record[__HEADER__.size:]
+
+class segment_log:
+    def __init__(self, path, log, segment_size=__SEGMENT_SIZE__):
+        """
+        path == The directory of the segments, made if it doesn't exist
+        log == The log instance
+        segment_size == The size past which a new segment is started
+        """
+        self.path = path
+        self.segment_size = segment_size
+        self._logger = log.get_logger("segment_log")
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        self._lock_fp = open(os.path.join(path, __LOCK_NAME__), 'a')
+        self._locked = False
+        self._segments = []
+        # (xid, root, time, xaction, xdata) appended since the last commit
+        self._pending = []
+        # Where prepare() started writing, while a commit is in progress
+        self._prepared = None
+        # xids to drop at the next commit
+        self._deletes = set()
+        self._load()
+
+    # Locking, as in dochemistry.disk
+
+    def _acquire(self):
+        if self._locked:
+            return False
+        fcntl.flock(self._lock_fp.fileno(), fcntl.LOCK_EX)
+        self._locked = True
+        return True
+
+    def _release(self):
+        if self._locked:
+            fcntl.flock(self._lock_fp.fileno(), fcntl.LOCK_UN)
+            self._locked = False
+
+    def begin(self):
+        """
+        Take the write lock, if this log doesn't have it yet, and catch up
+        with the segments. Called by the first append after a commit; a
+        caller which writes to other stores in the same commit may call it
+        first so that every writer locks in the same order.
+        """
+        if self._locked:
+            return
+        self._acquire()
+        try:
+            self._refresh()
+            self._cut_tail()
+        except:
+            self._release()
+            raise
+
+    # Reading the segments
+
+    def _segment_path(self, first_xid, suffix=__SEGMENT_SUFFIX__):
+        return os.path.join(self.path, "%020i%s" % (first_xid, suffix))
+
+    def _list(self):
+        """
+        Returns the first xids of the segment files, in order
+        """
+        first_xids = []
+        for name in os.listdir(self.path):
+            if name.endswith(__SEGMENT_SUFFIX__):
+                first_xids.append(int(name[:-len(__SEGMENT_SUFFIX__)]))
+        first_xids.sort()
+        return first_xids
+
+    def _load(self):
+        """
+        Read the segment list and sparse indexes anew
+        """
+        self._segments = []
+        for first_xid in self._list():
+            segment = _segment(first_xid, self._segment_path(first_xid))
+            self._read_index(segment)
+            self._scan_tail(segment)
+            self._segments.append(segment)
+
+    def _read_index(self, segment):
+        index_path = self._segment_path(segment.first_xid, __INDEX_SUFFIX__)
+        segment.xids = []
+        segment.offsets = []
+        if not os.path.isfile(index_path):
+            return
+        fp = open(index_path, 'rb')
+        data = fp.read()
+        fp.close()
+        size = os.path.getsize(segment.path)
+        for i in range(0, len(data) - __INDEX_ENTRY__.size + 1, __INDEX_ENTRY__.size):
+            (xid, offset) = __INDEX_ENTRY__.unpack_from(data, i)
+            # Entries past the data are left over from a commit which was
+            # cut off
+            if offset < size:
+                segment.xids.append(xid)
+                segment.offsets.append(offset)
+
+    def _scan_tail(self, segment):
+        """
+        Find the end of the last complete commit of a segment, checking
+        the records after its last index entry, or after segment.end if
+        the segment was read before
+        """
+        try:
+            stat = os.stat(segment.path)
+        except OSError:
+            return
+        segment.inode = stat.st_ino
+        if stat.st_size <= segment.end:
+            return
+        fp = open(segment.path, 'rb')
+        try:
+            data = mmap.mmap(fp.fileno(), stat.st_size, access=mmap.ACCESS_READ)
+        finally:
+            fp.close()
+        try:
+            if segment.offsets and segment.offsets[-1] > segment.end:
+                # Index entries are only made at the start of a commit, so
+                # everything before the last one is committed
+                segment.end = segment.offsets[-1]
+                segment.last_xid = None
+                if segment.end:
+                    (size,) = __TRAILER__.unpack_from(data, segment.end - __TRAILER__.size)
+                    segment.last_xid = struct.unpack_from('>Q', data,
+                        segment.end - size + 8)[0]
+            offset = segment.end
+            commit_xid = None
+            while offset + __HEADER__.size <= stat.st_size:
+                (length, crc, xid, time, flags, xaction_len, root_len) = \
+                    __HEADER__.unpack_from(data, offset)
+                end = offset + __HEADER__.size + length + __TRAILER__.size
+                if end > stat.st_size:
+                    break
+                check = zlib.crc32(buffer(data, offset + 8, __HEADER__.size - 8))
+                check = zlib.crc32(buffer(data, offset + __HEADER__.size, length), check)
+                if check & 0xffffffff != crc:
+                    break
+                if commit_xid is None:
+                    commit_xid = xid
+                offset = end
+                if flags & __FLAG_COMMIT__:
+                    segment.add_index(commit_xid, segment.end)
+                    segment.end = end
+                    segment.last_xid = xid
+                    commit_xid = None
+        finally:
+            data.close()
+
+    def _refresh(self):
+        """
+        Catch up with what other writers have committed since this log
+        last looked
+        """
+        first_xids = self._list()
+        if first_xids != [segment.first_xid for segment in self._segments]:
+            self._load()
+            return
+        for segment in self._segments:
+            try:
+                stat = os.stat(segment.path)
+            except OSError:
+                self._load()
+                return
+            if stat.st_ino != segment.inode or stat.st_size < segment.end:
+                # Rewritten by delete_transactions()
+                self._load()
+                return
+        if self._segments:
+            self._scan_tail(self._segments[-1])
+
+    def _cut_tail(self):
+        """
+        Cut off whatever a crash left after the last commit of the last
+        segment. Needs the write lock.
+        """
+        if not self._segments:
+            return
+        segment = self._segments[-1]
+        if os.path.getsize(segment.path) > segment.end:
+            self._logger.register("_cut_tail")
+            self._logger.entry("Dropping an incomplete commit at the end of '%s'" % segment.path, 0)
+            fp = open(segment.path, 'r+b')
+            fp.truncate(segment.end)
+            fp.flush()
+            os.fsync(fp.fileno())
+            fp.close()
+            self._write_index(segment)
+            self._logger.unregister()
+
+    def _write_index(self, segment):
+        """
+        Replace the sparse index file of segment with what is in memory
+        """
+        index_path = self._segment_path(segment.first_xid, __INDEX_SUFFIX__)
+        temp_path = index_path + '.tmp'
+        fp = open(temp_path, 'wb')
+        fp.write(''.join([__INDEX_ENTRY__.pack(xid, offset) for (xid, offset)
+                          in zip(segment.xids, segment.offsets)]))
+        fp.close()
+        os.rename(temp_path, index_path)
+
+    # Writing
+
+    def get_last_xid(self):
+        """
+        Returns the newest xid in the log (pending appends included), or
+        None if it is empty
+        """
+        if self._pending:
+            return self._pending[-1][0]
+        if not self._locked:
+            self._refresh()
+        for segment in reversed(self._segments):
+            if segment.last_xid is not None:
+                return segment.last_xid
+        return None
+
+    def has(self, xid):
+        """
+        Whether the log has an entry with xid
+        """
+        for entry in self._pending:
+            if entry[0] == xid:
+                return True
+        for entry in self._entries(since_xid=xid - 1, until_xid=xid):
+            return entry[0] == xid
+        return False
+
+    def append(self, root, xaction, xdata, xid=None, time=None):
+        """
+        Append an entry, returning its xid. An xid given (for an entry
+        copied from another hive) must be after every xid in the log. The
+        entry is only written by commit().
+        """
+        self.begin()
+        last_xid = self.get_last_xid()
+        if xid is None:
+            xid = (last_xid or 0) + 1
+        elif last_xid is not None and xid <= last_xid:
+            raise ValueError("xid '%i' is not after the last xid '%i'" % (xid, last_xid))
+        self._pending.append((xid, root, time, xaction, xdata))
+        return xid
+
+    def prepare(self):
+        """
+        Write the pending entries and fsync, keeping the write lock, so
+        that another store can be committed before finish() (or
+        unprepare(), if that fails). If writing fails, nothing written is
+        kept and the entries are still pending.
+        """
+        if not self._pending:
+            return
+        # Every record is made before the file is touched
+        records = [_record(*entry) for entry in self._pending]
+        records[-1] = _mark_commit(records[-1])
+
+        if not self._segments or self._segments[-1].end >= self.segment_size:
+            first_xid = self._pending[0][0]
+            segment = _segment(first_xid, self._segment_path(first_xid))
+            open(segment.path, 'ab').close()
+            segment.inode = os.stat(segment.path).st_ino
+            self._segments.append(segment)
+        segment = self._segments[-1]
+
+        start = segment.end
+        fp = open(segment.path, 'r+b')
+        try:
+            try:
+                fp.seek(start)
+                fp.write(''.join(records))
+                fp.flush()
+                os.fsync(fp.fileno())
+            except:
+                fp.seek(start)
+                fp.truncate(start)
+                fp.flush()
+                raise
+        finally:
+            fp.close()
+        self._prepared = (segment, start, list(segment.xids), list(segment.offsets),
+                          segment.last_xid)
+
+        indexed = segment.add_index(self._pending[0][0], start)
+        segment.end = start + sum([len(record) for record in records])
+        segment.last_xid = self._pending[-1][0]
+        if indexed:
+            self._write_index(segment)
+
+    def unprepare(self):
+        """
+        Cut the entries written by prepare() off again. They are still
+        pending.
+        """
+        if self._prepared is None:
+            return
+        (segment, start, xids, offsets, last_xid) = self._prepared
+        # The index first, so that it never points past the data
+        segment.xids = xids
+        segment.offsets = offsets
+        self._write_index(segment)
+        fp = open(segment.path, 'r+b')
+        fp.truncate(start)
+        fp.flush()
+        os.fsync(fp.fileno())
+        fp.close()
+        segment.end = start
+        segment.last_xid = last_xid
+        self._prepared = None
+
+    def finish(self):
+        """
+        Done with a commit: forget the entries written, drop the entries
+        deleted and release the write lock
+        """
+        self._prepared = None
+        self._pending = []
+        try:
+            if self._deletes:
+                for segment in self._segments:
+                    if segment.last_xid is not None and \
+                       segment.first_xid <= max(self._deletes) and \
+                       segment.last_xid >= min(self._deletes):
+                        self._rewrite(segment, self._deletes)
+        finally:
+            self._deletes = set()
+            self._release()
+
+    def commit(self):
+        self.prepare()
+        self.finish()
+
+    def rollback(self):
+        """
+        Forget every entry appended since the last commit
+        """
+        self.unprepare()
+        self._pending = []
+        self._deletes = set()
+        self._release()
+
+    def delete_transactions(self, xids):
+        """
+        Drop the entries with the given xids at the next commit, by
+        rewriting the segments which hold them. A rewrite can't be undone,
+        so it is done last, once anything committed alongside the log has
+        been.
+        """
+        if xids:
+            self.begin()
+            self._deletes.update(xids)
+
+    def _rewrite(self, segment, xids):
+        """
+        Replace a segment with a copy without the entries in xids. All of
+        it is committed, so the last record kept is marked as a commit.
+        """
+        view = _view(segment)
+        records = []
+        last_xid = segment.first_xid - 1
+        try:
+            for (xid, offset, end) in self._walk(view, 0):
+                if xid not in xids:
+                    records.append(view.map[offset:end])
+                    last_xid = xid
+        finally:
+            view.close()
+        # Each record is made a commit of its own, so the rewritten segment
+        # can be indexed as finely as a written one
+        records = [_mark_commit(record) for record in records]
+        temp_path = segment.path + '.tmp'
+        fp = open(temp_path, 'wb')
+        fp.write(''.join(records))
+        fp.flush()
+        os.fsync(fp.fileno())
+        fp.close()
+        os.rename(temp_path, segment.path)
+
+        segment.inode = os.stat(segment.path).st_ino
+        segment.xids = []
+        segment.offsets = []
+        segment.end = 0
+        segment.last_xid = last_xid
+        offset = 0
+        for record in records:
+            segment.add_index(__HEADER__.unpack_from(record)[2], offset)
+            offset = offset + len(record)
+        segment.end = offset
+        self._write_index(segment)
+
+    def close(self):
+        self.rollback()
+        if self._lock_fp:
+            self._lock_fp.close()
+            self._lock_fp = None
+
+    # Reading the entries
+
+    def _walk(self, view, start):
+        """
+        Generator over the (xid, offset, end) of the records of a view
+        from offset start on
+        """
+        data = view.map
+        offset = start
+        while offset < view.end:
+            (length, crc, xid) = struct.unpack_from('>IIQ', data, offset)
+            end = offset + __HEADER__.size + length + __TRAILER__.size
+            yield (xid, offset, end)
+            offset = end
+
+    def _walk_back(self, view, end):
+        """
+        Generator over the (xid, offset, end) of the records of a view
+        ending at or before end, newest first
+        """
+        data = view.map
+        while end > 0:
+            (size,) = __TRAILER__.unpack_from(data, end - __TRAILER__.size)
+            offset = end - size
+            xid = struct.unpack_from('>Q', data, offset + 8)[0]
+            yield (xid, offset, end)
+            end = offset
+
+    def _entry(self, data, offset, issue, xaction, since, until):
+        """
+        Returns the (xid, root, time, xaction, xdata) of the record at
+        offset, or None if the filters leave it out. Only the fields of an
+        entry which is returned are copied out of the mapping.
+        """
+        (length, crc, xid, time, flags, xaction_len, root_len) = \
+            __HEADER__.unpack_from(data, offset)
+        if flags & __FLAG_NO_TIME__:
+            time = None
+        if since is not None and (time is None or time < since):
+            return None
+        if until is not None and (time is None or time > until):
+            return None
+        body = offset + __HEADER__.size
+        if issue is not None and (root_len != len(issue) or
+                                  data[body:body + root_len] != issue):
+            return None
+        entry_xaction = data[body + root_len:body + root_len + xaction_len]
+        if xaction is not None and entry_xaction != xaction:
+            return None
+        root = None
+        if not flags & __FLAG_NO_ROOT__:
+            root = data[body:body + root_len]
+        xdata = None
+        if not flags & __FLAG_NO_DATA__:
+            xdata = data[body + root_len + xaction_len:body + length]
+            if flags & __FLAG_PICKLED__:
+                xdata = pickle.loads(xdata)
+        return (xid, root, time, entry_xaction, xdata)
+
+    def _entries(self, issue=None, since_xid=None, since=None, until=None,
+                 xaction=None, reverse=False, before_xid=None, until_xid=None):
+        """
+        Generator over the committed entries matching the filters, in xid
+        order (newest first if reverse is set). since_xid and before_xid
+        are exclusive, until_xid inclusive.
+        """
+        if not self._locked:
+            self._refresh()
+        if before_xid is not None:
+            until_xid = min(until_xid or before_xid, before_xid - 1)
+        segments = [segment for segment in self._segments if segment.end]
+        if since_xid is not None:
+            # The segments wholly before since_xid can be skipped
+            first = max(bisect.bisect_right([s.first_xid for s in segments], since_xid) - 1, 0)
+            segments = segments[first:]
+        if until_xid is not None:
+            segments = [s for s in segments if s.first_xid <= until_xid]
+        if reverse:
+            segments.reverse()
+
+        for segment in segments:
+            view = _view(segment)
+            try:
+                if reverse:
+                    end = view.end
+                    if until_xid is not None and segment.last_xid > until_xid:
+                        end = self._offset_after(segment, view, until_xid)
+                    records = self._walk_back(view, end)
+                else:
+                    start = 0
+                    if since_xid is not None:
+                        start = segment.seek(since_xid)
+                    records = self._walk(view, start)
+                for (xid, offset, end) in records:
+                    if since_xid is not None and xid <= since_xid:
+                        if reverse:
+                            return
+                        continue
+                    if until_xid is not None and xid > until_xid:
+                        if reverse:
+                            continue
+                        return
+                    entry = self._entry(view.map, offset, issue, xaction,
+                                        since, until)
+                    if entry is not None:
+                        yield entry
+            finally:
+                view.close()
+
+    def _offset_after(self, segment, view, xid):
+        """
+        Returns the offset where the records of a segment after xid begin
+        """
+        for (record_xid, offset, end) in self._walk(view, segment.seek(xid)):
+            if record_xid > xid:
+                return offset
+        return view.end
+
+    def iter_transaction_log(self, issue=None, since_xid=None,
+                             chunk_size=__CHUNK_SIZE__, since=None,
+                             until=None, xaction=None, reverse=False,
+                             limit=None):
+        """
+        Generator walking the log, with the same arguments and chunking
+        as swarmlib.db.queries.iter_transaction_log
+        """
+        chunk = []
+        count = 0
+        for entry in self._entries(issue, since_xid, since, until, xaction,
+                                   reverse):
+            if limit is not None and count >= limit:
+                break
+            chunk.append(entry)
+            count = count + 1
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def get_transaction_log(self, issue=None, since_xid=None, limit=None,
+                            since=None, until=None, xaction=None,
+                            reverse=False, before_xid=None):
+        """
+        Returns a list of (xid, root, time, xaction, xdata) tuples, with
+        the same arguments as swarmlib.db.queries.get_transaction_log
+        """
+        xlog = []
+        if limit is not None and limit <= 0:
+            return xlog
+        for entry in self._entries(issue, since_xid, since, until, xaction,
+                                   reverse, before_xid):
+            xlog.append(entry)
+            if limit is not None and len(xlog) >= limit:
+                break
+        return xlog
@@ -37,3 +37,18 @@ class SchemeNotFoundError(_SwarmException):
     post_message = \
         _("During the connection, the specified scheme could not be found")
     pass
+
+class BackendNotAvailableError(_SwarmException):
+    post_message = \
+        _("The storage backend configured for this hive is not installed")
+    pass
+
+class HiveServerError(_SwarmException):
+    post_message = \
+        _("A call to the hive server failed")
+    pass
+
+class BatchFormatError(_SwarmException):
+    post_message = \
+        _("A replication stream frame could not be read")
+    pass
@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+
+# Copyright 2007 Sam Hart
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+# Author: Sam Hart
+
+# The hive pool keeps Swarm instances open between uses instead of opening
+# and closing them every time, for long running processes (see
+# swarmlib.swarmd) which serve many commands against the same few hives.
+#
+# A pool is given the function which opens a hive for a key (for swarmd,
+# Swarm(path, log) for a hive path). acquire() hands out an idle hive for
+# the key if there is one, or opens a new one; release() gives it back. At
+# most size idle hives are kept, the least recently used are closed first,
+# and expire() closes any idle for longer than the idle timeout.
+#
+# Something other than the pool's own user may change a hive under it (a
+# 'swarm' run without the daemon, for one). If the pool is given a stamp
+# function, an idle hive is only reused while the stamp of its key is
+# what it was when the hive was released, and reopened otherwise.
+
+import time
+import threading
+from collections import OrderedDict
+
+# How many idle hives a pool keeps
+__POOL_SIZE__ = 8
+
+# Seconds an idle hive is kept for
+__IDLE_TIMEOUT__ = 600
+
+class hive_pool:
+    def __init__(self, opener, log, size=__POOL_SIZE__,
+                 idle=__IDLE_TIMEOUT__, stamp=None):
+        """
+        opener == Function opening a hive for a key. The hives must have
+                  a close() method.
+        log == The log instance
+        size == How many idle hives to keep
+        idle == Seconds an idle hive is kept for
+        stamp == Optional function returning a value for a key which
+                 changes whenever its hives must be reopened
+        """
+        self._opener = opener
+        self._stamp = stamp
+        self.size = size
+        self.idle = idle
+        self._logger = log.get_logger("hive_pool")
+        # key -> (hive, stamp, release time), least recent first
+        self._idle = OrderedDict()
+        # id(hive) -> (key, hive)
+        self._leased = {}
+        self._lock = threading.Lock()
+
+    def _close(self, key, hive):
+        self._logger.entry("Closing hive '%s'" % key, 2)
+        hive.close()
+
+    def acquire(self, key):
+        """
+        Returns a hive for key, reusing an idle one if possible
+        """
+        self._logger.register("acquire")
+        self._lock.acquire()
+        try:
+            entry = self._idle.pop(key, None)
+        finally:
+            self._lock.release()
+        hive = None
+        if entry is not None:
+            (hive, stamp, released) = entry
+            if self._stamp and self._stamp(key) != stamp:
+                self._logger.entry("'%s' changed since it was last used" % key, 2)
+                self._close(key, hive)
+                hive = None
+        if hive is None:
+            self._logger.entry("Opening hive '%s'" % key, 2)
+            hive = self._opener(key)
+        self._lock.acquire()
+        try:
+            self._leased[id(hive)] = (key, hive)
+        finally:
+            self._lock.release()
+        self._logger.unregister()
+        return hive
+
+    def release(self, hive, keep=True):
+        """
+        Give back a hive from acquire(). It is closed rather than kept if
+        keep is False.
+        """
+        self._lock.acquire()
+        try:
+            (key, hive) = self._leased.pop(id(hive))
+            if not keep:
+                evicted = [(key, hive)]
+            else:
+                stamp = None
+                if self._stamp:
+                    stamp = self._stamp(key)
+                evicted = []
+                if key in self._idle:
+                    # Only one idle hive per key is worth keeping
+                    evicted.append((key, self._idle.pop(key)[0]))
+                self._idle[key] = (hive, stamp, time.time())
+                while len(self._idle) > self.size:
+                    (old_key, entry) = self._idle.popitem(last=False)
+                    evicted.append((old_key, entry[0]))
+        finally:
+            self._lock.release()
+        for (old_key, old_hive) in evicted:
+            self._close(old_key, old_hive)
+
+    def discard_leased(self):
+        """
+        Close every hive which was acquired and never released, e.g. because
+        whatever had it failed part way through
+        """
+        self._lock.acquire()
+        try:
+            leased = self._leased.values()
+            self._leased = {}
+        finally:
+            self._lock.release()
+        for (key, hive) in leased:
+            self._close(key, hive)
+
+    def expire(self):
+        """
+        Close the hives idle for longer than the idle timeout
+        """
+        cutoff = time.time() - self.idle
+        self._lock.acquire()
+        try:
+            expired = [(key, entry[0]) for (key, entry) in self._idle.items()
+                       if entry[2] < cutoff]
+            for (key, hive) in expired:
+                del self._idle[key]
+        finally:
+            self._lock.release()
+        for (key, hive) in expired:
+            self._close(key, hive)
+
+    def close(self):
+        """
+        Close every hive, idle or not
+        """
+        self.discard_leased()
+        self._lock.acquire()
+        try:
+            idle = [(key, entry[0]) for (key, entry) in self._idle.items()]
+            self._idle = OrderedDict()
+        finally:
+            self._lock.release()
+        for (key, hive) in idle:
+            self._close(key, hive)
@@ -0,0 +1,651 @@
+#!/usr/bin/env python
+
+# Copyright 2007 Sam Hart
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+# Author: Sam Hart
+
+# The hive server puts a hive behind a socket so that many clients can use
+# it at once without each opening its files, and without writers fighting
+# over the store. It serves these Swarm calls:
+#   get_issue(ticket_number, hash_id)   get_node(node_id)
+#   get_lineage(issue_id)               get_transaction_log(issue, since_xid, limit)
+#   new_issue(data)                     add_node(data, parent_id)
+# where get_lineage returns the (parent_id, child_id) edges of an issue's
+# thread, and get_transaction_log a list of log entries. For clones and
+# pulls from other hosts (see swarmlib.remote) there are also
+#   get_issues(hash_ids)    get_nodes(node_ids)
+#   get_upstream_tracker(tracker_id)    hive_info()
+#   stream_replication(issue, since_xid, chunk_size, codecs)
+#   stream_objects(object_ids)
+#
+# The server is one process with one event loop (asyncore), holding the
+# only open copy of the hive. Reads are answered as they arrive, from all
+# clients interleaved. Writes, new_issue and add_node, are queued and run
+# one after another by the loop, once the reads in hand are done; the
+# whole batch is then committed together before any of it is answered.
+# A write which fails may have changed the hive part way, so the batch is
+# rolled back and run again without it, and a batch whose commit fails is
+# rolled back and every write in it answered with the error. A
+# client's reads after a write wait until that write has been committed,
+# so it always reads its own writes, while its writes in a row go into
+# the same batch.
+#
+# The protocol is lines of JSON. A request is
+#   {"id" : n, "op" : call name, "args" : [arguments]}
+# and is answered with
+#   {"id" : n, "result" : return value}  or  {"id" : n, "error" : message}
+# Requests may be pipelined: a client can send any number before reading
+# the answers, which come back in the order the requests were sent.
+#
+# stream_replication answers with a stream instead: the transaction log
+# after since_xid, a chunk at a time, each chunk sent as
+#   {"id" : n, "batch" : length}
+# followed by a length byte frame (see swarmlib.batch_format) of the
+# chunk's log entries and the issues and nodes they create (what
+# replication would otherwise look up one by one), and then
+# {"id" : n, "result" : total}. The server sends chunks as fast as the
+# client takes them, without waiting to be asked for each, so a whole
+# clone is one round trip. Frames are compressed with the codec set by
+# 'compression' in the 'replicate' section of the hive's swarmrc (zlib if
+# unset), as long as it is one of the codecs the client says it can read;
+# otherwise zlib, or nothing.
+#
+# stream_objects answers the same way with the attachment objects (see
+# swarmlib.objects) the hive has of object_ids, read from disk and sent a
+# piece at a time, each piece as {"id" : n, "batch" : length, "object" :
+# object id} and its bytes, and then {"id" : n, "result" : objects sent}.
+#
+# Messages carry byte strings which aren't ASCII as {"__bytes__" :
+# base64}, the same as batches (see to_wire() in swarmlib.batch_format),
+# so node details and attachments survive whatever they hold and text
+# stays text.
+#
+# The socket is .swarm/hive.sock in the hive, unless the server is told to
+# listen on TCP instead. Nothing authenticates TCP clients, so over TCP the
+# server is read only: it answers the reads and streams clones and pulls
+# use, and refuses new_issue and add_node. 'swarm+unix:///path/to/hive' URLs reach it (see
+# swarmlib.connect.schemes.unix).
+
+import os
+import json
+import errno
+import socket
+import asyncore
+import asynchat
+from collections import deque
+
+from swarmlib.exceptions import HiveServerError, BatchFormatError
+from swarmlib.replicate import referenced_documents
+from swarmlib.objects import get_store
+from swarmlib.batch_format import batch_writer, codecs, to_wire, from_wire, \
+                                  __DEFAULT_CODEC__, __DEFAULT_LEVEL__
+
+__SOCKET_NAME__ = 'hive.sock'
+
+# Seconds the event loop waits for something to happen
+__POLL_TIMEOUT__ = 30.0
+
+# Longest request line accepted, in bytes
+__MAX_REQUEST__ = 16 * 1024 * 1024
+
+__READ_OPS__ = ('get_issue', 'get_node', 'get_lineage', 'get_transaction_log',
+                'get_issues', 'get_nodes', 'get_upstream_tracker', 'hive_info')
+__WRITE_OPS__ = ('new_issue', 'add_node')
+__STREAM_OPS__ = ('stream_replication', 'stream_objects')
+
+# Log entries per stream_replication chunk, unless the client asks
+__STREAM_CHUNK_SIZE__ = 1000
+
+def socket_path(hive_dir):
+    """
+    Returns the path of the hive server socket of the hive in hive_dir
+    """
+    return "%s/.swarm/%s" % (hive_dir, __SOCKET_NAME__)
+
+def encode_message(message):
+    return json.dumps(to_wire(message)) + "\n"
+
+def decode_message(line):
+    return from_wire(json.loads(line))
+
+def _choose_codec(config, accepted):
+    """
+    Returns the codec a stream is sent with: the hive's choice if the
+    client can read it, else the default if it can, else none
+    """
+    codec = __DEFAULT_CODEC__
+    if config.has_option('replicate', 'compression'):
+        codec = config.get('replicate', 'compression')
+    if accepted is None:
+        # Clients from before codecs were negotiated only read zlib
+        accepted = [__DEFAULT_CODEC__]
+    for choice in (codec, __DEFAULT_CODEC__):
+        if choice in accepted and choice in codecs:
+            return choice
+    return 'none'
+
+class _replication_producer:
+    """
+    Produces the answer to a stream_replication request a chunk at a time,
+    as the client's connection has room for it (an asynchat producer)
+    """
+    def __init__(self, sw, logger, request_id, issue=None, since_xid=None,
+                 chunk_size=None, accepted=None):
+        self.sw = sw
+        self.logger = logger
+        self.request_id = request_id
+        self.total = 0
+        self.done = False
+        self._chunks = sw.iter_transaction_log(issue=issue,
+            since_xid=since_xid, chunk_size=chunk_size or __STREAM_CHUNK_SIZE__)
+        self._writer = batch_writer(_choose_codec(sw.config, accepted),
+                                    __DEFAULT_LEVEL__)
+
+    def more(self):
+        if self.done:
+            return ''
+        try:
+            chunk = self._chunks.next()
+            (issues, nodes) = referenced_documents(self.sw, chunk)
+        except StopIteration:
+            self.done = True
+            return encode_message({'id' : self.request_id, 'result' : self.total})
+        except Exception, e:
+            self.logger.error("'stream_replication' failed: %s" % e)
+            self.done = True
+            return encode_message({'id' : self.request_id, 'error' : str(e)})
+        self.total = self.total + len(chunk)
+        frame = self._writer.frame(chunk, issues, nodes)
+        return encode_message({'id' : self.request_id,
+                               'batch' : len(frame)}) + frame
+
+class _object_producer:
+    """
+    Produces the answer to a stream_objects request a piece of an object
+    at a time (an asynchat producer), so no object is ever held whole
+    """
+    def __init__(self, store, logger, request_id, object_ids):
+        self.store = store
+        self.logger = logger
+        self.request_id = request_id
+        self.total = 0
+        self.done = False
+        self._pieces = self._read(list(object_ids))
+
+    def _read(self, object_ids):
+        for object_id in object_ids:
+            if not self.store.has(object_id):
+                continue
+            self.total = self.total + 1
+            empty = True
+            for data in self.store.iter_chunks(object_id):
+                empty = False
+                yield (object_id, data)
+            if empty:
+                yield (object_id, '')
+
+    def more(self):
+        if self.done:
+            return ''
+        try:
+            (object_id, data) = self._pieces.next()
+        except StopIteration:
+            self.done = True
+            return encode_message({'id' : self.request_id, 'result' : self.total})
+        except Exception, e:
+            self.logger.error("'stream_objects' failed: %s" % e)
+            self.done = True
+            return encode_message({'id' : self.request_id, 'error' : str(e)})
+        return encode_message({'id' : self.request_id, 'batch' : len(data),
+                               'object' : object_id}) + data
+
+class _channel(asynchat.async_chat):
+    """
+    One client connection: collects its request lines and sends back the
+    answers
+    """
+    def __init__(self, server, sock):
+        asynchat.async_chat.__init__(self, sock, map=server.map)
+        self.server = server
+        self.set_terminator("\n")
+        self._incoming = []
+        self._incoming_size = 0
+        self.requests = deque()
+        # Set while a write of this client's is waiting to be committed
+        self.blocked = False
+
+    def collect_incoming_data(self, data):
+        self._incoming.append(data)
+        self._incoming_size = self._incoming_size + len(data)
+        if self._incoming_size > __MAX_REQUEST__:
+            self.server.logger.error("Request too long, dropping the client")
+            self.handle_close()
+
+    def found_terminator(self):
+        line = ''.join(self._incoming)
+        self._incoming = []
+        self._incoming_size = 0
+        if line.strip():
+            try:
+                request = decode_message(line)
+                request['op']
+            except (ValueError, KeyError, TypeError, BatchFormatError):
+                request = None
+            self.requests.append(request)
+
+    def ready(self):
+        """
+        Whether the next request can be handled now: anything can unless
+        a write is waiting, and then only more writes, which the writer
+        runs after it
+        """
+        if not self.requests:
+            return False
+        if not self.blocked:
+            return True
+        request = self.requests[0]
+        return request is not None and request['op'] in __WRITE_OPS__
+
+    def respond(self, reply):
+        if self.connected:
+            self.push(encode_message(reply))
+
+    def respond_with(self, producer):
+        if self.connected:
+            self.push_with_producer(producer)
+
+    def handle_close(self):
+        self.close()
+        self.server.drop_channel(self)
+
+class hive_server(asyncore.dispatcher):
+    def __init__(self, sw, log, path=None, address=None):
+        """
+        sw == The Swarm instance of the hive to serve
+        log == The log instance
+        path == The Unix socket to listen on, the hive's own if neither
+                this nor address is given
+        address == (host, port) to listen on TCP instead
+        """
+        self.sw = sw
+        self.log = log
+        self.logger = log.get_logger("hive_server")
+        self.map = {}
+        asyncore.dispatcher.__init__(self, map=self.map)
+        self.channels = []
+        # (channel, request id, op, args) waiting for the writer
+        self.writes = []
+        self.running = False
+        # Which calls clients may make
+        self.ops = __READ_OPS__ + __STREAM_OPS__ + __WRITE_OPS__
+
+        if address is None:
+            if path is None:
+                path = socket_path(sw.config.project_root)
+            self.path = path
+            self._remove_stale_socket(path)
+            self.create_socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            umask = os.umask(0077)
+            try:
+                self.bind(path)
+            finally:
+                os.umask(umask)
+            self.where = path
+        else:
+            self.path = None
+            self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.set_reuse_addr()
+            self.bind(address)
+            self.where = "%s:%i" % self.socket.getsockname()
+            self.ops = __READ_OPS__ + __STREAM_OPS__
+        self.listen(socket.SOMAXCONN)
+
+    def _remove_stale_socket(self, path):
+        if not os.path.exists(path):
+            return
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(path)
+        except socket.error:
+            # Nobody is listening, a server didn't shut down cleanly
+            os.remove(path)
+        else:
+            probe.close()
+            raise socket.error(errno.EADDRINUSE, "The hive is already served on '%s'" % path)
+
+    def handle_accept(self):
+        pair = self.accept()
+        if pair is not None:
+            self.channels.append(_channel(self, pair[0]))
+
+    def drop_channel(self, channel):
+        if channel in self.channels:
+            self.channels.remove(channel)
+
+    # The calls
+
+    def _get_lineage(self, issue_id):
+        (nodes, edges) = self.sw.get_thread(issue_id)
+        return edges
+
+    def _get_transaction_log(self, issue=None, since_xid=None, limit=None):
+        entries = []
+        for page in self.sw.iter_transaction_log(issue=issue,
+                since_xid=since_xid, limit=limit):
+            entries.extend(page)
+        return entries
+
+    def _hive_info(self):
+        return {'path' : self.sw.config.project_root,
+                'project_name' : self.sw.config.get('main', 'project_name', 'swarm')}
+
+    def _add_node(self, data, parent_id):
+        # The attachment goes into the object store, the node row only
+        # keeps a reference to it
+        if data.get('node'):
+            data = dict(data)
+            data['node'] = get_store(self.sw, self.log).store_attachment(data['node'])
+        return self.sw.add_node(data, parent_id)
+
+    def _call(self, op, args):
+        if op == 'add_node':
+            return self._add_node(*args)
+        if op == 'get_lineage':
+            return self._get_lineage(*args)
+        if op == 'get_transaction_log':
+            return self._get_transaction_log(*args)
+        if op == 'hive_info':
+            return self._hive_info()
+        return getattr(self.sw, op)(*args)
+
+    # The loop
+
+    def _handle(self, channel, request):
+        """
+        Answer a read straight away, queue a write for the writer
+        """
+        if request is None:
+            channel.respond({'id' : None, 'error' : "Bad request"})
+            return
+        request_id = request.get('id')
+        op = request['op']
+        args = request.get('args', [])
+        if op in __WRITE_OPS__ and op not in self.ops:
+            channel.respond({'id' : request_id, 'error' : "'%s' isn't allowed on '%s'" % (op, self.where)})
+        elif op in __WRITE_OPS__:
+            self.writes.append((channel, request_id, op, args))
+            channel.blocked = True
+        elif op in __READ_OPS__:
+            channel.respond(self._run(request_id, op, args))
+        elif op in __STREAM_OPS__:
+            try:
+                if op == 'stream_objects':
+                    producer = _object_producer(get_store(self.sw, self.log),
+                                                self.logger, request_id, *args)
+                else:
+                    producer = _replication_producer(self.sw, self.logger,
+                                                     request_id, *args)
+            except TypeError:
+                channel.respond({'id' : request_id, 'error' : "Bad arguments for '%s'" % op})
+            else:
+                channel.respond_with(producer)
+        else:
+            channel.respond({'id' : request_id, 'error' : "Unknown call '%s'" % op})
+
+    def _run(self, request_id, op, args):
+        try:
+            return {'id' : request_id, 'result' : self._call(op, args)}
+        except Exception, e:
+            self.logger.error("'%s' failed: %s" % (op, e))
+            return {'id' : request_id, 'error' : str(e)}
+
+    def _write(self):
+        """
+        Run every queued write in order, commit them together and only
+        then answer them. When a write fails, what the batch did so far is
+        rolled back and the batch is run again without that write.
+        """
+        backend = self.sw.db.backend
+        writes = self.writes
+        self.writes = []
+        # Index in writes -> the error answer of a write which failed
+        failed = {}
+        while True:
+            replies = {}
+            for (i, (channel, request_id, op, args)) in enumerate(writes):
+                if i in failed:
+                    continue
+                reply = self._run(request_id, op, args)
+                if 'error' in reply:
+                    failed[i] = reply
+                    break
+                replies[i] = reply
+            else:
+                break
+            backend.rollback()
+        try:
+            backend.commit()
+        except Exception, e:
+            self.logger.error("Commit failed: %s" % e)
+            backend.rollback()
+            for i in replies.keys():
+                replies[i] = {'id' : replies[i]['id'], 'error' : "Commit failed: %s" % e}
+        replies.update(failed)
+        for (i, (channel, request_id, op, args)) in enumerate(writes):
+            channel.blocked = False
+            channel.respond(replies[i])
+
+    def _dispatch(self):
+        """
+        Work through the requests in hand, a request per client at a time
+        so that none of them waits on another's pipeline
+        """
+        progress = True
+        while progress:
+            progress = False
+            for channel in list(self.channels):
+                if channel.ready():
+                    self._handle(channel, channel.requests.popleft())
+                    # Writes in a row join the same batch
+                    while channel.blocked and channel.ready():
+                        self._handle(channel, channel.requests.popleft())
+                    progress = True
+            if self.writes:
+                self._write()
+                progress = True
+
+    def serve(self):
+        """
+        Serve until stop() or interrupted
+        """
+        self.logger.register("serve")
+        self.logger.entry("Serving the hive on '%s'" % self.where, 0)
+        self.running = True
+        try:
+            try:
+                while self.running:
+                    asyncore.loop(__POLL_TIMEOUT__, map=self.map, count=1)
+                    self._dispatch()
+            except KeyboardInterrupt:
+                self.logger.entry("Shutting down", 0)
+        finally:
+            for channel in list(self.channels):
+                channel.close()
+            self.close()
+            if self.path and os.path.exists(self.path):
+                os.remove(self.path)
+        self.logger.unregister()
+
+    def stop(self):
+        self.running = False
+
+class hive_client:
+    def __init__(self, sock):
+        """
+        A connection to a hive server
+        sock == The connected socket
+        """
+        self._sock = sock
+        self._fp = sock.makefile('rb')
+        self._next_id = 1
+
+    def _send(self, requests):
+        ids = []
+        lines = []
+        for (op, args) in requests:
+            ids.append(self._next_id)
+            lines.append(encode_message({'id' : self._next_id, 'op' : op,
+                                         'args' : list(args)}))
+            self._next_id = self._next_id + 1
+        self._sock.sendall(''.join(lines))
+        return ids
+
+    def _receive(self, request_id):
+        line = self._fp.readline()
+        if not line:
+            raise HiveServerError("The hive server closed the connection")
+        reply = decode_message(line)
+        if reply.get('id') != request_id:
+            raise HiveServerError("Answer for request '%s' when waiting for '%s'" % (reply.get('id'), request_id))
+        if 'error' in reply:
+            raise HiveServerError(reply['error'])
+        return reply.get('result')
+
+    def call(self, op, *args):
+        """
+        Make one call and wait for its result
+        """
+        [request_id] = self._send([(op, args)])
+        return self._receive(request_id)
+
+    def pipeline(self, requests):
+        """
+        Send every (op, args) in requests before reading any answer,
+        returning the results in order. The first failed call raises
+        HiveServerError (after every answer has been read).
+        """
+        ids = self._send(requests)
+        results = []
+        error = None
+        for request_id in ids:
+            try:
+                results.append(self._receive(request_id))
+            except HiveServerError, e:
+                if error is None:
+                    error = e
+                results.append(None)
+        if error is not None:
+            raise error
+        return results
+
+    def stream(self, op, *args):
+        """
+        Generator over the chunks of a streamed answer (see
+        stream_replication), as the frames sent. Returns the final result
+        through the 'result' attribute once it is exhausted.
+        """
+        for (reply, payload) in self.stream_replies(op, *args):
+            yield payload
+
+    def stream_replies(self, op, *args):
+        """
+        Like stream(), but generates (reply, payload) for each chunk, where
+        reply is the line which announced it
+        """
+        [request_id] = self._send([(op, args)])
+        self.result = None
+        while True:
+            line = self._fp.readline()
+            if not line:
+                raise HiveServerError("The hive server closed the connection")
+            reply = decode_message(line)
+            if reply.get('id') != request_id:
+                raise HiveServerError("Answer for request '%s' when waiting for '%s'" % (reply.get('id'), request_id))
+            if 'error' in reply:
+                raise HiveServerError(reply['error'])
+            if 'batch' not in reply:
+                self.result = reply.get('result')
+                return
+            payload = self._fp.read(reply['batch'])
+            if len(payload) < reply['batch']:
+                raise HiveServerError("The hive server closed the connection")
+            yield (reply, payload)
+
+    def get_issue(self, ticket_number, hash_id=None):
+        return self.call('get_issue', ticket_number, hash_id)
+
+    def get_node(self, node_id):
+        return self.call('get_node', node_id)
+
+    def get_lineage(self, issue_id):
+        return self.call('get_lineage', issue_id)
+
+    def get_transaction_log(self, issue=None, since_xid=None, limit=None):
+        return self.call('get_transaction_log', issue, since_xid, limit)
+
+    def new_issue(self, data):
+        return self.call('new_issue', data)
+
+    def add_node(self, data, parent_id):
+        return self.call('add_node', data, parent_id)
+
+    def close(self):
+        self._fp.close()
+        self._sock.close()
+
+def connect_unix(path):
+    """
+    Returns a hive_client for the server on the Unix socket path
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except socket.error, e:
+        sock.close()
+        raise HiveServerError("Can't reach a hive server on '%s': %s" % (path, e))
+    return hive_client(sock)
+
+def connect_tcp(host, port):
+    """
+    Returns a hive_client for the server at host:port
+    """
+    try:
+        sock = socket.create_connection((host, port))
+    except socket.error, e:
+        raise HiveServerError("Can't reach a hive server on '%s:%s': %s" % (host, port, e))
+    return hive_client(sock)
+
+class remote_config:
+    def __init__(self, info):
+        """
+        The little of a served hive's config which is visible to clients
+        (the 'main' section's project_name), with the same lookups as
+        swarmlib.config.Config
+        info == The hive_info() of the server
+        """
+        self._main = {'project_name' : info.get('project_name')}
+
+    def get(self, section, setting, config_region=None):
+        if section == 'main':
+            return self._main.get(setting)
+        return None
+
+    def has_section(self, section, config_region=None):
+        return section == 'main'
+
+    def has_option(self, section, setting, config_region=None):
+        return section == 'main' and self._main.get(setting) is not None
@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+
+# lineage - In-memory node lineage for an issue
+#
+# Copyright 2007 Sam Hart
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+# Author: Sam Hart
+
+import threading
+from collections import OrderedDict
+
+from swarmlib.util import get_node_id
+
+# The default number of full nodes a node_cache keeps
+__CACHE_SIZE__ = 64
+
+class node_dag:
+    def __init__(self, nodes, edges):
+        """
+        The node DAG (the thread) of an issue, with adjacency lists in both
+        directions, as returned by Swarm.get_thread(). The nodes are only
+        headers (no details or attachment), see node_cache for the rest.
+        nodes == list of node dicts
+        edges == list of (parent_id, child_id) tuples
+        """
+        self.nodes = {}
+        self.parents = {}
+        self.children = {}
+        for node in nodes:
+            self.nodes[get_node_id(node)] = node
+        for (parent_id, child_id) in edges:
+            self.children.setdefault(parent_id, []).append(child_id)
+            self.parents.setdefault(child_id, []).append(parent_id)
+
+    def get_node(self, node_id):
+        """
+        Returns the node dict for node_id, or None if it isn't in the issue
+        """
+        return self.nodes.get(node_id)
+
+    def get_parents(self, node_id):
+        """
+        Returns the parent node dicts of node_id
+        """
+        return [self.nodes[p] for p in self.parents.get(node_id, [])
+                if p in self.nodes]
+
+    def get_children(self, node_id):
+        """
+        Returns the child node dicts of node_id
+        """
+        return [self.nodes[c] for c in self.children.get(node_id, [])
+                if c in self.nodes]
+
+class node_cache:
+    def __init__(self, sw, log, size=__CACHE_SIZE__, background=False):
+        """
+        A least recently used cache of full nodes
+        sw == The Swarm instance to fetch nodes from
+        log == The log instance
+        size == How many nodes to keep
+        background == Whether prefetch() should fetch in a background
+                      thread. Only turn it on for backends which can be
+                      used from more than one thread (sqlite connections
+                      can't).
+        """
+        self.sw = sw
+        self.size = size
+        self.background = background
+        self.logger = log.get_logger("node_cache")
+        self._nodes = OrderedDict()
+        # Guards both the cache and the Swarm instance, which is shared
+        # with the prefetch thread
+        self._lock = threading.Lock()
+        self._prefetcher = None
+
+    def _add(self, node):
+        """
+        Add a node to the cache, dropping the least recently used node if
+        it is full. Must hold self._lock.
+        """
+        self._nodes.pop(get_node_id(node), None)
+        self._nodes[get_node_id(node)] = node
+        while len(self._nodes) > self.size:
+            self._nodes.popitem(last=False)
+
+    def get(self, node_id):
+        """
+        Returns the full node dict for node_id, fetching it if it isn't
+        cached
+        """
+        self._lock.acquire()
+        try:
+            node = self._nodes.pop(node_id, None)
+            if node:
+                self.logger.entry("Cache hit for node '%s'" % node_id, 5)
+            else:
+                [node] = self.sw.get_node(node_id)
+            self._add(node)
+        finally:
+            self._lock.release()
+        return node
+
+    def prefetch(self, node_ids):
+        """
+        Fetch the nodes in node_ids which aren't cached yet, with one bulk
+        lookup, so they are there by the time they are asked for
+        """
+        if self._prefetcher and self._prefetcher.isAlive():
+            # Don't queue up behind a slow hive, the next prefetch will
+            # catch up with whatever this one misses
+            return
+        if self.background:
+            self._prefetcher = threading.Thread(target=self._prefetch,
+                                                args=(node_ids,))
+            self._prefetcher.setDaemon(True)
+            self._prefetcher.start()
+        else:
+            self._prefetch(node_ids)
+
+    def _prefetch(self, node_ids):
+        self._lock.acquire()
+        try:
+            missing = [n for n in node_ids if n not in self._nodes]
+            if missing:
+                self.logger.entry("Prefetching '%i' nodes" % len(missing), 5)
+                for node in self.sw.get_nodes(missing):
+                    self._add(node)
+        finally:
+            self._lock.release()
@@ -0,0 +1,314 @@
+#!/usr/bin/env python
+
+# Copyright 2007 Sam Hart
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+# Author: Sam Hart
+
+# The object store keeps node attachments outside the node rows, so that a
+# big attachment (a log file, a core dump) isn't read and copied with
+# every node. It is a content addressed store in .swarm/objects: each
+# attachment is a file named by the sha1 of its contents, in a directory
+# named by the first two hex digits, much like git's loose objects. A node
+# then holds only a reference, 'object:<sha1>', in its attachment column.
+# Nodes written before the store still have their attachment inline, and
+# load_attachment() reads either kind.
+#
+# Objects are written through a temporary file in the store, hashed as
+# they are written, and renamed into place once complete, so a reader
+# never sees half an object. Reads go through open(), which streams,
+# or map(), which mmaps the file. Nothing is ever read into memory whole
+# unless read() is asked for.
+#
+# Since an object's name is its contents, two hives holding the same name
+# hold the same bytes, and replication copies only the objects the
+# destination doesn't have yet (see copy_objects()).
+
+import os
+import re
+import mmap
+import errno
+import hashlib
+import tempfile
+
+__OBJECTS_DIR__ = 'objects'
+__REFERENCE_PREFIX__ = 'object:'
+
+# Bytes per read or write when streaming an object
+__CHUNK_SIZE__ = 64 * 1024
+
+_object_id = re.compile('^[0-9a-f]{40}$')
+
+def is_reference(value):
+    """
+    Returns True if value (a node's attachment) refers to a stored object
+    """
+    return isinstance(value, str) and value.startswith(__REFERENCE_PREFIX__) \
+        and _object_id.match(value[len(__REFERENCE_PREFIX__):]) is not None
+
+def make_reference(object_id):
+    return __REFERENCE_PREFIX__ + object_id
+
+def reference_id(value):
+    """
+    Returns the object id value refers to, or None if it isn't a reference
+    """
+    if is_reference(value):
+        return value[len(__REFERENCE_PREFIX__):]
+    return None
+
+def node_references(nodes):
+    """
+    Returns the ids of the objects the attachments of nodes refer to
+    """
+    ids = []
+    for node in nodes:
+        object_id = reference_id(node.get('attachment'))
+        if object_id is not None and object_id not in ids:
+            ids.append(object_id)
+    return ids
+
+class object_writer:
+    def __init__(self, store):
+        """
+        Writes one object into store, hashing it as it goes. Call commit()
+        once everything is written, or abort() to throw it away.
+        """
+        self._store = store
+        self._hash = hashlib.sha1()
+        (fd, self._temp_path) = tempfile.mkstemp(prefix='tmp-', dir=store.path)
+        self._fp = os.fdopen(fd, 'wb')
+        self.size = 0
+
+    def write(self, data):
+        self._hash.update(data)
+        self._fp.write(data)
+        self.size = self.size + len(data)
+
+    def commit(self, expected=None):
+        """
+        Move the object into place and return its id. If expected is given
+        and the contents don't hash to it, the object is thrown away and
+        ValueError raised.
+        """
+        object_id = self._hash.hexdigest()
+        self._fp.flush()
+        os.fsync(self._fp.fileno())
+        self._fp.close()
+        if expected is not None and object_id != expected:
+            os.remove(self._temp_path)
+            raise ValueError("Object '%s' arrived with the contents of '%s'" % (expected, object_id))
+        path = self._store.path_of(object_id)
+        if os.path.exists(path):
+            # Already there, and by its name, the same
+            os.remove(self._temp_path)
+        else:
+            self._store._make_dir(os.path.dirname(path))
+            os.chmod(self._temp_path, 0444)
+            os.rename(self._temp_path, path)
+        return object_id
+
+    def abort(self):
+        if not self._fp.closed:
+            self._fp.close()
+        if os.path.exists(self._temp_path):
+            os.remove(self._temp_path)
+
+class object_store:
+    def __init__(self, path, log):
+        """
+        path == The directory of the store, usually .swarm/objects
+        log == The log instance
+        """
+        self.path = path
+        self._logger = log.get_logger("object_store")
+
+    def _make_dir(self, path):
+        try:
+            os.makedirs(path)
+        except OSError, e:
+            if e.errno != errno.EEXIST:
+                raise
+
+    def path_of(self, object_id):
+        if not _object_id.match(object_id or ''):
+            raise ValueError("'%s' is not an object id" % object_id)
+        return os.path.join(self.path, object_id[:2], object_id[2:])
+
+    def has(self, object_id):
+        return os.path.exists(self.path_of(object_id))
+
+    def missing(self, object_ids):
+        """
+        Returns the ids in object_ids which aren't in the store
+        """
+        return [object_id for object_id in object_ids if not self.has(object_id)]
+
+    def size(self, object_id):
+        return os.path.getsize(self.path_of(object_id))
+
+    def writer(self):
+        """
+        Returns an object_writer for a new object
+        """
+        self._make_dir(self.path)
+        return object_writer(self)
+
+    def put(self, data):
+        """
+        Store the string data, returning its object id
+        """
+        writer = self.writer()
+        try:
+            writer.write(data)
+            return writer.commit()
+        except:
+            writer.abort()
+            raise
+
+    def put_file(self, fp, expected=None):
+        """
+        Store the contents of the file object fp, a chunk at a time,
+        returning the object id (see object_writer.commit for expected)
+        """
+        writer = self.writer()
+        try:
+            while True:
+                data = fp.read(__CHUNK_SIZE__)
+                if not data:
+                    break
+                writer.write(data)
+            return writer.commit(expected)
+        except:
+            writer.abort()
+            raise
+
+    def open(self, object_id):
+        """
+        Returns the object as a file object open for reading
+        """
+        return open(self.path_of(object_id), 'rb')
+
+    def map(self, object_id):
+        """
+        Returns the object mmapped read only, so it is paged in as it is
+        used. An empty object, which can't be mapped, comes back as ''.
+        """
+        fp = self.open(object_id)
+        try:
+            if os.fstat(fp.fileno()).st_size == 0:
+                return ''
+            return mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        finally:
+            # The mapping outlives the file
+            fp.close()
+
+    def iter_chunks(self, object_id, chunk_size=__CHUNK_SIZE__):
+        """
+        Generator over the object, chunk_size bytes at a time
+        """
+        fp = self.open(object_id)
+        try:
+            while True:
+                data = fp.read(chunk_size)
+                if not data:
+                    break
+                yield data
+        finally:
+            fp.close()
+
+    def read(self, object_id):
+        """
+        Returns the whole object as a string
+        """
+        data = self.map(object_id)
+        try:
+            return data[:]
+        finally:
+            if data:
+                data.close()
+
+    def copy_from(self, source, object_ids):
+        """
+        Copy the objects in object_ids which this store doesn't have from
+        the object_store source. Returns how many were copied.
+        """
+        if os.path.abspath(source.path) == os.path.abspath(self.path):
+            return 0
+        copied = 0
+        for object_id in self.missing(object_ids):
+            fp = source.open(object_id)
+            try:
+                self.put_file(fp, object_id)
+            finally:
+                fp.close()
+            copied = copied + 1
+        return copied
+
+    # Node attachments
+
+    def store_attachment(self, node):
+        """
+        Returns node with an inline attachment moved into the store and
+        replaced by its reference. Nodes without one, or which already
+        refer to an object, come back as they are.
+        """
+        attachment = node.get('attachment')
+        if not attachment or is_reference(attachment):
+            return node
+        node = dict(node)
+        node['attachment'] = make_reference(self.put(attachment))
+        return node
+
+    def load_attachment(self, node):
+        """
+        Returns the attachment of node as a string, wherever it is kept
+        """
+        attachment = node.get('attachment')
+        object_id = reference_id(attachment)
+        if object_id is None:
+            return attachment
+        return self.read(object_id)
+
+def objects_path(dot_swarm):
+    return os.path.join(dot_swarm, __OBJECTS_DIR__)
+
+def get_store(sw, log):
+    """
+    get_store(sw, log)
+    Returns the object store of the Swarm instance sw, creating it on
+    first use
+    """
+    store = getattr(sw, 'object_store', None)
+    if store is None:
+        store = object_store(objects_path(sw.config.dot_swarm), log)
+        sw.object_store = store
+    return store
+
+def copy_objects(source_sw, dest_sw, object_ids, log):
+    """
+    copy_objects(source_sw, dest_sw, object_ids, log)
+    Copy the objects in object_ids which the destination Swarm instance
+    doesn't have from the source one, which may be a remote hive. Returns
+    how many were copied.
+    """
+    dest = get_store(dest_sw, log)
+    missing = dest.missing(object_ids)
+    if not missing:
+        return 0
+    if getattr(source_sw, 'remote', False):
+        return source_sw.fetch_objects(missing, dest)
+    return dest.copy_from(get_store(source_sw, log), missing)
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+
+# Copyright 2007 Sam Hart
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+# Author: Sam Hart
+
+from swarmlib.replicate import replicate
+from swarmlib.db import __MASTER_ISSUE__
+
+class pull:
+    def __init__(self, source_sw, dest_sw, log, ticket_number=None):
+        """
+        source_sw == The source Swarm instance
+        dest_sw == The destination Swarm instance
+        log == The log instance
+        ticket_number == The ticket to pull, if dest_sw was branched from
+                         source_sw. None if dest_sw was cloned.
+        """
+        self._ticket_number = ticket_number
+        self._source_sw = source_sw
+        self._dest_sw = dest_sw
+        self._log = log
+        self._logger = log.get_logger("pull")
+        self._rep = replicate(self._source_sw, self._dest_sw, self._log)
+
+    def run(self):
+        """
+        Run the pull transaction
+        """
+
+        self._logger.register("run")
+
+        issue_id = self._ticket_number
+        if not issue_id:
+            issue_id = __MASTER_ISSUE__
+
+        # We can only pull from an upstream the dest_sw already tracks (that
+        # is, one it was cloned or branched from). The checkpoint for that
+        # tracker is the high-water mark: the last source xid we have.
+        tracker_id = self._rep.get_tracker_id(issue_id)
+        since_xid = self._rep.get_checkpoint(tracker_id)
+        if not self._rep.has_tracker(tracker_id):
+            self._logger.error("Source hive is not an upstream of this hive, clone or branch it first")
+        elif since_xid is None:
+            self._logger.error("No checkpoint recorded for this upstream, clone or branch it again")
+        else:
+            self._logger.entry("Pulling transactions after '%i'" % since_xid, 1)
+
+            # Only the entries after the high-water mark are fetched, so
+            # the cost of a pull scales with what changed upstream
+            (errors, total) = self._rep.replay(tracker_id, issue=self._ticket_number, since_xid=since_xid)
+
+            if errors > 0:
+                self._logger.error("There were '%i' errors in the pull transaction" % errors)
+                self._logger.error("Re-run the pull to resume from the last checkpoint")
+            elif total:
+                self._logger.entry("Pulled '%i' transactions" % total, 0)
+            else:
+                self._logger.entry("Already up to date", 0)
+
+        self._logger.unregister()
@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+
+# Copyright 2007 Sam Hart
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+# Author: Sam Hart
+
+# A hive on another host, reached over a swarm:// URL, as the source of a
+# clone, branch or pull. remote_hive stands in for the source Swarm
+# instance with the calls replication makes of it, answered by the hive's
+# server (see swarmlib.hive_server).
+#
+# The transaction log comes down as one stream_replication request: the
+# server sends compressed chunks of entries (frames, see
+# swarmlib.batch_format), each together with the issues and nodes those
+# entries create, without waiting to be asked for the next. So replaying
+# a chunk asks the server for nothing more, and a clone costs one round
+# trip however long the log is. The attachment objects of those nodes
+# which the destination lacks follow in one stream_objects request per
+# chunk, straight into its object store.
+
+import os
+import urlparse
+
+import swarmlib.connect as connect
+from swarmlib.connect.schemes.network import __DEFAULT_PORT__
+from swarmlib.exceptions import HiveServerError
+from swarmlib.hive_server import remote_config
+from swarmlib.batch_format import batch_reader, codecs
+from swarmlib.xaction import xaction_dispatch
+from swarmlib.util import get_node_id
+
+class remote_hive:
+    remote = True
+
+    def __init__(self, url, log):
+        """
+        url == The swarm:// URL of the hive
+        log == The log instance
+        """
+        self._hive = urlparse.urlparse(url)
+        if self._hive.port is None:
+            self._hive = urlparse.urlparse("%s://%s:%i%s" % (self._hive.scheme,
+                self._hive.netloc, __DEFAULT_PORT__, self._hive.path))
+        self.url = self._hive.geturl()
+        self._log = log
+        self._logger = log.get_logger("remote_hive")
+        self._logger.register("__init__")
+
+        self._client = self._connect()
+        info = self._client.call('hive_info')
+        if self._hive.path not in ('', '/') and \
+           os.path.normpath(self._hive.path) != os.path.normpath(info['path']):
+            self._client.close()
+            self._logger.unregister()
+            raise HiveServerError("'%s:%s' serves '%s', not '%s'" % (self._hive.hostname, self._hive.port, info['path'], self._hive.path))
+        self.config = remote_config(info)
+        self.xactions = xaction_dispatch()
+        self.xactions.sw = self
+        self.loaded = True
+
+        # The issues and nodes which came with the last chunk of the log
+        self._issues = {}
+        self._nodes = {}
+        self.batches = 0
+        self.bytes_received = 0
+        self.bytes_uncompressed = 0
+
+        self._logger.unregister()
+
+    def _connect(self):
+        return connect.get_connection(self._hive, self._log).get_client()
+
+    def _reconnect(self):
+        # The rest of an abandoned stream is still on its way, so the
+        # connection is no good for anything else
+        self._client.close()
+        self._client = self._connect()
+
+    def get_hive(self):
+        return self._hive
+
+    def iter_transaction_log(self, issue=None, since_xid=None,
+                             chunk_size=None, **filters):
+        """
+        Generator over the source transaction log after since_xid, as
+        lists of (xid, root, time, xaction, xdata) entries. Only the
+        filters replication uses are supported.
+        """
+        self._logger.register("iter_transaction_log")
+        if filters:
+            self._logger.unregister()
+            raise HiveServerError("Can't filter a remote log by %s" % ', '.join(filters.keys()))
+        total = 0
+        reader = batch_reader()
+        # The stream has a connection of its own, so that the calls made
+        # while its chunks are replayed don't queue up behind it
+        client = self._connect()
+        try:
+            for frame in client.stream('stream_replication', issue,
+                                       since_xid, chunk_size,
+                                       sorted(codecs.keys())):
+                (entries, issues, nodes) = reader.read(frame)
+                self.batches = self.batches + 1
+                self.bytes_received = self.bytes_received + len(frame)
+                self.bytes_uncompressed = self.bytes_uncompressed + reader.raw_size
+                self._issues = dict([(i['hash_id'], i) for i in issues])
+                self._nodes = dict([(get_node_id(n), n) for n in nodes])
+                total = total + len(entries)
+                yield entries
+        finally:
+            client.close()
+        self._logger.entry("Received '%i' transactions in '%i' batches, %i bytes (%i uncompressed)" % (total, self.batches, self.bytes_received, self.bytes_uncompressed), 1)
+        self._logger.unregister()
+
+    def fetch_objects(self, object_ids, store):
+        """
+        Fetch the attachment objects object_ids into the object_store
+        store, each written as it arrives. Returns how many were fetched.
+        """
+        fetched = 0
+        writer = None
+        current = None
+        finished = False
+        try:
+            for (reply, piece) in self._client.stream_replies('stream_objects',
+                                                              object_ids):
+                if reply.get('object') != current:
+                    if writer is not None:
+                        writer.commit(current)
+                        fetched = fetched + 1
+                    writer = store.writer()
+                    current = reply.get('object')
+                writer.write(piece)
+            if writer is not None:
+                writer.commit(current)
+                fetched = fetched + 1
+                writer = None
+            finished = True
+        except ValueError, e:
+            raise HiveServerError(str(e))
+        finally:
+            if writer is not None:
+                writer.abort()
+            if not finished:
+                self._reconnect()
+        if fetched < len(object_ids):
+            raise HiveServerError("The hive server is missing '%i' attachment objects" % (len(object_ids) - fetched))
+        return fetched
+
+    def _get_many(self, cache, op, ids):
+        found = [cache[i] for i in ids if i in cache]
+        missing = [i for i in set(ids) if i not in cache]
+        if missing:
+            found.extend(self._client.call(op, missing))
+        return found
+
+    def get_issues(self, hash_ids):
+        return self._get_many(self._issues, 'get_issues', hash_ids)
+
+    def get_nodes(self, node_ids):
+        return self._get_many(self._nodes, 'get_nodes', node_ids)
+
+    def get_issue(self, ticket_number, hash_id=None):
+        if hash_id in self._issues:
+            return [self._issues[hash_id]]
+        return self._client.get_issue(ticket_number, hash_id)
+
+    def get_node(self, node_id):
+        if node_id in self._nodes:
+            return [self._nodes[node_id]]
+        return self._client.get_node(node_id)
+
+    def get_upstream_tracker(self, tracker_id):
+        return self._client.call('get_upstream_tracker', tracker_id)
+
+    def close(self):
+        self._client.close()
@@ -21,7 +21,65 @@
 # This should be treated as a backend for the clone/branch/pull/etc. modules.
 # Basically, don't touch the items in here unless you know what you're doing.
 
+import swarmlib.swarm_time as swarm_time
 from tracker import tracker
+from swarmlib.db import __MASTER_ISSUE__
+from swarmlib.taxonomy import get_cache
+from swarmlib.objects import get_store, copy_objects, node_references
+from swarmlib.util import get_node_id
+from swarmlib.db.queries import __CHUNK_SIZE__
+
+# Transactions which affect the hive as a whole. These are always replayed
+# in log order, with every transaction before them finished first.
+__GLOBAL_XACTIONS__ = ['xlog_start', 'set_taxonomy', 'add_tracker']
+
+# The order batched replay puts the transactions between two hive-wide ones
+# in, so that each kind comes in one batch: issues, then the nodes of those
+# issues, then what refers to both. Transactions not listed keep their log
+# order, after these.
+__BATCH_ORDER__ = {
+    'new_issue' : 0,
+    'new_node' : 1,
+    'link_issue_to_node' : 2,
+    'add_lineage' : 3,
+}
+
+def referenced_documents(sw, chunk):
+    """
+    Returns (issues, nodes): the issues and nodes of the Swarm instance sw
+    which the chunk of (xid, root, time, xaction, xdata) entries creates,
+    with one bulk lookup each
+    """
+    issue_ids = []
+    node_ids = []
+    for (xid, root, time, xaction, xdata) in chunk:
+        if xaction == 'new_issue':
+            issue_ids.append(root)
+        elif xaction == 'new_node':
+            node_ids.append(sw.xactions.dispatch[xaction].decode(xdata)['node_id'])
+    issues = []
+    nodes = []
+    if issue_ids:
+        issues = sw.get_issues(issue_ids)
+    if node_ids:
+        nodes = sw.get_nodes(node_ids)
+    return (issues, nodes)
+
+def bulk_call(backend, bulk_name, single_name, batch):
+    """
+    Hand batch, a list of argument tuples for backend.single_name, to the
+    bulk call backend.bulk_name. Backends without the bulk call (or with
+    bulk_name None) get one single_name call per tuple instead.
+    """
+    call = None
+    if bulk_name:
+        call = getattr(backend, bulk_name, None)
+    if call is not None:
+        call(batch)
+        return
+    call = getattr(backend, single_name)
+    for args in batch:
+        call(*args)
 
 class replicate:
     def __init__(self, source_sw, dest_sw, log):
@@ -44,6 +102,37 @@ class replicate:
             'update_issue' :self.replicate_update_issue,
             'add_tracker' : self.replicate_add_tracker,
         }
+        # Transactions which can be replayed in bulk, and the destination
+        # backend call which takes a whole batch of them (see bulk_call for
+        # backends which don't have it). The singular call is named after
+        # the transaction.
+        self._batch_callback = {
+            'add_lineage' : (self._args_add_lineage, 'add_lineages'),
+            'new_node' : (self._args_new_node, 'new_nodes'),
+            'new_issue' : (self._args_new_issue, 'new_issues'),
+            'link_issue_to_node' : (self._args_link_issue_to_node, 'link_issues_to_nodes'),
+        }
+        # Source issues and nodes for the chunk being replayed, fetched up
+        # front by prefetch() and keyed by their ids
+        self._issues = {}
+        self._nodes = {}
+        self.chunk_size = int(self._get_option('chunk_size', __CHUNK_SIZE__))
+        self.batch = self._get_option('batch', 'no').lower() in ('1', 'yes', 'true', 'on')
+
+    def _get_option(self, setting, default):
+        """
+        Returns a setting from the 'replicate' section of the destination
+        config, or default if it isn't set. Recognized settings are:
+            chunk_size  - transaction log entries replayed per chunk
+            batch       - whether to replay in bulk backend calls (off
+                          by default)
+        """
+        value = None
+        if self._dest_sw.config.has_section('replicate'):
+            value = self._dest_sw.config.get('replicate', setting)
+        if value:
+            return value
+        return default
 
     def run(self, xid, root, time, xaction, xdata):
         """
@@ -51,6 +140,223 @@ class replicate:
         """
         return self._callback[xaction](xid, root, time, xaction, xdata)
 
+    def run_chunk(self, chunk, tracker_id=None):
+        """
+        Replay a chunk of (xid, root, time, xaction, xdata) entries and
+        commit them to the destination. Returns the number of errors.
+
+        If tracker_id is given, the xid of the last entry is checkpointed
+        for that upstream tracker in the same destination transaction. A
+        chunk with errors is rolled back as a whole, so the destination is
+        always left at the checkpoint. So is a chunk whose replay (or
+        commit) raises, and the exception is passed on.
+        """
+        backend = self._dest_sw.db.backend
+        try:
+            try:
+                self.prefetch(chunk)
+                errors = self._run_stream(chunk)
+                if errors == 0:
+                    if tracker_id and chunk:
+                        backend.set_checkpoint(tracker_id, chunk[-1][0],
+                                               swarm_time.timestamp())
+                    backend.commit()
+            except:
+                backend.rollback()
+                raise
+        finally:
+            self._issues = {}
+            self._nodes = {}
+
+        if errors > 0:
+            backend.rollback()
+        return errors
+
+    def prefetch(self, chunk):
+        """
+        Fetch every source issue and node a chunk of entries refers to
+        with one bulk lookup each, rather than one lookup per entry, and
+        copy the attachment objects of those nodes which the destination
+        doesn't have yet
+        """
+        self._logger.register("prefetch")
+
+        (issues, nodes) = referenced_documents(self._source_sw, chunk)
+        for issue in issues:
+            self._issues[issue['hash_id']] = issue
+        for node in nodes:
+            self._nodes[get_node_id(node)] = node
+        self._logger.entry("Prefetched '%i' issues and '%i' nodes" % (len(self._issues), len(self._nodes)), 2)
+        object_ids = node_references(nodes)
+        if object_ids:
+            copied = copy_objects(self._source_sw, self._dest_sw, object_ids, self._log)
+            self._logger.entry("Copied '%i' of '%i' attachment objects" % (copied, len(object_ids)), 2)
+
+        self._logger.unregister()
+
+    def _run_stream(self, entries):
+        """
+        Replay entries in order, batched or one at a time depending on
+        the 'batch' setting. Returns the number of errors.
+        """
+        if self.batch:
+            return self.run_batched(entries)
+        errors = 0
+        for (xid, root, time, xaction, xdata) in entries:
+            errors = errors + self.run(xid, root, time, xaction, xdata)
+        return errors
+
+    def run_batched(self, chunk):
+        """
+        Replay a chunk of entries in bulk calls on the destination backend.
+
+        The log interleaves the transactions of each issue (new_issue,
+        new_node, link_issue_to_node, add_lineage, ...), so the chunk is
+        cut at every hive-wide transaction (see __GLOBAL_XACTIONS__) and
+        each piece in between is put in __BATCH_ORDER__, keeping log order
+        within a kind. Every issue of the piece is then written before any
+        node, and every node before any link or lineage edge which refers
+        to it, with one bulk call per kind. The destination's own log
+        records the transactions in that order.
+
+        Returns the number of errors.
+        """
+        self._logger.register("run_batched")
+
+        errors = 0
+        piece = []
+        for entry in chunk + [None]:
+            if entry is None or entry[1] == __MASTER_ISSUE__ or entry[3] in __GLOBAL_XACTIONS__:
+                if piece:
+                    piece.sort()
+                    errors = errors + self._apply(self._prepare_stream(
+                        [queued for (order, i, queued) in piece]))
+                    piece = []
+                if entry is not None:
+                    errors = errors + self.run(*entry)
+            else:
+                order = __BATCH_ORDER__.get(entry[3], len(__BATCH_ORDER__))
+                piece.append((order, len(piece), entry))
+
+        self._logger.unregister()
+        return errors
+
+    def _prepare_stream(self, entries):
+        """
+        Decode entries into the destination backend calls which replay
+        them. Returns a list of (xaction, args, entry), where args is the
+        argument tuple for the backend call named after xaction, or None
+        for entries which run() replays itself.
+        """
+        self._logger.register("_prepare_stream")
+
+        prepared = []
+        for entry in entries:
+            xaction = entry[3]
+            if xaction in self._batch_callback:
+                prepared.append((xaction, self._batch_callback[xaction][0](*entry), entry))
+            else:
+                prepared.append((xaction, None, entry))
+        self._logger.entry("Decoded '%i' transactions" % len(prepared), 5)
+
+        self._logger.unregister()
+        return prepared
+
+    def _apply(self, prepared):
+        """
+        Make the backend calls from _prepare_stream(), in order, each run
+        of the same transaction in one bulk call if batching is on.
+        Returns the number of errors.
+        """
+        errors = 0
+        batch_xaction = None
+        batch = []
+        for (xaction, args, entry) in prepared:
+            if xaction != batch_xaction:
+                errors = errors + self._flush_batch(batch_xaction, batch)
+                batch_xaction = None
+                batch = []
+            if args is None:
+                errors = errors + self.run(*entry)
+            else:
+                batch_xaction = xaction
+                batch.append(args)
+        errors = errors + self._flush_batch(batch_xaction, batch)
+        return errors
+
+    def _flush_batch(self, xaction, batch):
+        """
+        Hand a batch of prepared backend arguments to the bulk backend
+        call for xaction, or to the singular call per entry if batching is
+        off. Returns the number of errors, which is the size of the batch
+        if it failed.
+        """
+        if not batch:
+            return 0
+        bulk_name = None
+        if self.batch:
+            bulk_name = self._batch_callback[xaction][1]
+        self._logger.entry("Replicating '%i' %s transactions" % (len(batch), xaction), 1)
+        try:
+            bulk_call(self._dest_sw.db.backend, bulk_name, xaction, batch)
+        except Exception, e:
+            self._logger.error("Replicating '%i' %s transactions failed: %s" % (len(batch), xaction, e))
+            return len(batch)
+        return 0
+
+    def replay(self, tracker_id, issue=None, since_xid=None):
+        """
+        Walk the source transaction log after since_xid (optionally only
+        the entries for issue) a chunk at a time, replaying and
+        checkpointing each chunk in the destination before the next one is
+        fetched. Stops at the first chunk with errors.
+
+        Returns (errors, transactions replayed)
+        """
+        self._logger.register("replay")
+
+        errors = 0
+        total = 0
+        for chunk in self._source_sw.iter_transaction_log(issue=issue, since_xid=since_xid, chunk_size=self.chunk_size):
+            self._logger.entry("Processing '%i' transactions" % len(chunk), 1)
+            errors = errors + self.run_chunk(chunk, tracker_id)
+            if errors > 0:
+                # The failed chunk was rolled back, so stop here and
+                # leave the destination at the last checkpoint
+                break
+            total = total + len(chunk)
+        self._logger.entry("Processed '%i' transactions" % total, 0)
+
+        self._logger.unregister()
+        return (errors, total)
+
+    def get_tracker_id(self, issue_id):
+        """
+        Returns the upstream tracker id for issue_id in the source hive
+        """
+        tracker.hive = self._source_sw.get_hive()
+        upstream = tracker.encode(issue_id)
+        if upstream:
+            return upstream['tracker_id']
+        return None
+
+    def get_checkpoint(self, tracker_id):
+        """
+        Returns the last source xid replayed into the destination from
+        tracker_id, or None if there is no checkpoint for it
+        """
+        if not tracker_id:
+            return None
+        return self._dest_sw.db.backend.get_checkpoint(tracker_id)
+
+    def has_tracker(self, tracker_id):
+        """
+        Returns true if the destination already tracks tracker_id
+        """
+        if self._dest_sw.get_upstream_tracker(tracker_id):
+            return True
+        return False
+
     def add_tracker(self, issue_id, upstream=None, timestamp=None):
         """
         Add the tracker for the upstream souce
@@ -96,7 +402,7 @@ class replicate:
         [term] = data.keys()
         the_list = data[term]
 
-        self._dest_sw.set_taxonomy(term, the_list)
+        get_cache(self._dest_sw, self._log).set(term, the_list)
 
         self._logger.unregister()
         return 0
@@ -110,9 +416,7 @@ class replicate:
         self._logger.register('replicate_add_lineage')
         self._logger.entry('Replicating %s transaction' % xaction, 1)
 
-        data = self._dest_sw.xactions.dispatch[xaction].decode(xdata)
-
-        self._dest_sw.db.backend.add_lineage(data, root, time)
+        self._dest_sw.db.backend.add_lineage(*self._args_add_lineage(xid, root, time, xaction, xdata))
 
         self._logger.unregister()
         return 0
@@ -126,16 +430,7 @@ class replicate:
         self._logger.register('replicate_new_node')
         self._logger.entry('Replicating %s transaction' % xaction, 1)
 
-        # Technically, this is just stored as node_id, however
-        # since we reserve the right to change the transaction
-        # log schema at any time the safest way to get this is
-        # to use the dispatch.decode function.
-        node_id = self._source_sw.xactions.dispatch[xaction].decode(xdata)['node_id']
-
-        [node_data] = self._source_sw.get_node(node_id)
-        # ERE I AM JH
-        #print node_data
-        self._dest_sw.db.backend.new_node(node_data, root, time)
+        self._dest_sw.db.backend.new_node(*self._args_new_node(xid, root, time, xaction, xdata))
 
         self._logger.unregister()
         return 0
@@ -150,12 +445,7 @@ class replicate:
         self._logger.register('replicate_new_issue')
         self._logger.entry('Replicating %s transaction' % xaction, 1)
 
-        #hash_id = self._source_sw.xactions.dispatch[xaction].decode(xdata)['hash_id']
-
-        [issue_data] = self._source_sw.get_issue(None, root)
-        # ERE I AM JH
-        #print issue_data
-        self._dest_sw.db.backend.new_issue(issue_data, time)
+        self._dest_sw.db.backend.new_issue(*self._args_new_issue(xid, root, time, xaction, xdata))
 
         self._logger.unregister()
         return 0
@@ -168,9 +458,7 @@ class replicate:
 
         self._logger.register('replicate_link_issue_to_node')
         self._logger.entry('Replicating %s transaction' % xaction, 1)
-        linking = self._source_sw.xactions.dispatch[xaction].decode(xdata)
-
-        self._dest_sw.db.backend.link_issue_to_node(linking, time)
+        self._dest_sw.db.backend.link_issue_to_node(*self._args_link_issue_to_node(xid, root, time, xaction, xdata))
 
         self._logger.unregister()
         return 0
@@ -198,8 +486,63 @@ class replicate:
 
         tracker_id = self._source_sw.xactions.dispatch[xaction].decode(xdata)['tracker_id']
 
-        [upstream_tracker] = self._source_sw.get_upstream_tracker(tracker_id)
-        self.add_tracker(root, upstream_tracker, time)
+        # A hive bootstrapped from a snapshot keeps the transaction but not
+        # its source's trackers (snapshots leave them out), so there may be
+        # nothing to copy
+        trackers = self._source_sw.get_upstream_tracker(tracker_id)
+        if len(trackers):
+            self.add_tracker(root, trackers[0], time)
+        else:
+            self._logger.entry('Source has no tracker %s, skipping' % tracker_id, 2)
 
         self._logger.unregister()
         return 0
+
+    # The following prepare the destination backend arguments for the
+    # batchable transactions, so the same decoding is used whether a
+    # transaction is replayed on its own or in a batch
+
+    def _args_add_lineage(self, xid, root, time, xaction, xdata):
+        """
+        Returns (data, root, time) for backend.add_lineage
+        """
+        data = self._dest_sw.xactions.dispatch[xaction].decode(xdata)
+        return (data, root, time)
+
+    def _args_new_node(self, xid, root, time, xaction, xdata):
+        """
+        Returns (node_data, root, time) for backend.new_node
+        """
+        # Technically, this is just stored as node_id, however
+        # since we reserve the right to change the transaction
+        # log schema at any time the safest way to get this is
+        # to use the dispatch.decode function.
+        node_id = self._source_sw.xactions.dispatch[xaction].decode(xdata)['node_id']
+
+        node_data = self._nodes.get(node_id)
+        if not node_data:
+            [node_data] = self._source_sw.get_node(node_id)
+            copy_objects(self._source_sw, self._dest_sw,
+                         node_references([node_data]), self._log)
+        # Attachments from hives which kept them inline move into the
+        # destination's object store
+        node_data = get_store(self._dest_sw, self._log).store_attachment(node_data)
+        return (node_data, root, time)
+
+    def _args_new_issue(self, xid, root, time, xaction, xdata):
+        """
+        Returns (issue_data, time) for backend.new_issue
+        """
+        #hash_id = self._source_sw.xactions.dispatch[xaction].decode(xdata)['hash_id']
+
+        issue_data = self._issues.get(root)
+        if not issue_data:
+            [issue_data] = self._source_sw.get_issue(None, root)
+        return (issue_data, time)
+
+    def _args_link_issue_to_node(self, xid, root, time, xaction, xdata):
+        """
+        Returns (linking, time) for backend.link_issue_to_node
+        """
+        linking = self._source_sw.xactions.dispatch[xaction].decode(xdata)
+        return (linking, time)
@@ -0,0 +1,268 @@
+#!/usr/bin/env python
+
+# Copyright 2007 Sam Hart
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+# Author: Sam Hart
+
+# Snapshots hold the materialised state of a hive (its issues, nodes,
+# lineage and taxonomy, see __SNAPSHOT_TABLES__) as of a given xid. A clone
+# can load the newest snapshot of its source, copy the source's log up to
+# it, and replay only the transactions after it. The transaction log,
+# replication checkpoints and upstream trackers are the hive's own and
+# never part of a snapshot.
+#
+# Snapshots live in .swarm/snapshots/ as gzipped streams of pickled
+# records, so neither writing nor loading one needs a whole table in
+# memory:
+#   {'version': .., 'xid': .., 'time': ..}   - header
+#   ('table', name)                           - start of a table
+#   ('rows', name, [row dicts])               - a chunk of its rows
+#   None                                      - end of the snapshot
+
+import os
+import gzip
+import shutil
+import cPickle as pickle
+
+import swarmlib.swarm_time as swarm_time
+from swarmlib.db.db_bits import metadata
+import swarmlib.db.queries as queries
+from swarmlib.taxonomy import get_cache
+from swarmlib.objects import copy_objects, node_references
+
+__SNAPSHOT_VERSION__ = 1
+__SNAPSHOT_SUFFIX__ = '.snapshot'
+
+# The tables which make up a snapshot, in dependency order
+__SNAPSHOT_TABLES__ = ['issues', 'nodes', 'lineage', 'components', 'versions',
+                       'milestones', 'severities', 'priorities', 'status',
+                       'resolutions']
+
+class backend_tables:
+    """
+    Table level access to a Swarm backend, by table name. Backends with
+    the calls themselves (the docstore backend) are used as they are, the
+    SQL backend through swarmlib.db.queries on its connection.
+    """
+    def __init__(self, backend):
+        self._backend = backend
+        self._connection = getattr(backend, 'connection', None)
+        self._read = None
+
+    def begin_read(self):
+        """
+        Start reading one state of the hive, which nothing can commit to
+        until end_read(): a transaction on the SQL backend, the write locks
+        of the docstore backend. Call this with no changes pending.
+        """
+        if self._connection is None:
+            self._backend.lock()
+        else:
+            self._read = self._connection.begin()
+
+    def end_read(self):
+        if self._connection is None:
+            # Nothing is pending, so this only gives up the locks
+            self._backend.commit()
+        else:
+            self._read.rollback()
+            self._read = None
+
+    def _table(self, name):
+        return metadata.tables[name]
+
+    def iter_table(self, name):
+        if self._connection is None:
+            return self._backend.iter_table(name)
+        return queries.iter_table(self._connection, self._table(name))
+
+    def clear_table(self, name):
+        if self._connection is None:
+            self._backend.clear_table(name)
+        else:
+            queries.clear_table(self._connection, self._table(name))
+
+    def insert_rows(self, name, rows):
+        if self._connection is None:
+            self._backend.insert_rows(name, rows)
+        else:
+            queries.insert_rows(self._connection, self._table(name), rows)
+
+    def get_last_xid(self):
+        if self._connection is None:
+            return self._backend.get_last_xid()
+        return queries.get_last_xid(self._connection)
+
+    def iter_transaction_log(self, **args):
+        if self._connection is None:
+            return self._backend.iter_transaction_log(**args)
+        return queries.iter_transaction_log(self._connection, **args)
+
+    def delete_transactions(self, xids):
+        if self._connection is None:
+            self._backend.delete_transactions(xids)
+        else:
+            queries.delete_transactions(self._connection, xids)
+
+class snapshot:
+    def __init__(self, sw, log):
+        """
+        sw == The Swarm instance the snapshots belong to
+        log == The log instance
+        """
+        self._sw = sw
+        self._log = log
+        self._logger = log.get_logger("snapshot")
+        self.snapshot_dir = "%s/snapshots" % self._sw.config.dot_swarm
+
+    def _path(self, xid):
+        return "%s/%012i%s" % (self.snapshot_dir, xid, __SNAPSHOT_SUFFIX__)
+
+    def write(self):
+        """
+        Write a snapshot of the hive as of its newest transaction. Returns
+        the xid of the snapshot, or None if the transaction log is empty.
+        """
+        self._logger.register("write")
+
+        # The xid and the tables have to be read from the same state of
+        # the hive, or the snapshot could hold changes from after its xid
+        # (which replaying from it would apply twice)
+        tables = backend_tables(self._sw.db.backend)
+        tables.begin_read()
+        try:
+            xid = tables.get_last_xid()
+            if xid is None:
+                self._logger.error("The transaction log is empty, nothing to snapshot")
+            else:
+                if not os.path.isdir(self.snapshot_dir):
+                    os.mkdir(self.snapshot_dir)
+                path = self._path(xid)
+                temp_path = path + ".tmp"
+                fp = gzip.open(temp_path, 'wb')
+                pickle.dump({'version' : __SNAPSHOT_VERSION__, 'xid' : xid,
+                             'time' : swarm_time.timestamp()}, fp, 2)
+                for name in __SNAPSHOT_TABLES__:
+                    pickle.dump(('table', name), fp, 2)
+                    for rows in tables.iter_table(name):
+                        pickle.dump(('rows', name, rows), fp, 2)
+                pickle.dump(None, fp, 2)
+                fp.close()
+                # Only a complete snapshot ever gets the real name
+                os.rename(temp_path, path)
+                self._logger.entry("Wrote snapshot at transaction '%i'" % xid, 0)
+        finally:
+            tables.end_read()
+
+        self._logger.unregister()
+        return xid
+
+    def latest(self):
+        """
+        Returns the xid of the newest snapshot, or None if there is none
+        """
+        xids = []
+        if os.path.isdir(self.snapshot_dir):
+            for name in os.listdir(self.snapshot_dir):
+                if name.endswith(__SNAPSHOT_SUFFIX__):
+                    xids.append(int(name[:-len(__SNAPSHOT_SUFFIX__)]))
+        if xids:
+            return max(xids)
+        return None
+
+    def restore(self, xid, dest_sw):
+        """
+        Replace the tables of dest_sw with the snapshot at xid, copying
+        the attachment objects of its nodes which dest_sw doesn't have.
+        Tables which aren't part of snapshots any more (snapshots written
+        before __SNAPSHOT_TABLES__ carried the upstream trackers) are
+        skipped. This does not commit.
+        """
+        self._logger.register("restore")
+
+        tables = backend_tables(dest_sw.db.backend)
+        fp = gzip.open(self._path(xid), 'rb')
+        header = pickle.load(fp)
+        if header['version'] > __SNAPSHOT_VERSION__:
+            fp.close()
+            self._logger.unregister()
+            raise ValueError("Snapshot version '%i' is newer than this swarm understands" % header['version'])
+
+        record = pickle.load(fp)
+        while record is not None:
+            name = record[1]
+            if name in __SNAPSHOT_TABLES__ and record[0] == 'table':
+                self._logger.entry("Restoring table '%s'" % name, 2)
+                tables.clear_table(name)
+            elif name in __SNAPSHOT_TABLES__:
+                if name == 'nodes':
+                    copy_objects(self._sw, dest_sw,
+                                 node_references(record[2]), self._log)
+                tables.insert_rows(name, record[2])
+            record = pickle.load(fp)
+        fp.close()
+        # The taxonomy tables were replaced underneath any cached lists
+        get_cache(dest_sw, self._log).invalidate()
+
+        self._logger.unregister()
+
+    def copy_to(self, xid, dest_sw):
+        """
+        Copy the snapshot at xid into the snapshots of dest_sw, so that
+        hives cloned from dest_sw can bootstrap from it too
+        """
+        dest_dir = snapshot(dest_sw, self._log).snapshot_dir
+        if not os.path.isdir(dest_dir):
+            os.mkdir(dest_dir)
+        path = "%s/%s" % (dest_dir, os.path.basename(self._path(xid)))
+        temp_path = path + ".tmp"
+        shutil.copyfile(self._path(xid), temp_path)
+        os.rename(temp_path, path)
+
+    def compact(self, xid):
+        """
+        Drop the transaction log entries up to xid whose effect a later
+        entry overrides anyway: every set_taxonomy but the last for each
+        term, as each one holds the whole list for its term. Returns the
+        number of entries dropped. This does not commit.
+
+        Everything else is kept, so the log still reads as the history of
+        the hive. update_issue entries only name the issue rather than
+        carry its state, so a later one doesn't stand in for an earlier.
+        """
+        self._logger.register("compact")
+
+        tables = backend_tables(self._sw.db.backend)
+        latest = {}
+        superseded = []
+        for chunk in tables.iter_transaction_log():
+            if chunk[0][0] > xid:
+                break
+            for (entry_xid, root, time, xaction, xdata) in chunk:
+                if entry_xid > xid:
+                    break
+                if xaction == 'set_taxonomy':
+                    [term] = self._sw.xactions.dispatch[xaction].decode(xdata).keys()
+                    if term in latest:
+                        superseded.append(latest[term])
+                    latest[term] = entry_xid
+
+        tables.delete_transactions(superseded)
+        self._logger.entry("Dropped '%i' superseded transactions" % len(superseded), 0)
+
+        self._logger.unregister()
+        return len(superseded)
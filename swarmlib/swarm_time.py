@@ -45,4 +45,37 @@ def human_readable_from_stamp(stamp=None):
     if stamp:
         return time.ctime(stamp)
     else:
-        return time.ctime(time.time())
\ No newline at end of file
+        return time.ctime(time.time())
+
+# The formats parse() accepts, besides a plain timestamp
+__PARSE_FORMATS__ = ['%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d']
+
+# The format of a whole day
+__DATE_FORMAT__ = '%Y-%m-%d'
+
+def parse(text, end=False):
+    """
+    parse(text, end=False)
+    Returns the timestamp for text, which can either be a timestamp or a
+    local date/time in one of the __PARSE_FORMATS__. A date alone is the
+    start of that day, or its last moment if end is set, so it can close
+    an inclusive range. Raises ValueError if text is neither.
+    """
+
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    for time_format in __PARSE_FORMATS__:
+        try:
+            parsed = time.strptime(text.strip(), time_format)
+        except ValueError:
+            continue
+        if end and time_format == __DATE_FORMAT__:
+            # mktime() normalizes the day after the end of a month, and
+            # works out daylight saving for the next midnight itself
+            next_day = (parsed.tm_year, parsed.tm_mon, parsed.tm_mday + 1,
+                        0, 0, 0, 0, 0, -1)
+            return time.mktime(next_day) - 1e-6
+        return time.mktime(parsed)
+    raise ValueError("Unrecognized time '%s'" % text)
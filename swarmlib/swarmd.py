@@ -0,0 +1,373 @@
+#!/usr/bin/env python
+
+# Copyright 2007 Sam Hart
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+# Author: Sam Hart
+
+# swarmd keeps hives open so 'swarm' commands don't have to. Each 'swarm'
+# run otherwise reads the config, opens the database and closes it again,
+# which dominates the time taken by the quick commands scripts run in
+# bulk.
+#
+# swarmd listens on a Unix socket. The non-interactive commands ('log',
+# 'last', 'debug' and 'snapshot') check for the socket and, if the daemon
+# is there, send it their arguments and working directory instead of
+# running themselves. The daemon runs the command against a pooled hive
+# (see swarmlib.hive_pool), streaming its output back. Without a daemon,
+# or if it can't be reached, commands run as they always have.
+#
+# The socket is $SWARMD_SOCKET if that is set (an empty value stops
+# commands using the daemon), ~/.swarmd/socket otherwise. 'swarmd
+# --socket' listens somewhere else, for commands with SWARMD_SOCKET set to
+# match. The daemon reads the 'swarmd' section of the system and user configs
+# (/etc/swarmd/swarm.conf or ~/.swarm, say):
+#   [swarmd]
+#   pool_size = 8       # how many hives to keep open
+#   idle_timeout = 600  # seconds an unused hive is kept open for
+#
+# The protocol is a line of JSON from the client,
+#   {"cwd" : working directory, "argv" : command line}
+# answered by a stream of frames, each a type byte and a length followed
+# by that many bytes: 'o' (standard output), 'e' (standard error) and a
+# final 'x' with the exit status.
+
+import os
+import sys
+import json
+import errno
+import getopt
+import select
+import signal
+import socket
+import struct
+import threading
+import traceback
+import SocketServer
+
+import swarmlib.log as Log
+from swarmlib.config import Config
+from swarmlib.hive_pool import hive_pool, __POOL_SIZE__, __IDLE_TIMEOUT__
+
+__SOCKET_ENV__ = 'SWARMD_SOCKET'
+__SOCKET_PATH__ = '~/.swarmd/socket'
+
+__FRAME__ = struct.Struct('>cI')
+__READ_SIZE__ = 4096
+
+# Seconds between checks for hives which have been idle too long
+__EXPIRE_INTERVAL__ = 60
+
+def socket_path():
+    """
+    Returns the path of the swarmd socket commands use, or None if they
+    shouldn't use the daemon
+    """
+    path = os.environ.get(__SOCKET_ENV__)
+    if path is None:
+        path = os.path.expanduser(__SOCKET_PATH__)
+    return path or None
+
+def hive_stamp(path):
+    """
+    Changes whenever anything in the hive at path does, so that the pool
+    reopens hives written to by other processes
+    """
+    dot_swarm = "%s/.swarm" % path
+    stamp = []
+    try:
+        names = sorted(os.listdir(dot_swarm))
+    except OSError:
+        return None
+    for name in names:
+        try:
+            st = os.stat("%s/%s" % (dot_swarm, name))
+        except OSError:
+            continue
+        stamp.append((name, st.st_mtime, st.st_size))
+    return stamp
+
+def _send_frame(sock, kind, data):
+    sock.sendall(__FRAME__.pack(kind, len(data)) + data)
+
+def _recv_exactly(sock, size):
+    """
+    Returns size bytes from sock, or None if it closes first
+    """
+    data = ''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            return None
+        data = data + chunk
+    return data
+
+def proxy(argv):
+    """
+    Run the command line argv in swarmd if it is running, copying its
+    output to ours. Returns the exit status, or None if there is no daemon
+    to run it (and it should be run here).
+    """
+    path = socket_path()
+    if not path or not os.path.exists(path):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+        sock.sendall(json.dumps({'cwd' : os.getcwd(), 'argv' : argv}) + "\n")
+    except socket.error:
+        sock.close()
+        return None
+
+    outputs = {'o' : sys.stdout, 'e' : sys.stderr}
+    status = None
+    while status is None:
+        header = _recv_exactly(sock, __FRAME__.size)
+        if header is None:
+            break
+        (kind, length) = __FRAME__.unpack(header)
+        data = _recv_exactly(sock, length)
+        if data is None:
+            break
+        if kind == 'x':
+            status = int(data)
+        else:
+            outputs[kind].write(data)
+            outputs[kind].flush()
+    sock.close()
+    if status is None:
+        sys.stderr.write("swarmd closed the connection before the command finished\n")
+        status = 1
+    return status
+
+class _pump(threading.Thread):
+    """
+    Copies what a command writes to its standard output and error (pipes,
+    while it runs in the daemon) to the client as frames
+    """
+    def __init__(self, sock, pipes):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.sock = sock
+        # read fd -> frame type
+        self.pipes = pipes
+        self.connected = True
+
+    def run(self):
+        open_fds = self.pipes.keys()
+        while open_fds:
+            (readable, w, x) = select.select(open_fds, [], [])
+            for fd in readable:
+                data = os.read(fd, __READ_SIZE__)
+                if not data:
+                    open_fds.remove(fd)
+                elif self.connected:
+                    try:
+                        _send_frame(self.sock, self.pipes[fd], data)
+                    except socket.error:
+                        # Keep draining the pipes so the command can
+                        # finish, there's just nobody to tell
+                        self.connected = False
+
+class _handler(SocketServer.StreamRequestHandler):
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline())
+            cwd = request['cwd'].encode('utf-8')
+            argv = [arg.encode('utf-8') for arg in request['argv']]
+        except (ValueError, KeyError, TypeError, AttributeError):
+            self.server.logger.error("Bad request, ignoring it")
+            return
+        status = self.server.run_command(cwd, argv, self.request)
+        try:
+            _send_frame(self.request, 'x', str(status))
+        except socket.error:
+            pass
+
+class swarmd(SocketServer.UnixStreamServer):
+    def __init__(self, path, log, size=__POOL_SIZE__, idle=__IDLE_TIMEOUT__):
+        """
+        path == The socket to listen on
+        log == The log instance
+        size == How many idle hives to keep open
+        idle == Seconds an unused hive is kept open for
+        """
+        self.path = path
+        self.log = log
+        self.logger = log.get_logger("swarmd")
+        self.hives = hive_pool(self._open_hive, log, size, idle, hive_stamp)
+        self.timeout = __EXPIRE_INTERVAL__
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory, 0700)
+        if os.path.exists(path):
+            # Left behind by a daemon which didn't shut down cleanly?
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(path)
+            except socket.error:
+                os.remove(path)
+            else:
+                probe.close()
+                raise socket.error(errno.EADDRINUSE, "swarmd is already running on '%s'" % path)
+        # Only the user running the daemon may talk to it
+        umask = os.umask(0077)
+        try:
+            SocketServer.UnixStreamServer.__init__(self, path, _handler)
+        finally:
+            os.umask(umask)
+
+    def _open_hive(self, path):
+        from swarmlib.swarm import swarm as Swarm
+        return Swarm(path, self.log)
+
+    def _run_cli(self, argv):
+        """
+        Run the command line argv as 'swarm' would, with its hives from
+        the pool
+        """
+        import swarmlib.cli as cli
+        cli.hive_pool = self.hives
+        cli.run(argv)
+
+    def run_command(self, cwd, argv, sock):
+        """
+        Run the command line argv in the directory cwd, as 'swarm' would,
+        sending its output down sock. Returns the exit status.
+        """
+        self.logger.register("run_command")
+        self.logger.entry("Running '%s' in '%s'" % (' '.join(argv), cwd), 1)
+        sys.stdout.flush()
+        sys.stderr.flush()
+        saved = (os.dup(1), os.dup(2))
+        (out_read, out_write) = os.pipe()
+        (err_read, err_write) = os.pipe()
+        pump = _pump(sock, {out_read : 'o', err_read : 'e'})
+        pump.start()
+        os.dup2(out_write, 1)
+        os.dup2(err_write, 2)
+        os.close(out_write)
+        os.close(err_write)
+
+        status = 0
+        try:
+            try:
+                os.chdir(cwd)
+                self._run_cli(argv)
+            except SystemExit, e:
+                if e.code is None:
+                    status = 0
+                elif isinstance(e.code, int):
+                    status = e.code
+                else:
+                    sys.stderr.write("%s\n" % e.code)
+                    status = 1
+            except Exception:
+                traceback.print_exc()
+                status = 1
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os.dup2(saved[0], 1)
+            os.dup2(saved[1], 2)
+            os.close(saved[0])
+            os.close(saved[1])
+            # With the write ends gone, the pump sees the end of both pipes
+            pump.join()
+            os.close(out_read)
+            os.close(err_read)
+            # A command which failed part way may not have given its hive
+            # back, and it can't be trusted to be in a sane state anyway
+            self.hives.discard_leased()
+            os.chdir('/')
+
+        self.logger.entry("Exit status %i" % status, 2)
+        self.logger.unregister()
+        return status
+
+    def handle_timeout(self):
+        self.hives.expire()
+
+    def serve(self):
+        """
+        Serve commands until interrupted
+        """
+        self.logger.register("serve")
+        self.logger.entry("Listening on '%s'" % self.path, 0)
+        try:
+            try:
+                while True:
+                    self.handle_request()
+                    self.hives.expire()
+            except KeyboardInterrupt:
+                self.logger.entry("Shutting down", 0)
+        finally:
+            self.hives.close()
+            self.server_close()
+            if os.path.exists(self.path):
+                os.remove(self.path)
+        self.logger.unregister()
+
+def _terminate(signum, frame):
+    # Shut down as for ^C, closing every hive cleanly
+    raise KeyboardInterrupt
+
+def main(argv):
+    """
+    The swarmd run trigger
+    """
+    log = Log.log()
+    logger = log.get_logger("swarmd_main")
+    verbose = 0
+    path = None
+
+    try:
+        (opts, args) = getopt.getopt(argv, 'vs:', ['verbose', 'socket='])
+    except getopt.GetoptError, e:
+        sys.stderr.write("%s\nusage: swarmd [-v|--verbose] [-s|--socket=SOCKET]\n" % e)
+        sys.exit(2)
+    for o, a in opts:
+        if o in ("-v", "--verbose"):
+            verbose = verbose + 1
+        if o in ("-s", "--socket"):
+            path = a
+
+    log.set_universal_loglevel(verbose)
+    logger.register("main")
+
+    # No hive here, this just picks up the system and user configs
+    config = Config(os.path.expanduser('~'), log)
+    size = __POOL_SIZE__
+    idle = __IDLE_TIMEOUT__
+    if config.has_option('swarmd', 'pool_size'):
+        size = int(config.get('swarmd', 'pool_size'))
+    if config.has_option('swarmd', 'idle_timeout'):
+        idle = int(config.get('swarmd', 'idle_timeout'))
+    if path is None:
+        path = socket_path()
+    if not path:
+        logger.error("No socket to listen on, set %s or use --socket" % __SOCKET_ENV__)
+        sys.exit(2)
+
+    try:
+        server = swarmd(path, log, size, idle)
+    except socket.error, e:
+        logger.error(str(e))
+        sys.exit(1)
+    logger.unregister()
+    signal.signal(signal.SIGTERM, _terminate)
+    server.serve()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+
+# taxonomy - In-process cache of a hive's taxonomy lists
+#
+# Copyright 2007 Sam Hart
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+# Author: Sam Hart
+
+class taxonomy_cache:
+    def __init__(self, sw, log):
+        """
+        Caches the taxonomy lists of a Swarm instance, so rendering a page
+        doesn't cost a database round trip per taxonomy term. Every entry
+        is stamped with the version it was read at, and set() bumps the
+        version, so nothing read before a change is ever handed out after
+        it.
+        sw == The Swarm instance
+        log == The log instance
+        """
+        self.sw = sw
+        self.logger = log.get_logger("taxonomy_cache")
+        self.version = 0
+        self._entries = {}
+
+    def get(self, term):
+        """
+        Returns the taxonomy list for term
+        """
+        entry = self._entries.get(term)
+        if entry and entry[0] == self.version:
+            return entry[1]
+        self.logger.entry("Loading taxonomy '%s'" % term, 5)
+        components = self.sw.get_taxonomy(term)
+        self._entries[term] = (self.version, components)
+        return components
+
+    def set(self, term, components):
+        """
+        Sets the taxonomy list for term through the Swarm instance, and
+        invalidates the cache
+        """
+        self.sw.set_taxonomy(term, components)
+        self.invalidate()
+
+    def invalidate(self):
+        """
+        Drop every cached taxonomy list
+        """
+        self.version = self.version + 1
+        self._entries = {}
+
+def get_cache(sw, log):
+    """
+    get_cache(sw, log)
+    Returns the taxonomy cache of the Swarm instance sw, creating it on
+    first use. Everything using the same Swarm instance shares the cache.
+    """
+    cache = getattr(sw, 'taxonomy_cache', None)
+    if cache is None:
+        cache = taxonomy_cache(sw, log)
+        sw.taxonomy_cache = cache
+    return cache
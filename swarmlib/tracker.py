@@ -23,6 +23,13 @@
 import os.path
 import swarmlib.data_tools as data_tools
 
+# URL schemes -> tracker types, for schemes not named after their type
+__SCHEME_TYPES__ = {
+    '' : 'swarm_local',
+    'file' : 'swarm_local',
+    'swarm' : 'swarm_remote',
+}
+
 class Tracker:
     def __init__(self, description, encoder_callback, decoder_callback):
         self.description = description
@@ -38,14 +45,25 @@ class tracker_dispatch:
                 self.encode_local,
                 self.decode_local
             ),
+            'swarm_remote' : Tracker(
+                'A hive server on another host (swarm://)',
+                self.encode_remote,
+                self.decode_remote
+            ),
         }
 
+    def _type(self):
+        """
+        The tracker type for the hive's URL scheme
+        """
+        return __SCHEME_TYPES__.get(self.hive.scheme, self.hive.scheme)
+
     def encode(self, transport):
         """
         stub
         """
         if self.hive:
-            return self.dispatch[self.hive.scheme].encoder(transport)
+            return self.dispatch[self._type()].encoder(transport)
         else:
             return None
 
@@ -54,7 +72,7 @@ class tracker_dispatch:
         stub
         """
         if self.hive:
-            return self.dispatch[self.hive.scheme].decoder()
+            return self.dispatch[self._type()].decoder()
         else:
             return None
 
@@ -86,4 +104,34 @@ class tracker_dispatch:
 
         return None
 
+    def encode_remote(self, transport):
+        """
+        Returns a pythonic dictionary ready for insertion into the upstream
+        tracker db, for a hive reached over swarm://
+        """
+        upstream = None
+
+        if self.hive:
+            # swarmlib.remote fills in the default port, so the same hive
+            # always gets the same uri
+            uri = "swarm://%s:%s%s" % (self.hive.hostname, self.hive.port,
+                                       os.path.normpath(self.hive.path or '/'))
+            tracker_id = data_tools.get_hash(uri, str(transport), self.hive.scheme)
+            upstream = {
+                'tracker_id' : tracker_id,
+                'uri' : uri,
+                'type' : 'swarm_remote',
+                'authentication' : None,
+                'transport' : str(transport)
+            }
+
+        return upstream
+
+    def decode_remote(self):
+        """
+        stub
+        """
+
+        return None
+
 tracker = tracker_dispatch()
@@ -37,3 +37,14 @@ def get_hash(str1, str2, str3):
     h.update(str2)
     h.update(str3)
     return h.hexdigest()
+
+def get_node_id(node):
+    """
+    get_node_id(node):
+    Returns the id of a node dict. Rows straight from the nodes table
+    (swarmlib.db.queries, the docstore backend) call it 'hash_id', the
+    Swarm API calls it 'node_id'.
+    """
+    if node.has_key('node_id'):
+        return node['node_id']
+    return node['hash_id']
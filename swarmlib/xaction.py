@@ -23,7 +23,30 @@
 import cPickle as pickle
 import binascii
 
-import swarmlib.data_tools as data_tools
+from swarmlib.util import get_node_id
+
+# Compact transaction data encoding
+# ---------------------------------
+# Transaction data used to be stored as hexlified pickles, which is twice
+# the size of the pickle and costs an unhexlify on every read. The compact
+# encoding is a three byte header followed by a body:
+#   __COMPACT_MAGIC__ - never a hex digit, so legacy data can't start with it
+#   version           - __COMPACT_VERSION__ at the time of writing
+#   format            - one of the formats below
+# Formats (version 1):
+#   __FORMAT_PICKLE__    - body is a binary (protocol 2) pickle
+#   __FORMAT_HASH_PAIR__ - body is two 20 byte binary sha1 hashes, for
+#                          {key1: hex hash, key2: hex hash} data. The keys
+#                          are known from the transaction type.
+# Readers must keep accepting legacy hex pickles and every older version.
+__COMPACT_MAGIC__ = '\xfe'
+__COMPACT_VERSION__ = '\x01'
+__FORMAT_PICKLE__ = 'P'
+__FORMAT_HASH_PAIR__ = 'H'
+__HASH_LENGTH__ = 40
+
+__LINEAGE_KEYS__ = ('parent_id', 'child_id')
+__LINKING_KEYS__ = ('issue_id', 'node_id')
 
 class Xaction:
     def __init__(self, description, encoder_callback, decoder_callback, hr_callback):
@@ -35,6 +58,10 @@ class Xaction:
 class xaction_dispatch:
     def __init__(self):
         self.sw = None
+        # Issues and nodes looked up in bulk by decode_human_readable_batch,
+        # keyed by their ids, for the hr callbacks to use
+        self._issues = {}
+        self._nodes = {}
         self.dispatch = {
             'xlog_start' : Xaction(
                 'Transaction log start',
@@ -43,18 +70,18 @@ class xaction_dispatch:
                 self.hr_xlog_start),
             'set_taxonomy' : Xaction(
                 'Set taxonomy terms',
-                self.enc_simple_obj,
-                self.dec_simple_obj,
+                self.enc_taxonomy,
+                self.dec_taxonomy,
                 self.hr_set_taxonomy),
             'link_issue_to_node' : Xaction(
                 'Link an issue to a node',
-                self.enc_simple_obj,
-                self.dec_simple_obj,
+                self.enc_linking,
+                self.dec_linking,
                 self.hr_link_issue_to_node),
             'add_lineage' : Xaction(
                 'Link parent and children in lineage',
-                self.enc_simple_obj,
-                self.dec_simple_obj,
+                self.enc_lineage,
+                self.dec_lineage,
                 self.hr_add_lineage),
             'new_node' : Xaction(
                 'Create a new node',
@@ -84,6 +111,56 @@ class xaction_dispatch:
         """
         self.sw = sw
 
+    def decode_human_readable_batch(self, entries):
+        """
+        Given a list of transaction log entries (xid, root, time, xaction,
+        xdata), returns a list of their human readable descriptions. The
+        issues and nodes the descriptions refer to are looked up in bulk,
+        one query each for the whole list, rather than once per entry.
+        """
+        issue_ids = []
+        node_ids = []
+        for (xid, root, time, xaction, xdata) in entries:
+            if xaction in ('new_node', 'new_issue', 'update_issue'):
+                issue_ids.append(root)
+            if xaction == 'new_node':
+                node_ids.append(xdata)
+            elif xaction == 'link_issue_to_node':
+                data = self.dispatch[xaction].decode(xdata)
+                issue_ids.append(data['issue_id'])
+                node_ids.append(data['node_id'])
+
+        try:
+            if issue_ids:
+                for issue in self.sw.get_issues(issue_ids):
+                    self._issues[issue['hash_id']] = issue
+            if node_ids:
+                for node in self.sw.get_nodes(node_ids):
+                    self._nodes[get_node_id(node)] = node
+            return [self.dispatch[xaction].decode_human_readable(root, xdata)
+                    for (xid, root, time, xaction, xdata) in entries]
+        finally:
+            self._issues = {}
+            self._nodes = {}
+
+    def _get_issue(self, hash_id):
+        """
+        Returns the issue with hash_id, from the batch lookup if it is there
+        """
+        if self._issues.has_key(hash_id):
+            return self._issues[hash_id]
+        [issue] = self.sw.get_issue(None, hash_id)
+        return issue
+
+    def _get_node(self, node_id):
+        """
+        Returns the node with node_id, from the batch lookup if it is there
+        """
+        if self._nodes.has_key(node_id):
+            return self._nodes[node_id]
+        [node] = self.sw.get_node(node_id)
+        return node
+
     # The following should only be accessed through the dispatch!
     def null_callback(self, xdata=None):
         """
@@ -98,6 +175,67 @@ class xaction_dispatch:
     def dec_simple_obj(self, xdata):
         return pickle.loads(binascii.unhexlify(xdata))
 
+    def enc_compact(self, xdata, pair_keys=None):
+        """
+        Encode xdata in the compact format. If pair_keys is given and
+        xdata is exactly those two keys mapped to hex hashes, the hashes
+        are packed, otherwise xdata is pickled.
+        """
+        header = __COMPACT_MAGIC__ + __COMPACT_VERSION__
+        if pair_keys and len(xdata) == 2:
+            try:
+                (first, second) = [xdata[key] for key in pair_keys]
+                if len(first) == __HASH_LENGTH__ and len(second) == __HASH_LENGTH__:
+                    return header + __FORMAT_HASH_PAIR__ + \
+                        binascii.unhexlify(first) + binascii.unhexlify(second)
+            except (KeyError, TypeError):
+                pass
+        return header + __FORMAT_PICKLE__ + pickle.dumps(xdata, 2)
+
+    def dec_compact(self, xdata, pair_keys=None):
+        """
+        Decode xdata written by enc_compact, or by enc_simple_obj for logs
+        written before the compact format existed
+        """
+        if not self.is_compact(xdata):
+            return self.dec_simple_obj(xdata)
+        if xdata[1:2] != __COMPACT_VERSION__:
+            raise ValueError("Transaction data in unknown compact format version %r" % xdata[1:2])
+        data_format = xdata[2:3]
+        if data_format == __FORMAT_HASH_PAIR__:
+            half = __HASH_LENGTH__ / 2
+            return {
+                pair_keys[0] : binascii.hexlify(xdata[3:3 + half]),
+                pair_keys[1] : binascii.hexlify(xdata[3 + half:3 + 2 * half]),
+            }
+        if data_format != __FORMAT_PICKLE__:
+            raise ValueError("Transaction data in unknown compact format %r" % data_format)
+        return pickle.loads(xdata[3:])
+
+    def is_compact(self, xdata):
+        """
+        Returns true if xdata is in the compact format
+        """
+        return isinstance(xdata, str) and xdata[:1] == __COMPACT_MAGIC__
+
+    def enc_taxonomy(self, xdata):
+        return self.enc_compact(xdata)
+
+    def dec_taxonomy(self, xdata):
+        return self.dec_compact(xdata)
+
+    def enc_linking(self, xdata):
+        return self.enc_compact(xdata, __LINKING_KEYS__)
+
+    def dec_linking(self, xdata):
+        return self.dec_compact(xdata, __LINKING_KEYS__)
+
+    def enc_lineage(self, xdata):
+        return self.enc_compact(xdata, __LINEAGE_KEYS__)
+
+    def dec_lineage(self, xdata):
+        return self.dec_compact(xdata, __LINEAGE_KEYS__)
+
     def enc_node_id(self, xdata):
         return xdata['node_id']
 
@@ -141,8 +279,8 @@ class xaction_dispatch:
 
     def hr_link_issue_to_node(self, root, xdata):
         data = self.dispatch['link_issue_to_node'].decode(xdata)
-        [issue] = self.sw.get_issue(None, data['issue_id'])
-        [node] = self.sw.get_node(data['node_id'])
+        issue = self._get_issue(data['issue_id'])
+        node = self._get_node(data['node_id'])
         message = "Node with subject '%s' by '%s' was linked to issue with id '%s'." % (node['summary'], node['poster'], issue['short_hash_id'])
         return message
 
@@ -151,14 +289,14 @@ class xaction_dispatch:
         return "Link child node '%s' with parent node '%s'." % (data['child_id'], data['parent_id'])
 
     def hr_new_node(self, root, xdata):
-        [issue] = self.sw.get_issue(None, root)
-        [node] = self.sw.get_node(xdata)
+        issue = self._get_issue(root)
+        node = self._get_node(xdata)
         message = "Node with subject '%s' by '%s' was created for issue id '%s'." % (node['summary'], node['poster'], issue['short_hash_id'])
         return message
 
     def hr_issue_data(self, root, xdata):
         #data = self.dec_short_hash_id(xdata)
-        [issue] = self.sw.get_issue(None, root)
+        issue = self._get_issue(root)
         message = "Issue id '%s' created or changed." % issue['short_hash_id']
         return message
 
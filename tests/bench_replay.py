@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+#
+# bench_replay - Time batched against single transaction replay
+#
+# Copyright 2007 Sam Hart
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+# Author: Sam Hart
+
+"""
+Time batched against single transaction replay
+
+Fills a source hive with issues and replays its log into fresh
+destinations, once a transaction at a time and once in bulk backend calls
+([replicate] batch = yes), for each dochemistry engine. Run it from the
+top of the tree:
+
+    python tests/bench_replay.py [issues] [replies per issue]
+"""
+
+import sys
+import time
+
+import support
+from swarmlib.replicate import replicate
+from hives import docstore_hive
+
+def replay(source, path, url, batch, log):
+    dest = docstore_hive(path, log, url, {('replicate', 'batch') : batch})
+    start = time.time()
+    (errors, total) = replicate(source, dest, log).replay('bench')
+    elapsed = time.time() - start
+    if errors or dest.contents(False) != source.contents(False):
+        raise SystemExit("Replay into '%s' went wrong" % url)
+    dest.close()
+    return (total, elapsed)
+
+def main(issues=200, replies=4):
+    tmp = support.temp_dir()
+    log = support.quiet_log()
+    try:
+        source = docstore_hive(tmp.join('source'), log)
+        for i in range(issues):
+            source.add_issue(replies)
+        for engine in ('memory', 'disk'):
+            for batch in ('no', 'yes'):
+                name = "%s-%s" % (engine, batch)
+                url = 'memory://'
+                if engine == 'disk':
+                    url = 'disk://' + tmp.join(name + '.dcs')
+                (total, elapsed) = replay(source, tmp.join(name), url, batch, log)
+                print "%-8s batch=%-3s %6i transactions %8.3fs %10.0f/s" % (
+                    engine, batch, total, elapsed, total / elapsed)
+    finally:
+        tmp.cleanup()
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
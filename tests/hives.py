@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+#
+# hives - Test hives over the document store backend
+#
+# Copyright 2007 Sam Hart
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+# Author: Sam Hart
+
+"""
+Test hives over the document store backend
+
+docstore_hive has the parts of the Swarm API which replicate, clone, pull
+and snapshot use, backed by swarmlib.db.docstore in a scratch directory,
+so those modules can be tested without a database server.
+"""
+
+import os
+
+import support
+from swarmlib.xaction import xaction_dispatch
+from swarmlib.util import get_hash
+
+class hive_config:
+    """
+    An in-memory swarmrc with the swarmlib.config.Config calls used here
+    """
+    def __init__(self, dot_swarm, settings=None):
+        self.dot_swarm = dot_swarm
+        self.project_root = os.path.dirname(dot_swarm)
+        self._sections = {'main' : {}}
+        for ((section, setting), value) in (settings or {}).items():
+            self.set(section, setting, value)
+
+    def has_section(self, section):
+        return section in self._sections
+
+    def add_section(self, section):
+        self._sections.setdefault(section, {})
+
+    def has_option(self, section, setting, config_region=None):
+        return setting in self._sections.get(section, {})
+
+    def get(self, section, setting, config_region=None):
+        return self._sections.get(section, {}).get(setting)
+
+    def set(self, section, setting, value):
+        self.add_section(section)
+        self._sections[section][setting] = value
+
+    def save(self):
+        pass
+
+class hive_url:
+    """
+    What Swarm.get_hive() returns, for a local hive
+    """
+    def __init__(self, path):
+        self.scheme = ''
+        self.path = path
+
+class backend_holder:
+    pass
+
+class docstore_hive:
+    def __init__(self, path, log, url='memory://', settings=None,
+                 segments=False):
+        """
+        segments == Keep the transaction log in a segment_log in
+                    .swarm/xlog
+        """
+        from swarmlib.db.docstore import docstore
+        self.path = path
+        dot_swarm = os.path.join(path, '.swarm')
+        if not os.path.isdir(dot_swarm):
+            os.makedirs(dot_swarm)
+        self.config = hive_config(dot_swarm, settings)
+        self.xactions = xaction_dispatch()
+        self.xactions.set_swarm(self)
+        self.db = backend_holder()
+        xlog = None
+        if segments:
+            from swarmlib.db.segment_log import segment_log
+            xlog = segment_log(os.path.join(dot_swarm, 'xlog'), log)
+        self.db.backend = docstore(url, log, self.xactions, xlog)
+        self.db.backend.init()
+        self.db.backend.commit()
+        self.loaded = True
+        self._count = 0
+
+    def get_hive(self):
+        return hive_url(self.path)
+
+    def get_issues(self, hash_ids):
+        return self.db.backend.get_issues(hash_ids)
+
+    def get_issue(self, short_hash_id, hash_id):
+        return self.db.backend.get_issues([hash_id])
+
+    def get_nodes(self, node_ids):
+        return self.db.backend.get_nodes(node_ids)
+
+    def get_node(self, node_id):
+        return self.db.backend.get_nodes([node_id])
+
+    def get_thread(self, issue_id):
+        return self.db.backend.get_thread(issue_id)
+
+    def get_upstream_tracker(self, tracker_id):
+        return self.db.backend.get_upstream_tracker(tracker_id)
+
+    def iter_transaction_log(self, **args):
+        return self.db.backend.iter_transaction_log(**args)
+
+    def get_transaction_log(self, **args):
+        return self.db.backend.get_transaction_log(**args)
+
+    def close(self):
+        self.db.backend.close()
+
+    # The Swarm writes the hive server makes, which leave committing to
+    # the caller. data is {'issue' : ..., 'node' : ...} as the cli parses
+    # it.
+
+    def new_issue(self, data):
+        """
+        Add an issue and its root node, returning the issue hash id
+        """
+        backend = self.db.backend
+        issue = dict(data['issue'])
+        node = dict(data['node'])
+        issue['hash_id'] = self._hash('issue')
+        issue['issue_id'] = issue['hash_id'][:8]
+        issue['root_node'] = self._hash('node')
+        node.update({'hash_id' : issue['root_node'], 'issue_id' : None,
+                     'parent_node_id' : None})
+        backend.new_issue(issue, node.get('time'))
+        backend.new_node(node, issue['hash_id'], node.get('time'))
+        backend.link_issue_to_node({'issue_id' : issue['hash_id'],
+                                    'node_id' : node['hash_id']}, node.get('time'))
+        return issue['hash_id']
+
+    def add_node(self, data, parent_id):
+        """
+        Add a reply to parent_id in the thread of data['issue'], returning
+        the node hash id
+        """
+        backend = self.db.backend
+        issue_id = data['issue']['hash_id']
+        if not backend.get_nodes([parent_id]):
+            raise ValueError("No node '%s'" % parent_id)
+        node = dict(data['node'])
+        node.update({'hash_id' : self._hash('node'), 'issue_id' : issue_id,
+                     'parent_node_id' : parent_id})
+        backend.new_node(node, issue_id, node.get('time'))
+        backend.add_lineage({'parent_id' : parent_id, 'child_id' : node['hash_id']},
+                            issue_id, node.get('time'))
+        return node['hash_id']
+
+    # Filling a hive in
+
+    def _hash(self, kind):
+        self._count = self._count + 1
+        return get_hash(self.path, kind, str(self._count))
+
+    def add_issue(self, replies=0, attachment=None):
+        """
+        Add an issue whose root node has replies child nodes, and commit.
+        Returns the issue hash id.
+        """
+        backend = self.db.backend
+        issue_id = self._hash('issue')
+        root_id = self._hash('node')
+        backend.new_issue({'hash_id' : issue_id, 'issue_id' : issue_id[:8],
+                           'root_node' : root_id, 'status' : 1,
+                           'reporter' : 'me'}, float(self._count))
+        backend.new_node({'hash_id' : root_id, 'issue_id' : None,
+                          'parent_node_id' : None, 'summary' : 'root',
+                          'details' : 'details', 'attachment' : attachment,
+                          'poster' : 'me', 'time' : float(self._count)},
+                         issue_id, float(self._count))
+        backend.link_issue_to_node({'issue_id' : issue_id,
+                                    'node_id' : root_id}, float(self._count))
+        for i in range(replies):
+            node_id = self._hash('node')
+            backend.new_node({'hash_id' : node_id, 'issue_id' : issue_id,
+                              'parent_node_id' : root_id,
+                              'summary' : 'reply %i' % i, 'details' : 'more',
+                              'attachment' : None, 'poster' : 'you',
+                              'time' : float(self._count)},
+                             issue_id, float(self._count))
+            backend.add_lineage({'parent_id' : root_id, 'child_id' : node_id},
+                                issue_id, float(self._count))
+        backend.commit()
+        return issue_id
+
+    def contents(self, log_order=True):
+        """
+        Returns everything in the hive but the transaction log ids and
+        checkpoints, for comparing hives. Without log_order the log
+        entries are sorted, for hives replayed in batches (see
+        replicate.run_batched).
+        """
+        backend = self.db.backend
+        issues = sorted([issue['hash_id'] for issue in
+                         backend.engine.collection('issues').find()])
+        nodes = sorted([(node['hash_id'], node['issue_id'], node['summary'])
+                        for node in backend.engine.collection('nodes').find()])
+        edges = sorted([(edge['root'], edge['parent_id'], edge['child_id'])
+                        for edge in backend.engine.collection('lineage').find()])
+        xlog = [(root, xaction) for (xid, root, time, xaction, xdata) in
+                backend.get_transaction_log() if xaction != 'add_tracker']
+        if not log_order:
+            xlog.sort()
+        return (issues, nodes, edges, xlog)
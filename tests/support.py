@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+#
+# support - Shared setup for the Swarm test suite
+#
+# Copyright 2007 Sam Hart
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+# Author: Sam Hart
+
+"""
+Shared setup for the Swarm test suite
+
+Puts the source tree (and dochemistry, which lives in it) ahead of
+anything installed. Run the suite from the top of the tree with
+
+    python -m unittest discover -s tests
+
+Most of swarmlib.db needs sqlalchemy. Tests of modules which can't be
+imported here are skipped, with the reason, rather than failing.
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+from StringIO import StringIO
+
+top = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (os.path.join(top, 'dochemistry', 'lib'), top):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+# module name -> why it couldn't be imported
+_missing = {}
+
+def load(name):
+    """
+    Returns the module called name, or None if it can't be imported
+    """
+    try:
+        __import__(name)
+    except Exception, e:
+        _missing[name] = "%s: %s" % (e.__class__.__name__, e)
+        return None
+    return sys.modules[name]
+
+def missing(name):
+    """
+    The reason to skip the tests of name, after load() failed
+    """
+    return "can't import %s (%s)" % (name, _missing.get(name))
+
+def quiet_log():
+    """
+    Returns a swarmlib log instance whose entries go nowhere (errors still
+    go to stderr)
+    """
+    from swarmlib.log import log
+    quiet = log()
+    quiet._out = StringIO()
+    return quiet
+
+def captured_log():
+    """
+    Returns a quiet log instance which keeps the error entries of its
+    loggers in its errors attribute, a StringIO, instead of stderr
+    """
+    from swarmlib.log import log
+    class captured(log):
+        def get_logger(self, module_name="Unkown", loglevel=None):
+            logger = log.get_logger(self, module_name, loglevel)
+            logger._error = self.errors
+            return logger
+    quiet = captured()
+    quiet._out = StringIO()
+    quiet.errors = StringIO()
+    return quiet
+
+class temp_dir:
+    """
+    A scratch directory, removed by cleanup()
+    """
+    def __init__(self):
+        self.path = tempfile.mkdtemp(prefix='swarm-test-')
+
+    def join(self, *names):
+        return os.path.join(self.path, *names)
+
+    def cleanup(self):
+        shutil.rmtree(self.path, True)
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+#
+# test_batch_format - Tests for the replication stream format
+#
+# Copyright 2007 Sam Hart
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+# Author: Sam Hart
+
+import json
+import unittest
+
+import support
+
+from swarmlib.exceptions import BatchFormatError
+from swarmlib.batch_format import to_wire, from_wire, batch_writer, batch_reader
+
+def round_trip(value):
+    return from_wire(json.loads(json.dumps(to_wire(value))))
+
+class test_wire(unittest.TestCase):
+    def test_text(self):
+        for text in (u'\u65e5\u672c', u'caf\xe9'):
+            self.assertEqual(round_trip(text), text)
+            self.assertTrue(isinstance(round_trip(text), unicode))
+
+    def test_bytes(self):
+        for data in ('plain', 'caf\xc3\xa9', '\x00\xff\x80' * 10, ''):
+            self.assertEqual(round_trip(data), data)
+            self.assertTrue(isinstance(round_trip(data), str))
+
+    def test_nested(self):
+        value = {'details' : 'caf\xe9', 'summary' : u'\u65e5\u672c',
+                 'nodes' : [('\xff', 1, None)]}
+        self.assertEqual(round_trip(value),
+                         {'details' : 'caf\xe9', 'summary' : u'\u65e5\u672c',
+                          'nodes' : [['\xff', 1, None]]})
+
+    def test_bad_bytes(self):
+        self.assertRaises(BatchFormatError, from_wire, {u'__bytes__' : u'abc'})
+
+    def test_frames(self):
+        entries = [(1, 'a' * 40, 1.5, 'new_issue', '\x01\xfe')]
+        nodes = [{'node_id' : 'b' * 40, 'issue_id' : 'a' * 40,
+                  'details' : u'\u65e5\u672c', 'node' : '\x89PNG\r\n'}]
+        writer = batch_writer('zlib')
+        reader = batch_reader()
+        (got_entries, issues, got_nodes) = reader.read(writer.frame(entries, [], nodes))
+        self.assertEqual(got_entries, entries)
+        self.assertEqual(got_nodes, nodes)
+
+if __name__ == '__main__':
+    unittest.main()
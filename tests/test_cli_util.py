@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+#
+# test_cli_util - Tests for the command line helpers
+#
+# Copyright 2007 Sam Hart
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+# Author: Sam Hart
+
+import os
+import unittest
+
+import support
+
+cli_util = support.load('swarmlib.cli_util')
+if cli_util:
+    from swarmlib.objects import get_store, is_reference
+
+class fake_config:
+    def __init__(self, dot_swarm):
+        self.dot_swarm = dot_swarm
+
+class fake_hive:
+    def __init__(self, dot_swarm):
+        self.config = fake_config(dot_swarm)
+
+@unittest.skipIf(cli_util is None, support.missing('swarmlib.cli_util'))
+class test_print_node(unittest.TestCase):
+    def setUp(self):
+        self.tmp = support.temp_dir()
+        self.log = support.quiet_log()
+        self.sw = fake_hive(self.tmp.join('.swarm'))
+        self.util = cli_util.util(self.sw, self.log)
+        self.issue = {'short_hash_id' : 'abcd'}
+        self.order = {'short' : ['short_hash_id'], 'long' : []}
+        self.node_order = {'short' : ['summary'], 'long' : ['attachment']}
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def printed(self, node):
+        name = self.tmp.join('out')
+        fp = os.open(name, os.O_WRONLY | os.O_CREAT | os.O_TRUNC)
+        self.util.print_node(fp, self.issue, node, self.order, self.node_order)
+        os.close(fp)
+        return open(name).read()
+
+    def test_stored_attachment_is_printed(self):
+        node = get_store(self.sw, self.log).store_attachment(
+            {'summary' : 'with a file', 'attachment' : 'the file contents'})
+        self.assertTrue(is_reference(node['attachment']))
+        text = self.printed(node)
+        self.assertTrue('the file contents' in text)
+        self.assertFalse(node['attachment'] in text)
+
+    def test_stored_attachment_is_streamed(self):
+        store = get_store(self.sw, self.log)
+        attachment = ''.join([chr(i % 256) for i in range(300 * 1024)])
+        node = store.store_attachment({'summary' : 'big', 'attachment' : attachment})
+        def read(object_id):
+            self.fail("The attachment was read whole")
+        store.read = read
+        self.node_order = {'short' : ['summary'], 'long' : ['attachment', 'summary']}
+        text = self.printed(node)
+        self.assertTrue(text.endswith("\nattachment:\n%s\n\nsummary:\nbig\n" % attachment))
+
+    def test_inline_attachment(self):
+        text = self.printed({'summary' : 'inline', 'attachment' : 'inline contents'})
+        self.assertTrue('inline contents' in text)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+#
+# test_clone - Tests for snapshots and cloning
+#
+# Copyright 2007 Sam Hart
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+# Author: Sam Hart
+
+import os
+import unittest
+
+import support
+
+clone_module = support.load('swarmlib.clone')
+store = support.load('swarmlib.db.docstore')
+if clone_module and store:
+    from swarmlib.snapshot import snapshot
+    from hives import docstore_hive
+
+@unittest.skipIf(clone_module is None, support.missing('swarmlib.clone'))
+class test_snapshot_clone(unittest.TestCase):
+    def setUp(self):
+        self.tmp = support.temp_dir()
+        self.log = support.quiet_log()
+        self.source = docstore_hive(self.tmp.join('source'), self.log)
+        self.before = [self.source.add_issue(replies=2) for i in range(3)]
+        self.source.db.backend.add_upstream_tracker(
+            {'tracker_id' : 'f' * 40, 'uri' : '/upstream'}, 'f' * 40, 1.0)
+        self.source.db.backend.commit()
+        self.snapshot_xid = snapshot(self.source, self.log).write()
+        for i in range(2):
+            self.source.add_issue(replies=1)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def clone(self, source, name):
+        dest = docstore_hive(self.tmp.join(name), self.log)
+        clone_module.clone(source, dest, self.log).run()
+        return dest
+
+    def test_snapshot_leaves_out_trackers(self):
+        dest = docstore_hive(self.tmp.join('dest'), self.log)
+        snapshot(self.source, self.log).restore(self.snapshot_xid, dest)
+        self.assertEqual(dest.get_upstream_tracker('f' * 40), [])
+        self.assertEqual(dest.contents()[0], sorted(self.before))
+        for issue_id in self.before:
+            self.assertEqual(len(dest.db.backend.get_thread(issue_id)[0]), 3)
+
+    def test_bootstrapped_clone_has_the_whole_log(self):
+        first = self.clone(self.source, 'first')
+        self.assertEqual(first.contents(), self.source.contents())
+        self.assertEqual(snapshot(first, self.log).latest(), self.snapshot_xid)
+        # A clone of the clone bootstraps from the copied snapshot, and
+        # still ends up with every issue
+        second = self.clone(first, 'second')
+        self.assertEqual(second.contents(), self.source.contents())
+
+    def test_clone_of_clone_without_snapshots(self):
+        first = self.clone(self.source, 'first')
+        os.remove(snapshot(first, self.log)._path(self.snapshot_xid))
+        second = self.clone(first, 'second')
+        self.assertEqual(second.contents(), self.source.contents())
+
+    def test_interrupted_log_copy_resumes(self):
+        dest = docstore_hive(self.tmp.join('dest'), self.log)
+        backend = dest.db.backend
+        commits = []
+        def commit():
+            # The restore and the first chunk of the log get through
+            commits.append(backend.get_last_xid())
+            if len(commits) == 3:
+                raise IOError("interrupted")
+            backend.__class__.commit(backend)
+        backend.commit = commit
+        run = clone_module.clone(self.source, dest, self.log)
+        run._rep.chunk_size = 4
+        self.assertRaises(IOError, run.run)
+        backend.rollback()
+        del backend.commit
+        self.assertEqual(commits[1:], [4, 8])
+        self.assertEqual(backend.get_last_xid(), 4)
+        clone_module.clone(self.source, dest, self.log).run()
+        self.assertEqual(dest.contents(), self.source.contents())
+
+    def test_snapshot_of_a_shared_hive(self):
+        path = self.tmp.join('shared')
+        url = 'disk://' + os.path.join(path, 'hive.dcs')
+        reader = docstore_hive(path, self.log, url, segments=True)
+        writer = docstore_hive(path, self.log, url, segments=True)
+        self.addCleanup(reader.close)
+        self.addCleanup(writer.close)
+        writer.add_issue(replies=1)
+        # The reader hasn't seen the writer's commit before the snapshot,
+        # which still has to hold the tables as of the xid it is taken at
+        xid = snapshot(reader, self.log).write()
+        self.assertEqual(xid, writer.db.backend.get_last_xid())
+        dest = docstore_hive(self.tmp.join('dest'), self.log)
+        snapshot(reader, self.log).restore(xid, dest)
+        self.assertEqual(dest.contents()[:3], writer.contents()[:3])
+        # and the locks were given back
+        writer.add_issue()
+
+    def test_compact_keeps_history(self):
+        # No superseded entries to drop in this hive
+        self.assertEqual(snapshot(self.source, self.log).compact(self.snapshot_xid), 0)
+
+    def test_compact_only_taxonomy(self):
+        backend = self.source.db.backend
+        dispatch = self.source.xactions.dispatch
+        for (term, values) in (('status', ['open']), ('status', ['open', 'closed']),
+                               ('priorities', ['high']), ('status', ['new'])):
+            backend.log_transaction(None, 'set_taxonomy',
+                                    dispatch['set_taxonomy'].encode({term : values}),
+                                    None, 1.0)
+        for i in range(2):
+            backend.log_transaction(self.before[0], 'update_issue',
+                                    dispatch['update_issue'].encode({'short_hash_id' : self.before[0][:8]}),
+                                    None, 1.0)
+        backend.commit()
+        snap = snapshot(self.source, self.log)
+        self.assertEqual(snap.compact(snap.write()), 2)
+        backend.commit()
+        kept = [(xaction, dispatch[xaction].decode(xdata)) for
+                (xid, root, time, xaction, xdata) in backend.get_transaction_log()
+                if xaction in ('set_taxonomy', 'update_issue')]
+        self.assertEqual(kept, [('set_taxonomy', {'priorities' : ['high']}),
+                                ('set_taxonomy', {'status' : ['new']}),
+                                ('update_issue', {'short_hash_id' : self.before[0][:8]}),
+                                ('update_issue', {'short_hash_id' : self.before[0][:8]})])
+
+if __name__ == '__main__':
+    unittest.main()
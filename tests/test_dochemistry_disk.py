@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+#
+# test_dochemistry_disk - Tests for the dochemistry disk engine
+#
+# Copyright 2007 Sam Hart
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+# Author: Sam Hart
+
+import os
+import time
+import fcntl
+import unittest
+import threading
+
+import support
+import dochemistry
+from dochemistry import Index
+from dochemistry.exc import DoChemistryError
+
+class failing_file:
+    """
+    Wraps a file so that writes put half their bytes down and then fail,
+    as a full disk would
+    """
+    def __init__(self, fp):
+        self._fp = fp
+
+    def write(self, data):
+        self._fp.write(data[:len(data) / 2])
+        raise IOError(28, 'No space left on device')
+
+    def __getattr__(self, name):
+        return getattr(self._fp, name)
+
+class test_disk_engine(unittest.TestCase):
+    def setUp(self):
+        self.tmp = support.temp_dir()
+        self.url = 'disk://' + self.tmp.join('store.dcs')
+        engine = dochemistry.create_engine(self.url)
+        engine.create_collection('transaction_log', 'id', True,
+                                 [Index('ix_root', 'root')])
+        engine.collection('transaction_log').insert({'root' : 'a'})
+        engine.commit()
+        engine.close()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def open(self):
+        engine = dochemistry.create_engine(self.url)
+        self.addCleanup(engine.close)
+        return engine
+
+    def roots(self, engine):
+        return [(doc['id'], doc['root']) for doc in
+                engine.collection('transaction_log').find()]
+
+    def test_second_writer_sees_first_commit(self):
+        first = self.open()
+        second = self.open()
+        self.assertEqual(first.collection('transaction_log').insert({'root' : 'b'}), 2)
+        first.commit()
+        # Opened before that commit, but catches up on its first change
+        self.assertEqual(second.collection('transaction_log').insert({'root' : 'c'}), 3)
+        second.commit()
+        self.assertEqual(self.roots(self.open()), [(1, 'a'), (2, 'b'), (3, 'c')])
+
+    def test_writers_take_turns(self):
+        first = self.open()
+        second = self.open()
+        first.collection('transaction_log').insert({'root' : 'b'})
+        keys = []
+        writer = threading.Thread(target=lambda: keys.append(
+            second.collection('transaction_log').insert({'root' : 'c'})))
+        writer.start()
+        time.sleep(0.2)
+        # Blocked on the first engine's write lock
+        self.assertEqual(keys, [])
+        first.commit()
+        writer.join(5)
+        second.commit()
+        self.assertEqual(keys, [3])
+        self.assertEqual(self.roots(self.open()), [(1, 'a'), (2, 'b'), (3, 'c')])
+
+    def test_lock(self):
+        first = self.open()
+        second = self.open()
+        second.collection('transaction_log').insert({'root' : 'b'})
+        second.commit()
+        first.lock()
+        # Caught up, and holding the lock until the commit
+        self.assertEqual(self.roots(first), [(1, 'a'), (2, 'b')])
+        fp = open(first.path + '.lock', 'a')
+        self.addCleanup(fp.close)
+        self.assertRaises(IOError, fcntl.flock, fp.fileno(),
+                          fcntl.LOCK_EX | fcntl.LOCK_NB)
+        first.commit()
+        fcntl.flock(fp.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        fcntl.flock(fp.fileno(), fcntl.LOCK_UN)
+
+    def test_catches_up_after_compaction(self):
+        first = self.open()
+        second = self.open()
+        first.collection('transaction_log').update(1, {'root' : 'z'})
+        first.compact()
+        second.collection('transaction_log').insert({'root' : 'c'})
+        second.commit()
+        self.assertEqual(self.roots(self.open()), [(1, 'z'), (2, 'c')])
+
+    def test_failed_commit_leaves_no_torn_record(self):
+        engine = self.open()
+        engine.collection('transaction_log').insert({'root' : 'b'})
+        real = engine._fp
+        engine._fp = failing_file(real)
+        self.assertRaises(IOError, engine.commit)
+        engine._fp = real
+        # The changes are still pending, and committing them again (or any
+        # later commit) must survive the next open
+        engine.commit()
+        engine.collection('transaction_log').insert({'root' : 'c'})
+        engine.commit()
+        self.assertEqual(self.roots(self.open()), [(1, 'a'), (2, 'b'), (3, 'c')])
+
+    def test_unpicklable_document(self):
+        engine = self.open()
+        size = os.path.getsize(engine.path)
+        engine.collection('transaction_log').insert({'root' : 'b'})
+        engine.collection('transaction_log').insert({'root' : lambda: None})
+        self.assertRaises(Exception, engine.commit)
+        self.assertEqual(os.path.getsize(engine.path), size)
+        engine.rollback()
+        engine.collection('transaction_log').insert({'root' : 'c'})
+        engine.commit()
+        self.assertEqual(self.roots(self.open()), [(1, 'a'), (2, 'c')])
+
+    def test_crash_mid_commit(self):
+        engine = self.open()
+        engine.collection('transaction_log').insert({'root' : 'b'})
+        engine.commit()
+        engine.close()
+        fp = open(self.tmp.join('store.dcs'), 'ab')
+        fp.write('\x00\x00\x00\x40\x12\x34')
+        fp.close()
+        self.assertEqual(self.roots(self.open()), [(1, 'a'), (2, 'b')])
+
+    def test_rollback(self):
+        engine = self.open()
+        collection = engine.collection('transaction_log')
+        collection.insert({'root' : 'b'})
+        engine.rollback()
+        # The collection in hand is still the engine's
+        self.assertEqual(collection.insert({'root' : 'c'}), 2)
+        engine.commit()
+        self.assertEqual(self.roots(self.open()), [(1, 'a'), (2, 'c')])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+#
+# test_dochemistry_memory - Tests for the dochemistry memory engine
+#
+# Copyright 2007 Sam Hart
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+# Author: Sam Hart
+
+import unittest
+
+import support
+import dochemistry
+from dochemistry import Index
+
+class test_rollback(unittest.TestCase):
+    def setUp(self):
+        self.engine = dochemistry.create_engine('memory://')
+        self.xlog = self.engine.create_collection('transaction_log', 'id',
+            True, [Index('ix_root', 'root')])
+        self.xlog.insert({'root' : 'a', 'xaction' : 'new_issue'})
+        self.engine.commit()
+
+    def test_discards_pending_writes(self):
+        self.xlog.insert({'root' : 'b'})
+        self.xlog.update(1, {'root' : 'c'})
+        self.engine.bulk_write('transaction_log', [{'root' : 'd'}, {'root' : 'e'}])
+        self.engine.rollback()
+        self.assertEqual([d['root'] for d in self.xlog.find()], ['a'])
+        self.assertEqual([d['id'] for d in self.xlog.find({'root' : 'a'})], [1])
+        self.assertEqual(self.xlog.find_one({'root' : 'c'}), None)
+        # The counter is back too, so the next key is handed out again
+        self.assertEqual(self.xlog.insert({'root' : 'f'}), 2)
+
+    def test_restores_deleted_and_dropped(self):
+        self.xlog.delete(1)
+        self.engine.drop_collection('transaction_log')
+        self.engine.create_collection('scratch')
+        self.engine.rollback()
+        self.assertEqual(self.engine.collection_names(), ['transaction_log'])
+        self.assertEqual(self.engine.collection('transaction_log').get(1)['root'], 'a')
+
+    def test_nothing_pending(self):
+        self.engine.rollback()
+        self.assertEqual(len(self.xlog), 1)
+
+    def test_commit_is_kept(self):
+        self.xlog.insert({'root' : 'b'})
+        self.engine.commit()
+        self.engine.rollback()
+        self.assertEqual(len(self.xlog), 2)
+
+class test_snapshot(unittest.TestCase):
+    def setUp(self):
+        self.tmp = support.temp_dir()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_round_trip(self):
+        path = self.tmp.join('store')
+        engine = dochemistry.create_engine('memory://')
+        xlog = engine.create_collection('transaction_log', 'id', True,
+            [Index('ix_root_time', 'root', 'time')])
+        xlog.insert({'root' : 'a', 'time' : 1.0})
+        xlog.insert({'root' : 'b', 'time' : 2.0})
+        engine.commit()
+        engine.snapshot(path)
+
+        again = dochemistry.create_engine('memory://' + path)
+        loaded = again.collection('transaction_log')
+        self.assertEqual([(i.name, i.fields) for i in loaded.indexes()],
+                         [('ix_root_time', ('root', 'time'))])
+        self.assertEqual([d['root'] for d in loaded.find({'root' : 'b'})], ['b'])
+        self.assertEqual(loaded.insert({'root' : 'c', 'time' : 3.0}), 3)
+
+if __name__ == '__main__':
+    unittest.main()
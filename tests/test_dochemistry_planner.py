@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+#
+# test_dochemistry_planner - Tests of how dochemistry walks the keys of a query
+#
+# Copyright 2007 Sam Hart
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+# Author: Sam Hart
+
+import unittest
+
+import support
+import dochemistry
+from dochemistry import Index
+from dochemistry import planner
+
+class test_keys_for(unittest.TestCase):
+    def setUp(self):
+        self.engine = dochemistry.create_engine('memory://')
+        self.xlog = self.engine.create_collection('transaction_log', 'id', True,
+            [Index('ix_root', 'root'), Index('ix_time', 'time')])
+        self.engine.bulk_write('transaction_log',
+            [{'root' : 'abc'[i % 3], 'time' : float(1000 - i)} for i in range(1000)])
+        self.engine.commit()
+        self.fetched = []
+        fetch = self.xlog._fetch
+        def counted(key):
+            self.fetched.append(key)
+            return fetch(key)
+        self.xlog._fetch = counted
+
+    def ids(self, spec=None, reverse=False, limit=None):
+        self.fetched = []
+        return [doc['id'] for doc in self.xlog.find(spec, reverse, limit)]
+
+    def plan(self, spec):
+        return planner.choose(self.xlog, dochemistry.base.normalize_spec(spec)).describe()
+
+    def test_scan(self):
+        self.assertEqual(self.ids(limit=3), [1, 2, 3])
+        self.assertEqual(self.ids(reverse=True, limit=3), [1000, 999, 998])
+        self.assertEqual(self.fetched, [1000, 999, 998])
+
+    def test_key_range(self):
+        spec = {'id' : {'$gt' : 500}}
+        self.assertEqual(self.plan(spec), 'keyrange')
+        self.assertEqual(self.ids(spec, limit=2), [501, 502])
+        self.assertEqual(self.fetched, [501, 502])
+        self.assertEqual(self.ids({'id' : {'$lt' : 500}}, reverse=True, limit=2),
+                         [499, 498])
+        self.assertEqual(len(self.ids(spec)), 500)
+
+    def test_index_equality(self):
+        spec = {'root' : 'b'}
+        self.assertEqual(self.plan(spec), 'index ix_root (root)')
+        self.assertEqual(self.ids(spec, reverse=True, limit=2), [998, 995])
+        self.assertEqual(self.fetched, [998, 995])
+        self.assertEqual(self.ids(spec, limit=2), [2, 5])
+
+    def test_index_range_keeps_key_order(self):
+        spec = {'time' : {'$lte' : 5.0}}
+        self.assertEqual(self.plan(spec), 'index ix_time (time)')
+        self.assertEqual(self.ids(spec), [996, 997, 998, 999, 1000])
+        self.assertEqual(self.ids(spec, reverse=True, limit=2), [1000, 999])
+        self.assertEqual(self.fetched, [1000, 999])
+
+    def test_keys_are_walked_lazily(self):
+        spec = dochemistry.base.normalize_spec({'root' : 'a'})
+        keys = planner.keys_for(self.xlog, spec, planner.choose(self.xlog, spec))
+        self.assertFalse(isinstance(keys, list))
+        self.assertEqual(keys.next(), 1)
+
+if __name__ == '__main__':
+    unittest.main()
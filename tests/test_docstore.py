@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+#
+# test_docstore - Tests for the document store backend
+#
+# Copyright 2007 Sam Hart
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+# Author: Sam Hart
+
+import os
+import unittest
+
+import support
+
+store = support.load('swarmlib.db.docstore')
+
+__ISSUE__ = 'a' * 40
+__NODE__ = 'b' * 40
+__CHILD__ = 'c' * 40
+
+class config_stub:
+    """
+    Just enough of swarmlib.config.Config for from_config
+    """
+    def __init__(self, dot_swarm, url):
+        self.dot_swarm = dot_swarm
+        self._url = url
+
+    def has_option(self, section, setting):
+        return (section, setting) == ('db', 'url')
+
+    def get(self, section, setting):
+        return self._url
+
+@unittest.skipIf(store is None, support.missing('swarmlib.db.docstore'))
+class test_docstore(unittest.TestCase):
+    def setUp(self):
+        self.db = store.docstore('memory://', support.quiet_log())
+        self.db.init()
+        self.db.commit()
+
+    def transactions(self):
+        return [(root, xaction) for (xid, root, time, xaction, xdata) in
+                self.db.get_transaction_log()]
+
+    def test_replicated_log_transaction(self):
+        self.assertEqual(self.db.log_transaction('0', 'xlog_start', None, 1, 1.0, True), 1)
+        # Replaying the same entry again leaves it alone
+        self.assertEqual(self.db.log_transaction('0', 'xlog_start', None, 1, 1.0, True), 1)
+        self.assertEqual(self.transactions(), [('0', 'xlog_start')])
+
+    def test_changes_are_logged(self):
+        self.db.new_issue({'hash_id' : __ISSUE__, 'issue_id' : 'a'}, 1.0)
+        self.db.new_node({'hash_id' : __NODE__, 'issue_id' : None}, __ISSUE__, 2.0)
+        self.db.link_issue_to_node({'issue_id' : __ISSUE__, 'node_id' : __NODE__}, 3.0)
+        self.db.new_node({'hash_id' : __CHILD__, 'issue_id' : __ISSUE__}, __ISSUE__, 4.0)
+        self.db.add_lineage({'parent_id' : __NODE__, 'child_id' : __CHILD__}, __ISSUE__, 5.0)
+        self.db.add_upstream_tracker({'tracker_id' : 'd' * 40, 'uri' : '/x'}, __ISSUE__, 6.0)
+        self.db.commit()
+        self.assertEqual([xaction for (root, xaction) in self.transactions()],
+            ['new_issue', 'new_node', 'link_issue_to_node', 'new_node',
+             'add_lineage', 'add_tracker'])
+        self.assertEqual(self.db.get_nodes([__NODE__])[0]['issue_id'], __ISSUE__)
+        (nodes, edges) = self.db.get_thread(__ISSUE__)
+        self.assertEqual(edges, [(__NODE__, __CHILD__)])
+        self.assertEqual(self.db.get_upstream_tracker('d' * 40)[0]['uri'], '/x')
+
+    def test_bulk_calls_take_argument_tuples(self):
+        self.db.new_issues([({'hash_id' : __ISSUE__, 'issue_id' : 'a'}, 1.0)])
+        self.db.new_nodes([({'hash_id' : __NODE__, 'issue_id' : __ISSUE__}, __ISSUE__, 2.0),
+                           ({'hash_id' : __CHILD__, 'issue_id' : __ISSUE__}, __ISSUE__, 2.0)])
+        self.db.add_lineages([({'parent_id' : __NODE__, 'child_id' : __CHILD__}, __ISSUE__, 3.0)])
+        self.db.link_issues_to_nodes([({'issue_id' : __ISSUE__, 'node_id' : __NODE__}, 4.0)])
+        self.assertEqual(len(self.db.get_issues([__ISSUE__])), 1)
+        self.assertEqual(len(self.transactions()), 5)
+        self.assertEqual(self.db.get_thread(__ISSUE__)[1], [(__NODE__, __CHILD__)])
+
+    def test_thread_with_unlinked_root(self):
+        # The root hasn't been linked to the issue (issue_id is None)
+        self.db.new_issue({'hash_id' : __ISSUE__, 'issue_id' : 'a',
+                           'root_node' : __NODE__}, 1.0)
+        self.db.new_node({'hash_id' : __NODE__, 'issue_id' : None,
+                          'details' : 'long'}, __ISSUE__, 2.0)
+        (nodes, edges) = self.db.get_thread(__ISSUE__)
+        self.assertEqual(nodes, [{'hash_id' : __NODE__, 'issue_id' : None}])
+        self.assertEqual(edges, [])
+        # Once it has a reply it is found through the lineage too, and
+        # still only listed once
+        self.db.new_node({'hash_id' : __CHILD__, 'issue_id' : __ISSUE__}, __ISSUE__, 3.0)
+        self.db.add_lineage({'parent_id' : __NODE__, 'child_id' : __CHILD__}, __ISSUE__, 4.0)
+        (nodes, edges) = self.db.get_thread(__ISSUE__)
+        self.assertEqual(sorted([node['hash_id'] for node in nodes]), [__NODE__, __CHILD__])
+        self.assertEqual(edges, [(__NODE__, __CHILD__)])
+
+    def test_rollback(self):
+        self.db.new_issue({'hash_id' : __ISSUE__, 'issue_id' : 'a'}, 1.0)
+        self.db.rollback()
+        self.assertEqual(self.db.get_issues([__ISSUE__]), [])
+        self.assertEqual(self.transactions(), [])
+
+@unittest.skipIf(store is None, support.missing('swarmlib.db.docstore'))
+class test_from_config(unittest.TestCase):
+    def setUp(self):
+        self.tmp = support.temp_dir()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_relative_url(self):
+        # A hive copied elsewhere finds its store under its own .swarm
+        for name in ('one', 'two'):
+            dot_swarm = self.tmp.join(name, '.swarm')
+            os.makedirs(dot_swarm)
+            db = store.from_config(config_stub(dot_swarm, 'disk://swarm.dcs'), support.quiet_log())
+            db.close()
+            self.assertEqual(db.url, 'disk://' + os.path.join(dot_swarm, 'swarm.dcs'))
+            self.assertTrue(os.path.isfile(os.path.join(dot_swarm, 'swarm.dcs')))
+
+    def test_absolute_url(self):
+        path = self.tmp.join('elsewhere.dcs')
+        db = store.from_config(config_stub(self.tmp.join('.swarm'), 'disk://' + path), support.quiet_log())
+        db.close()
+        self.assertEqual(db.url, 'disk://' + path)
+
+if __name__ == '__main__':
+    unittest.main()
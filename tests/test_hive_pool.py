@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+#
+# test_hive_pool - Tests for the pool of open hives swarmd keeps
+#
+# Copyright 2007 Sam Hart
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+# Author: Sam Hart
+
+import time
+import unittest
+
+import support
+
+from swarmlib.hive_pool import hive_pool
+
+class fake_hive:
+    def __init__(self, key, opened):
+        self.key = key
+        self.closed = False
+        opened.append(self)
+
+    def close(self):
+        self.closed = True
+
+class test_hive_pool(unittest.TestCase):
+    def setUp(self):
+        self.opened = []
+        self.stamps = {}
+        self.pool = hive_pool(lambda key: fake_hive(key, self.opened),
+                              support.quiet_log(), size=2,
+                              stamp=self.stamps.get)
+
+    def test_reuse(self):
+        hive = self.pool.acquire('a')
+        self.pool.release(hive)
+        self.assertTrue(self.pool.acquire('a') is hive)
+        self.assertEqual(len(self.opened), 1)
+        # A hive in use isn't handed out twice
+        other = self.pool.acquire('a')
+        self.assertFalse(other is hive)
+        self.assertEqual(len(self.opened), 2)
+
+    def test_release_without_keeping(self):
+        hive = self.pool.acquire('a')
+        self.pool.release(hive, False)
+        self.assertTrue(hive.closed)
+        self.assertFalse(self.pool.acquire('a') is hive)
+
+    def test_one_idle_hive_per_key(self):
+        first = self.pool.acquire('a')
+        second = self.pool.acquire('a')
+        self.pool.release(first)
+        self.pool.release(second)
+        self.assertTrue(first.closed)
+        self.assertTrue(self.pool.acquire('a') is second)
+
+    def test_least_recently_used_is_evicted(self):
+        hives = [self.pool.acquire(key) for key in ('a', 'b', 'c')]
+        for hive in hives:
+            self.pool.release(hive)
+        self.assertEqual([hive.closed for hive in hives], [True, False, False])
+        self.assertTrue(self.pool.acquire('b') is hives[1])
+        self.assertTrue(self.pool.acquire('c') is hives[2])
+
+    def test_changed_stamp_reopens(self):
+        self.stamps['a'] = 1
+        hive = self.pool.acquire('a')
+        self.pool.release(hive)
+        self.stamps['a'] = 2
+        again = self.pool.acquire('a')
+        self.assertTrue(hive.closed)
+        self.assertFalse(again is hive)
+
+    def test_expire(self):
+        hive = self.pool.acquire('a')
+        self.pool.release(hive)
+        self.pool.expire()
+        self.assertFalse(hive.closed)
+        self.pool.idle = 0
+        time.sleep(0.01)
+        self.pool.expire()
+        self.assertTrue(hive.closed)
+
+    def test_discard_leased(self):
+        leased = self.pool.acquire('a')
+        idle = self.pool.acquire('b')
+        self.pool.release(idle)
+        self.pool.discard_leased()
+        self.assertEqual((leased.closed, idle.closed), (True, False))
+        self.pool.close()
+        self.assertTrue(idle.closed)
+
+if __name__ == '__main__':
+    unittest.main()
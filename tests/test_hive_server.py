@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+#
+# test_hive_server - Tests for the hive server
+#
+# Copyright 2007 Sam Hart
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+# Author: Sam Hart
+
+import os
+import urlparse
+import unittest
+import threading
+
+import support
+
+server_module = support.load('swarmlib.hive_server')
+connect = support.load('swarmlib.connect')
+store = support.load('swarmlib.db.docstore')
+if server_module and store:
+    from hives import docstore_hive
+
+    class half_writing_hive(docstore_hive):
+        """
+        A hive whose add_node() fails after writing the node when its
+        summary is 'bad'
+        """
+        def add_node(self, data, parent_id):
+            node_id = docstore_hive.add_node(self, data, parent_id)
+            if data['node']['summary'] == 'bad':
+                raise ValueError("half written")
+            return node_id
+
+def new_issue_data(summary):
+    return {'issue' : {'status' : 1, 'reporter' : 'me'},
+            'node' : {'summary' : summary, 'details' : 'details',
+                      'attachment' : None, 'poster' : 'me', 'time' : 1.0}}
+
+def reply_data(issue_id, summary):
+    return {'issue' : {'hash_id' : issue_id},
+            'node' : {'summary' : summary, 'details' : 'more',
+                      'attachment' : None, 'poster' : 'you', 'time' : 2.0}}
+
+class fake_channel:
+    def __init__(self):
+        self.replies = []
+        self.blocked = False
+
+    def respond(self, reply):
+        self.replies.append(reply)
+
+@unittest.skipIf(server_module is None, support.missing('swarmlib.hive_server'))
+class test_tcp_is_read_only(unittest.TestCase):
+    def setUp(self):
+        self.tmp = support.temp_dir()
+        self.log = support.quiet_log()
+        self.sw = docstore_hive(self.tmp.join('hive'), self.log)
+        self.issue_id = self.sw.add_issue()
+        self.server = server_module.hive_server(self.sw, self.log,
+                                                address=('127.0.0.1', 0))
+        self.channel = fake_channel()
+
+    def tearDown(self):
+        self.server.close()
+        self.tmp.cleanup()
+
+    def test_writes_refused(self):
+        for (op, args) in (('new_issue', [{}]), ('add_node', [{}, 'a' * 40])):
+            self.server._handle(self.channel, {'id' : 1, 'op' : op, 'args' : args})
+            [reply] = self.channel.replies
+            self.assertTrue('error' in reply)
+            self.assertEqual(self.server.writes, [])
+            self.assertFalse(self.channel.blocked)
+            self.channel.replies = []
+
+    def test_reads_answered(self):
+        self.server._handle(self.channel, {'id' : 1, 'op' : 'get_lineage',
+                                           'args' : [self.issue_id]})
+        [reply] = self.channel.replies
+        self.assertEqual(reply, {'id' : 1, 'result' : []})
+
+@unittest.skipIf(server_module is None or connect is None,
+                 support.missing('swarmlib.hive_server'))
+class test_unix_server(unittest.TestCase):
+    def setUp(self):
+        self.tmp = support.temp_dir()
+        self.log = support.captured_log()
+        self.url = 'disk://' + self.tmp.join('hive.dcs')
+        self.sw = half_writing_hive(self.tmp.join('hive'), self.log, self.url)
+        self.issue_id = self.sw.add_issue()
+        [issue] = self.sw.get_issues([self.issue_id])
+        self.root_id = issue['root_node']
+        self.poll_timeout = server_module.__POLL_TIMEOUT__
+        server_module.__POLL_TIMEOUT__ = 0.05
+        self.server = server_module.hive_server(self.sw, self.log)
+        self.thread = threading.Thread(target=self.server.serve)
+        self.thread.start()
+        self.clients = []
+
+    def tearDown(self):
+        for client in self.clients:
+            client.close()
+        self.server.stop()
+        self.thread.join()
+        server_module.__POLL_TIMEOUT__ = self.poll_timeout
+        self.assertFalse(os.path.exists(self.server.path))
+        self.tmp.cleanup()
+
+    def client(self):
+        if not self.clients:
+            client = server_module.connect_unix(self.server.path)
+        else:
+            # The second one through a swarm+unix URL
+            url = urlparse.urlparse('swarm+unix://' + self.tmp.join('hive'))
+            client = connect.get_connection(url, self.log).get_client()
+        self.clients.append(client)
+        return client
+
+    def committed(self):
+        """
+        Returns (issues, nodes) as a fresh reader of the hive sees them
+        """
+        reader = docstore_hive(self.tmp.join('reader'), self.log, self.url)
+        (issues, nodes, edges, xlog) = reader.contents()
+        reader.close()
+        return (issues, [summary for (node_id, issue_id, summary) in nodes])
+
+    def test_pipelined_reads_and_writes(self):
+        (first, second) = (self.client(), self.client())
+        answers = {}
+        def run(name, client):
+            answers[name] = client.pipeline(
+                [('get_lineage', [self.issue_id]),
+                 ('add_node', [reply_data(self.issue_id, name), self.root_id]),
+                 ('get_lineage', [self.issue_id]),
+                 ('new_issue', [new_issue_data(name + ' issue')]),
+                 ('get_issues', [[self.issue_id]])])
+        other = threading.Thread(target=run, args=('second', second))
+        other.start()
+        run('first', first)
+        other.join()
+
+        for name in ('first', 'second'):
+            (before, node_id, after, issue_id, issues) = answers[name]
+            # In the order asked, with the client's own write read back
+            self.assertTrue([self.root_id, node_id] in after)
+            self.assertFalse([self.root_id, node_id] in before)
+            self.assertEqual(len(issue_id), 40)
+            self.assertEqual([issue['hash_id'] for issue in issues], [self.issue_id])
+        (issues, summaries) = self.committed()
+        self.assertEqual(len(issues), 3)
+        self.assertEqual(sorted(summaries), ['first', 'first issue', 'root',
+                                             'second', 'second issue'])
+
+    def test_failed_write_leaves_no_trace(self):
+        client = self.client()
+        try:
+            client.pipeline([('add_node', [reply_data(self.issue_id, 'good'), self.root_id]),
+                             ('add_node', [reply_data(self.issue_id, 'bad'), self.root_id]),
+                             ('add_node', [reply_data(self.issue_id, 'also good'), self.root_id])])
+        except server_module.HiveServerError, e:
+            self.assertTrue("half written" in str(e))
+        else:
+            self.fail("The bad write succeeded")
+        self.assertEqual(sorted(self.committed()[1]), ['also good', 'good', 'root'])
+        self.assertTrue("'add_node' failed: half written" in self.log.errors.getvalue())
+
+    def test_failed_commit_is_rolled_back(self):
+        backend = self.sw.db.backend
+        commit = backend.commit
+        def fail_once():
+            backend.commit = commit
+            raise IOError("disk full")
+        backend.commit = fail_once
+        client = self.client()
+        self.assertRaises(server_module.HiveServerError, client.new_issue,
+                          new_issue_data('lost'))
+        client.new_issue(new_issue_data('kept'))
+        self.assertEqual(sorted(self.committed()[1]), ['kept', 'root'])
+        self.assertTrue("Commit failed: disk full" in self.log.errors.getvalue())
+
+if __name__ == '__main__':
+    unittest.main()
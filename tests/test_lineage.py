@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+#
+# test_lineage - Tests for node DAGs and the node cache
+#
+# Copyright 2007 Sam Hart
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+# Author: Sam Hart
+
+import unittest
+import threading
+
+import support
+from swarmlib.util import get_node_id
+from swarmlib.lineage import node_dag, node_cache
+
+class rows_hive:
+    """
+    A hive whose node lookups return nodes table rows, keyed 'hash_id',
+    as swarmlib.db.queries and the docstore backend do
+    """
+    def __init__(self, nodes):
+        self.nodes = dict([(node['hash_id'], node) for node in nodes])
+        self.lookups = 0
+        # The threads lookups were made from
+        self.threads = set()
+
+    def get_node(self, node_id):
+        self.lookups = self.lookups + 1
+        return [self.nodes[node_id]]
+
+    def get_nodes(self, node_ids):
+        self.lookups = self.lookups + 1
+        self.threads.add(threading.currentThread())
+        return [self.nodes[node_id] for node_id in node_ids]
+
+class test_node_ids(unittest.TestCase):
+    def setUp(self):
+        self.nodes = [{'hash_id' : 'a', 'time' : 1.0},
+                      {'hash_id' : 'b', 'time' : 2.0},
+                      {'hash_id' : 'c', 'time' : 3.0}]
+
+    def test_get_node_id(self):
+        self.assertEqual(get_node_id({'hash_id' : 'a'}), 'a')
+        self.assertEqual(get_node_id({'node_id' : 'b', 'hash_id' : 'a'}), 'b')
+
+    def test_dag_from_rows(self):
+        dag = node_dag(self.nodes, [('a', 'b'), ('a', 'c')])
+        self.assertEqual([get_node_id(n) for n in dag.get_children('a')], ['b', 'c'])
+        self.assertEqual([get_node_id(n) for n in dag.get_parents('c')], ['a'])
+
+    def test_cache_from_rows(self):
+        sw = rows_hive(self.nodes)
+        cache = node_cache(sw, support.quiet_log(), 2, False)
+        cache.prefetch(['a', 'b'])
+        self.assertEqual(cache.get('a')['time'], 1.0)
+        self.assertEqual(cache.get('b')['time'], 2.0)
+        self.assertEqual(sw.lookups, 1)
+
+    def test_cache_prefetches_in_the_callers_thread(self):
+        # The Swarm instance may not be usable from other threads, so
+        # prefetching only goes to the background when asked to
+        sw = rows_hive(self.nodes)
+        cache = node_cache(sw, support.quiet_log())
+        cache.prefetch(['a', 'b'])
+        self.assertEqual(sw.threads, set([threading.currentThread()]))
+
+if __name__ == '__main__':
+    unittest.main()
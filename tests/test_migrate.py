@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+#
+# test_migrate - Tests for the database migrations
+#
+# Copyright 2007 Sam Hart
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+# Author: Sam Hart
+
+import unittest
+
+import support
+
+migrate = support.load('swarmlib.db.migrate')
+if migrate:
+    from sqlalchemy import create_engine, select
+    from swarmlib.db.db_bits import metadata
+    from swarmlib.db.schema import transaction_log_table, lineage_table, \
+                                   issues_table, nodes_table
+    from swarmlib.xaction import xaction_dispatch
+
+@unittest.skipIf(migrate is None, support.missing('swarmlib.db.migrate'))
+class test_index_lineage(unittest.TestCase):
+    def setUp(self):
+        self.connection = create_engine('sqlite://').connect()
+        # A hive from before the lineage table
+        metadata.create_all(bind=self.connection, tables=[issues_table,
+                            nodes_table, transaction_log_table])
+        self.xactions = xaction_dispatch()
+        self.logger = support.quiet_log().get_logger('test')
+        self.edges = [('a' * 40, 'b' * 40, 'c' * 40),
+                      ('a' * 40, 'c' * 40, 'd' * 40),
+                      ('e' * 40, 'f' * 40, '1' * 40)]
+        for (i, (root, parent_id, child_id)) in enumerate(self.edges):
+            self.log('new_node', root, {'node_id' : child_id})
+            self.log('add_lineage', root, {'parent_id' : parent_id,
+                                           'child_id' : child_id}, float(i))
+
+    def tearDown(self):
+        self.connection.close()
+
+    def log(self, xaction, root, data, time=None):
+        self.connection.execute(transaction_log_table.insert(), root=root,
+            time=time, transaction=xaction,
+            transaction_data=self.xactions.dispatch[xaction].encode(data))
+
+    def lineage(self):
+        c = lineage_table.c
+        return [tuple(row) for row in self.connection.execute(
+            select([c.root, c.parent_id, c.child_id], order_by=[c.id]))]
+
+    def test_backfill(self):
+        migrate.index_lineage(self.connection, self.xactions, self.logger)
+        self.assertEqual(self.lineage(), self.edges)
+
+    def test_backfill_runs_once(self):
+        migrate.index_lineage(self.connection, self.xactions, self.logger)
+        migrate.index_lineage(self.connection, self.xactions, self.logger)
+        self.assertEqual(self.lineage(), self.edges)
+
+class fake_config:
+    def __init__(self, migration=None):
+        self.values = {}
+        if migration is not None:
+            self.values['migration'] = migration
+        self.saved = None
+
+    def has_option(self, section, setting):
+        return setting in self.values
+
+    def get(self, section, setting):
+        return self.values[setting]
+
+    def set(self, section, setting, value):
+        self.values[setting] = value
+
+    def save(self):
+        self.saved = self.values.get('migration')
+
+@unittest.skipIf(migrate is None, support.missing('swarmlib.db.migrate'))
+class test_run(unittest.TestCase):
+    def setUp(self):
+        self.migrations = migrate.migrations
+        self.events = []
+
+    def tearDown(self):
+        migrate.migrations = self.migrations
+
+    def migration(self, name, fail=False):
+        def run(connection, xactions, logger):
+            if fail:
+                raise RuntimeError(name)
+            self.events.append(name)
+        return (name, run)
+
+    def commit(self):
+        self.events.append('commit')
+
+    def test_counted_after_commit(self):
+        migrate.migrations = [self.migration('first'), self.migration('second')]
+        config = fake_config()
+        migrate.run(None, config, None, support.quiet_log(), self.commit)
+        self.assertEqual(self.events, ['first', 'commit', 'second', 'commit'])
+        self.assertEqual(config.saved, '2')
+
+    def test_failed_migration_not_counted(self):
+        migrate.migrations = [self.migration('first'),
+                              self.migration('second', fail=True)]
+        config = fake_config()
+        self.assertRaises(RuntimeError, migrate.run, None, config, None,
+                          support.quiet_log(), self.commit)
+        self.assertEqual(config.saved, '1')
+
+    def test_failed_commit_not_counted(self):
+        def commit():
+            raise RuntimeError('commit')
+        migrate.migrations = [self.migration('first')]
+        config = fake_config()
+        self.assertRaises(RuntimeError, migrate.run, None, config, None,
+                          support.quiet_log(), commit)
+        self.assertEqual(config.saved, None)
+
+if __name__ == '__main__':
+    unittest.main()
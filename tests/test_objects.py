@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+#
+# test_objects - Tests of the attachment object store
+#
+# Copyright 2007 Sam Hart
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+# Author: Sam Hart
+
+import os
+import hashlib
+import threading
+import unittest
+from StringIO import StringIO
+
+import support
+
+objects = support.load('swarmlib.objects')
+remote_module = support.load('swarmlib.remote')
+store = support.load('swarmlib.db.docstore')
+if remote_module and store:
+    from swarmlib import hive_server
+    from hives import docstore_hive
+
+@unittest.skipIf(objects is None, support.missing('swarmlib.objects'))
+class test_object_store(unittest.TestCase):
+    def setUp(self):
+        self.tmp = support.temp_dir()
+        self.log = support.quiet_log()
+        self.store = objects.object_store(self.tmp.join('objects'), self.log)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def leftovers(self, store):
+        return [name for name in os.listdir(store.path) if name.startswith('tmp-')]
+
+    def test_put_names_by_hash(self):
+        object_id = self.store.put('some bytes')
+        self.assertEqual(object_id, hashlib.sha1('some bytes').hexdigest())
+        self.assertEqual(self.store.path_of(object_id),
+                         self.tmp.join('objects', object_id[:2], object_id[2:]))
+        self.assertTrue(self.store.has(object_id))
+        self.assertEqual(self.store.read(object_id), 'some bytes')
+        # The same contents are the same object
+        self.assertEqual(self.store.put('some bytes'), object_id)
+        self.assertEqual(self.leftovers(self.store), [])
+
+    def test_put_file(self):
+        data = 'x' * (objects.__CHUNK_SIZE__ * 2 + 10)
+        object_id = self.store.put_file(StringIO(data))
+        self.assertEqual(object_id, hashlib.sha1(data).hexdigest())
+        self.assertEqual(''.join(self.store.iter_chunks(object_id)), data)
+        self.assertEqual(self.store.size(object_id), len(data))
+
+    def test_corrupted_object_is_refused(self):
+        expected = hashlib.sha1('the real thing').hexdigest()
+        self.assertRaises(ValueError, self.store.put_file,
+                          StringIO('something else'), expected)
+        self.assertFalse(self.store.has(expected))
+        self.assertFalse(self.store.has(hashlib.sha1('something else').hexdigest()))
+        self.assertEqual(self.leftovers(self.store), [])
+        self.assertEqual(self.store.put_file(StringIO('the real thing'), expected),
+                         expected)
+
+    def test_copy_from_skips_what_is_there(self):
+        source = objects.object_store(self.tmp.join('source'), self.log)
+        ids = [source.put('object %i' % i) for i in range(3)]
+        self.store.put('object 0')
+        opened = []
+        real_open = source.open
+        def counted(object_id):
+            opened.append(object_id)
+            return real_open(object_id)
+        source.open = counted
+        self.assertEqual(self.store.copy_from(source, ids), 2)
+        self.assertEqual(sorted(opened), sorted(ids[1:]))
+        self.assertEqual(self.store.missing(ids), [])
+        self.assertEqual(self.store.copy_from(source, ids), 0)
+
+    def test_empty_object(self):
+        object_id = self.store.put('')
+        self.assertEqual(self.store.map(object_id), '')
+        self.assertEqual(self.store.read(object_id), '')
+
+    def test_attachments(self):
+        node = self.store.store_attachment({'attachment' : 'attached'})
+        self.assertTrue(objects.is_reference(node['attachment']))
+        self.assertEqual(self.store.load_attachment(node), 'attached')
+        self.assertEqual(self.store.store_attachment(node), node)
+        self.assertEqual(objects.node_references([node, node, {'attachment' : 'inline'}]),
+                         [objects.reference_id(node['attachment'])])
+
+@unittest.skipIf(remote_module is None or store is None,
+                 support.missing('swarmlib.remote'))
+class test_fetch_objects(unittest.TestCase):
+    def setUp(self):
+        self.tmp = support.temp_dir()
+        self.log = support.quiet_log()
+        self.source = docstore_hive(self.tmp.join('source'), self.log)
+        source_store = objects.get_store(self.source, self.log)
+        # Big enough to be sent in several pieces
+        self.data = [''.join([chr((i * j) % 256) for j in range(150 * 1024)])
+                     for i in range(3)] + ['']
+        self.ids = [source_store.put(data) for data in self.data]
+        self.poll_timeout = hive_server.__POLL_TIMEOUT__
+        hive_server.__POLL_TIMEOUT__ = 0.05
+        self.server = hive_server.hive_server(self.source, self.log,
+                                              address=('127.0.0.1', 0))
+        self.thread = threading.Thread(target=self.server.serve)
+        self.thread.start()
+        url = "swarm://127.0.0.1:%i%s" % (self.server.socket.getsockname()[1],
+                                          self.source.path)
+        self.remote = remote_module.remote_hive(url, self.log)
+        self.dest = objects.object_store(self.tmp.join('dest'), self.log)
+
+    def tearDown(self):
+        self.remote.close()
+        self.server.stop()
+        self.thread.join()
+        hive_server.__POLL_TIMEOUT__ = self.poll_timeout
+        self.tmp.cleanup()
+
+    def test_fetch(self):
+        self.assertEqual(self.remote.fetch_objects(self.ids, self.dest), len(self.ids))
+        for (object_id, data) in zip(self.ids, self.data):
+            self.assertEqual(self.dest.read(object_id), data)
+
+    def test_missing_object(self):
+        missing = hashlib.sha1('nowhere').hexdigest()
+        self.assertRaises(remote_module.HiveServerError,
+                          self.remote.fetch_objects, [self.ids[0], missing], self.dest)
+        # What did arrive is kept, and the connection still works
+        self.assertTrue(self.dest.has(self.ids[0]))
+        self.assertEqual(self.remote.fetch_objects(self.ids[1:2], self.dest), 1)
+
+    def test_copy_objects_from_remote(self):
+        sw = docstore_hive(self.tmp.join('dest-hive'), self.log)
+        objects.get_store(sw, self.log).put(self.data[0])
+        fetched = []
+        real = self.remote.fetch_objects
+        def counted(object_ids, store):
+            fetched.extend(object_ids)
+            return real(object_ids, store)
+        self.remote.fetch_objects = counted
+        self.assertEqual(objects.copy_objects(self.remote, sw, self.ids, self.log), 3)
+        self.assertEqual(fetched, self.ids[1:])
+        self.assertEqual(objects.get_store(sw, self.log).missing(self.ids), [])
+
+if __name__ == '__main__':
+    unittest.main()
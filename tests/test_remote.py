@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+#
+# test_remote - Tests of cloning from a hive server over TCP
+#
+# Copyright 2007 Sam Hart
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+# Author: Sam Hart
+
+import threading
+import unittest
+
+import support
+
+remote_module = support.load('swarmlib.remote')
+clone_module = support.load('swarmlib.clone')
+store = support.load('swarmlib.db.docstore')
+if remote_module and clone_module and store:
+    from swarmlib import hive_server
+    from hives import docstore_hive
+
+@unittest.skipIf(remote_module is None or clone_module is None or store is None,
+                 support.missing('swarmlib.remote'))
+class test_remote_clone(unittest.TestCase):
+    def setUp(self):
+        self.tmp = support.temp_dir()
+        self.log = support.quiet_log()
+        self.poll_timeout = hive_server.__POLL_TIMEOUT__
+        hive_server.__POLL_TIMEOUT__ = 0.05
+        self.servers = []
+
+    def tearDown(self):
+        for (server, thread) in self.servers:
+            server.stop()
+            thread.join()
+        hive_server.__POLL_TIMEOUT__ = self.poll_timeout
+        self.tmp.cleanup()
+
+    def serve(self, sw):
+        """
+        Serve sw on a free TCP port, returning its swarm:// URL and the
+        list of the ops of the requests the server gets
+        """
+        server = hive_server.hive_server(sw, self.log, address=('127.0.0.1', 0))
+        requests = []
+        handle = server._handle
+        def counted(channel, request):
+            requests.append(request['op'])
+            handle(channel, request)
+        server._handle = counted
+        thread = threading.Thread(target=server.serve)
+        thread.start()
+        self.servers.append((server, thread))
+        url = "swarm://127.0.0.1:%i%s" % (server.socket.getsockname()[1], sw.path)
+        return (url, requests)
+
+    def clone(self, name, issues, replies=3):
+        """
+        Clone a hive of issues over the network a few log entries at a
+        time. Returns (source, dest, remote hive, server requests).
+        """
+        source = docstore_hive(self.tmp.join(name), self.log)
+        for i in range(issues):
+            source.add_issue(replies=replies)
+        (url, requests) = self.serve(source)
+        remote = remote_module.remote_hive(url, self.log)
+        dest = docstore_hive(self.tmp.join(name + '-clone'), self.log,
+                             settings={('replicate', 'chunk_size') : '8'})
+        clone_module.clone(remote, dest, self.log).run()
+        remote.close()
+        return (source, dest, remote, requests)
+
+    def test_clone_matches_source(self):
+        (source, dest, remote, requests) = self.clone('source', 5)
+        self.assertEqual(dest.contents(), source.contents())
+        self.assertTrue(remote.batches > 1)
+        self.assertTrue(0 < remote.bytes_received < remote.bytes_uncompressed)
+
+    def test_requests_dont_grow_with_the_log(self):
+        (source, dest, remote, small) = self.clone('small', 2)
+        (source, dest, remote, large) = self.clone('large', 20)
+        self.assertTrue(remote.batches > 10)
+        # One request for the hive's name, one for the whole log
+        self.assertEqual(sorted(small), ['hive_info', 'stream_replication'])
+        self.assertEqual(sorted(large), sorted(small))
+
+    def test_path_must_match(self):
+        source = docstore_hive(self.tmp.join('source'), self.log)
+        (url, requests) = self.serve(source)
+        self.assertRaises(remote_module.HiveServerError,
+                          remote_module.remote_hive, url + '-elsewhere', self.log)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+#
+# test_replicate - Tests for transaction log replay
+#
+# Copyright 2007 Sam Hart
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+# Author: Sam Hart
+
+import unittest
+
+import support
+
+replicate_module = support.load('swarmlib.replicate')
+store = support.load('swarmlib.db.docstore')
+if replicate_module and store:
+    from hives import docstore_hive
+
+class single_calls_only:
+    """
+    A backend without the bulk calls, like the SQL one
+    """
+    __BULK_CALLS__ = ('new_issues', 'new_nodes', 'add_lineages',
+                      'link_issues_to_nodes')
+
+    def __init__(self, backend):
+        self._backend = backend
+
+    def __getattr__(self, name):
+        if name in self.__BULK_CALLS__:
+            raise AttributeError(name)
+        return getattr(self._backend, name)
+
+class failing_nodes:
+    """
+    A backend which can't take new nodes
+    """
+    def __init__(self, backend):
+        self._backend = backend
+
+    def new_node(self, *args):
+        raise ValueError("no room for nodes")
+
+    def new_nodes(self, nodes):
+        raise ValueError("no room for nodes")
+
+    def __getattr__(self, name):
+        return getattr(self._backend, name)
+
+class broken_links:
+    """
+    A backend whose link_issue_to_node() raises something other than a
+    replication error
+    """
+    def __init__(self, backend):
+        self._backend = backend
+
+    def link_issue_to_node(self, *args):
+        raise KeyError("broken")
+
+    def __getattr__(self, name):
+        return getattr(self._backend, name)
+
+@unittest.skipIf(replicate_module is None, support.missing('swarmlib.replicate'))
+class test_replay(unittest.TestCase):
+    def setUp(self):
+        self.tmp = support.temp_dir()
+        self.log = support.quiet_log()
+        self.source = docstore_hive(self.tmp.join('source'), self.log)
+        for i in range(5):
+            self.source.add_issue(replies=i)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def replay(self, name, settings=None, wrapper=None):
+        dest = docstore_hive(self.tmp.join(name), self.log, settings=settings)
+        if wrapper:
+            dest.db.backend = wrapper(dest.db.backend)
+        rep = replicate_module.replicate(self.source, dest, self.log)
+        (errors, total) = rep.replay('tracker')
+        return (rep, dest, errors)
+
+    def test_batch_is_off_by_default(self):
+        (rep, dest, errors) = self.replay('dest')
+        self.assertFalse(rep.batch)
+
+    def test_batched_replay_matches_single(self):
+        (rep, single, errors) = self.replay('single')
+        self.assertEqual(errors, 0)
+        (rep, batched, errors) = self.replay('batched', {('replicate', 'batch') : 'yes'})
+        self.assertTrue(rep.batch)
+        self.assertEqual(errors, 0)
+        self.assertEqual(single.contents(), self.source.contents())
+        # Batches put the log entries of a chunk in a different order
+        self.assertEqual(batched.contents(False), self.source.contents(False))
+
+    def test_batched_replay_without_bulk_calls(self):
+        (rep, dest, errors) = self.replay('dest', {('replicate', 'batch') : 'yes'},
+                                          single_calls_only)
+        self.assertEqual(errors, 0)
+        self.assertEqual(dest.contents(False), self.source.contents(False))
+
+    def test_batches_are_in_dependency_order(self):
+        calls = []
+        class recorder:
+            def __init__(self, backend):
+                self._backend = backend
+            def __getattr__(self, name):
+                calls.append(name)
+                return getattr(self._backend, name)
+        (rep, dest, errors) = self.replay('dest', {('replicate', 'batch') : 'yes'},
+                                          recorder)
+        self.assertEqual(errors, 0)
+        bulk = [name for name in calls if name in
+                ('new_issues', 'new_nodes', 'link_issues_to_nodes', 'add_lineages')]
+        self.assertEqual(bulk, ['new_issues', 'new_nodes', 'link_issues_to_nodes',
+                                'add_lineages'])
+        (issues, nodes, edges, xlog) = dest.contents()
+        xactions = [xaction for (root, xaction) in xlog]
+        self.assertEqual(xactions, sorted(xactions, key=['new_issue', 'new_node',
+            'link_issue_to_node', 'add_lineage'].index))
+
+    def test_failed_batch_is_counted_and_rolled_back(self):
+        self.log = support.captured_log()
+        (rep, dest, errors) = self.replay('dest', {('replicate', 'batch') : 'yes'},
+                                          failing_nodes)
+        # The nodes of the whole chunk go in one batch
+        self.assertEqual(errors, 15)
+        self.assertTrue("Replicating '15' new_node transactions failed: no room for nodes"
+                        in self.log.errors.getvalue())
+        self.assertEqual(dest.contents(), ([], [], [], []))
+        self.assertEqual(dest.db.backend.get_checkpoint('tracker'), None)
+
+    def test_raising_chunk_is_rolled_back(self):
+        dest = docstore_hive(self.tmp.join('dest'), self.log)
+        dest.db.backend = broken_links(dest.db.backend)
+        rep = replicate_module.replicate(self.source, dest, self.log)
+        self.assertRaises(KeyError, rep.replay, 'tracker')
+        self.assertEqual(dest.contents(), ([], [], [], []))
+        self.assertEqual(dest.db.backend.get_checkpoint('tracker'), None)
+
+    def test_checkpoint_per_chunk(self):
+        (rep, dest, errors) = self.replay('dest', {('replicate', 'chunk_size') : '4',
+                                                   ('replicate', 'batch') : 'yes'})
+        self.assertEqual(errors, 0)
+        self.assertEqual(dest.db.backend.get_checkpoint('tracker'),
+                         self.source.db.backend.get_last_xid())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+#
+# test_segment_log - Tests of the segment log transaction log engine
+#
+# Copyright 2007 Sam Hart
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+# Author: Sam Hart
+
+import os
+import unittest
+
+import support
+
+segments = support.load('swarmlib.db.segment_log')
+store = support.load('swarmlib.db.docstore')
+
+@unittest.skipIf(segments is None, support.missing('swarmlib.db.segment_log'))
+class test_segment_log(unittest.TestCase):
+    def setUp(self):
+        self.tmp = support.temp_dir()
+        self.log = support.quiet_log()
+        self.xlog = self.open()
+
+    def tearDown(self):
+        self.xlog.close()
+        self.tmp.cleanup()
+
+    def open(self, segment_size=segments and segments.__SEGMENT_SIZE__):
+        return segments.segment_log(self.tmp.join('xlog'), self.log,
+                                    segment_size)
+
+    def fill(self, xlog, count, per_commit=1):
+        for i in range(count):
+            xlog.append('%040i' % (i % 3), 'new_node', 'data %i' % i,
+                        time=float(i))
+            if (i + 1) % per_commit == 0:
+                xlog.commit()
+        xlog.commit()
+
+    def test_append_commit_read(self):
+        self.assertEqual(self.xlog.get_last_xid(), None)
+        self.assertEqual(self.xlog.append('a' * 40, 'new_issue', 'x', time=1.0), 1)
+        self.assertEqual(self.xlog.append(None, 'set_taxonomy', None), 2)
+        self.assertEqual(self.xlog.append('a' * 40, 'update_issue',
+                                          {'status' : 2}, time=3.0), 3)
+        self.xlog.commit()
+        self.assertEqual(self.xlog.get_transaction_log(),
+                         [(1, 'a' * 40, 1.0, 'new_issue', 'x'),
+                          (2, None, None, 'set_taxonomy', None),
+                          (3, 'a' * 40, 3.0, 'update_issue', {'status' : 2})])
+        self.assertTrue(self.xlog.has(2))
+        self.assertFalse(self.xlog.has(4))
+
+    def test_given_xids_must_increase(self):
+        self.xlog.append(None, 'new_issue', 'x', xid=10)
+        self.assertRaises(ValueError, self.xlog.append, None, 'new_issue',
+                          'y', 10)
+        self.assertEqual(self.xlog.append(None, 'new_issue', 'y'), 11)
+
+    def test_rollback(self):
+        self.fill(self.xlog, 3)
+        self.xlog.append(None, 'new_issue', 'x')
+        self.xlog.rollback()
+        self.assertEqual(self.xlog.get_last_xid(), 3)
+        self.xlog.prepare()
+        self.xlog.unprepare()
+        self.xlog.rollback()
+        self.assertEqual(len(self.xlog.get_transaction_log()), 3)
+
+    def test_filters(self):
+        self.fill(self.xlog, 30, per_commit=4)
+        xlog = self.xlog
+        self.assertEqual([e[0] for e in xlog.get_transaction_log(limit=3)],
+                         [1, 2, 3])
+        self.assertEqual([e[0] for e in xlog.get_transaction_log(limit=3, reverse=True)],
+                         [30, 29, 28])
+        self.assertEqual([e[0] for e in xlog.get_transaction_log(since_xid=25)],
+                         [26, 27, 28, 29, 30])
+        self.assertEqual([e[0] for e in xlog.get_transaction_log(
+                             before_xid=10, reverse=True, limit=2)], [9, 8])
+        self.assertEqual([e[0] for e in xlog.get_transaction_log(
+                             issue='%040i' % 1, since=10.0, until=20.0)],
+                         [11, 14, 17, 20])
+        self.assertEqual(xlog.get_transaction_log(xaction='new_issue'), [])
+        chunks = list(xlog.iter_transaction_log(chunk_size=7, limit=20,
+                                                reverse=True))
+        self.assertEqual([len(chunk) for chunk in chunks], [7, 7, 6])
+        self.assertEqual(chunks[-1][-1][0], 11)
+
+    def test_segments_and_index(self):
+        xlog = self.open(segment_size=4096)
+        self.fill(xlog, 600, per_commit=5)
+        self.assertTrue(len(xlog._segments) > 3)
+        self.assertEqual([e[0] for e in xlog.get_transaction_log()],
+                         range(1, 601))
+        self.assertEqual([e[0] for e in xlog.get_transaction_log(
+                             since_xid=333, limit=2)], [334, 335])
+        self.assertEqual([e[0] for e in xlog.get_transaction_log(
+                             before_xid=333, limit=2, reverse=True)], [332, 331])
+        xlog.close()
+        # Another log reads the same segments from the files
+        again = self.open(segment_size=4096)
+        self.assertEqual(again.get_last_xid(), 600)
+        self.assertEqual(len(again.get_transaction_log(since_xid=100)), 500)
+        again.close()
+
+    def test_torn_tail_is_dropped(self):
+        self.fill(self.xlog, 5)
+        self.xlog.close()
+        path = self.tmp.join('xlog', '%020i.seg' % 1)
+        size = os.path.getsize(path)
+        fp = open(path, 'ab')
+        fp.write('\x00\x00\x00\x20half a record')
+        fp.close()
+        xlog = self.open()
+        self.assertEqual(xlog.get_last_xid(), 5)
+        self.assertEqual(xlog.append(None, 'new_issue', 'x'), 6)
+        xlog.commit()
+        self.assertEqual([e[0] for e in xlog.get_transaction_log(since_xid=4)],
+                         [5, 6])
+        self.assertTrue(os.path.getsize(path) > size)
+        xlog.close()
+
+    def test_writers_catch_up(self):
+        other = self.open()
+        self.fill(self.xlog, 3)
+        self.assertEqual(other.get_last_xid(), 3)
+        self.assertEqual(other.append(None, 'new_issue', 'x'), 4)
+        other.commit()
+        self.assertEqual(self.xlog.append(None, 'new_issue', 'y'), 5)
+        self.xlog.commit()
+        self.assertEqual([e[4] for e in other.get_transaction_log(since_xid=3)],
+                         ['x', 'y'])
+        other.close()
+
+    def test_delete_transactions(self):
+        xlog = self.open(segment_size=1024)
+        self.fill(xlog, 100, per_commit=10)
+        xlog.delete_transactions([2, 50, 99])
+        self.assertEqual(len(xlog.get_transaction_log()), 100)
+        xlog.commit()
+        xids = [e[0] for e in xlog.get_transaction_log()]
+        self.assertEqual(len(xids), 97)
+        self.assertFalse(2 in xids or 50 in xids or 99 in xids)
+        self.assertEqual(xlog.append(None, 'new_issue', 'x'), 101)
+        xlog.commit()
+        xlog.close()
+        again = self.open(segment_size=1024)
+        self.assertEqual([e[0] for e in again.get_transaction_log(
+                             since_xid=48, limit=2)], [49, 51])
+        again.close()
+
+@unittest.skipIf(segments is None or store is None,
+                 support.missing('swarmlib.db.docstore'))
+class test_docstore_segments(unittest.TestCase):
+    def setUp(self):
+        from hives import docstore_hive
+        self.tmp = support.temp_dir()
+        self.log = support.quiet_log()
+        self.plain = docstore_hive(self.tmp.join('plain'), self.log)
+        self.hive = docstore_hive(self.tmp.join('segments'), self.log,
+                                  segments=True)
+
+    def tearDown(self):
+        self.plain.close()
+        self.hive.close()
+        self.tmp.cleanup()
+
+    def test_same_log_as_a_collection(self):
+        for hive in (self.plain, self.hive):
+            added = [hive.add_issue(replies=i) for i in range(4)]
+        self.assertFalse(self.hive.db.backend.engine.has_collection('transaction_log'))
+        (issues, nodes, edges, xlog) = self.hive.contents()
+        self.assertEqual(len(xlog), 4 * 3 + 6 * 2)
+        self.assertEqual([xaction for (root, xaction) in xlog],
+                         [xaction for (root, xaction) in self.plain.contents()[3]])
+        self.assertEqual(xlog[0], (added[0], 'new_issue'))
+        self.assertEqual(issues, sorted(added))
+        plain = self.plain.db.backend
+        backend = self.hive.db.backend
+        self.assertEqual(backend.get_last_xid(), plain.get_last_xid())
+        self.assertEqual([e[2:4] for e in backend.get_transaction_log(reverse=True, limit=5)],
+                         [e[2:4] for e in plain.get_transaction_log(reverse=True, limit=5)])
+
+    def test_engine_commit_failure_cuts_the_log(self):
+        backend = self.hive.db.backend
+        self.hive.add_issue()
+        last_xid = backend.get_last_xid()
+        commit = backend.engine.commit
+        def fail():
+            raise IOError("disk full")
+        backend.engine.commit = fail
+        backend.log_transaction(None, 'set_taxonomy', None)
+        self.assertRaises(IOError, backend.commit)
+        backend.engine.commit = commit
+        backend.rollback()
+        self.assertEqual(backend.get_last_xid(), last_xid)
+        other = self.hive.db.backend.xlog.__class__(
+            self.tmp.join('segments', '.swarm', 'xlog'), self.log)
+        self.assertEqual(other.get_last_xid(), last_xid)
+        other.close()
+
+    def test_from_config(self):
+        from hives import hive_config
+        dot_swarm = self.tmp.join('configured')
+        os.makedirs(dot_swarm)
+        config = hive_config(dot_swarm, {('db', 'xlog') : 'segment'})
+        backend = store.from_config(config, self.log)
+        self.assertEqual(backend.xlog.path, os.path.join(dot_swarm, 'xlog'))
+        backend.close()
+
+if __name__ == '__main__':
+    unittest.main()
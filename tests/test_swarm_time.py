@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+#
+# test_swarm_time - Tests for the time helpers
+#
+# Copyright 2007 Sam Hart
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+# Author: Sam Hart
+
+import time
+import unittest
+
+import support
+
+import swarmlib.swarm_time as swarm_time
+
+class test_parse(unittest.TestCase):
+    def midnight(self, year, month, day):
+        return time.mktime((year, month, day, 0, 0, 0, 0, 0, -1))
+
+    def test_timestamp(self):
+        self.assertEqual(swarm_time.parse('1234.5'), 1234.5)
+        self.assertEqual(swarm_time.parse('1234.5', end=True), 1234.5)
+
+    def test_date_is_start_of_day(self):
+        self.assertEqual(swarm_time.parse('2008-03-01'), self.midnight(2008, 3, 1))
+
+    def test_date_end_covers_the_day(self):
+        until = swarm_time.parse('2008-02-29', end=True)
+        self.assertTrue(until > time.mktime(time.strptime('2008-02-29 23:59:59', '%Y-%m-%d %H:%M:%S')))
+        self.assertTrue(until < self.midnight(2008, 3, 1))
+        self.assertAlmostEqual(until, self.midnight(2008, 3, 1) - 1e-6, 6)
+
+    def test_date_end_at_year_end(self):
+        until = swarm_time.parse('2007-12-31', end=True)
+        self.assertTrue(until < self.midnight(2008, 1, 1))
+        self.assertTrue(until > self.midnight(2008, 1, 1) - 1)
+
+    def test_end_only_changes_dates(self):
+        text = '2008-03-01 12:30'
+        self.assertEqual(swarm_time.parse(text, end=True), swarm_time.parse(text))
+
+    def test_bad_time(self):
+        self.assertRaises(ValueError, swarm_time.parse, 'yesterday')
+
+if __name__ == '__main__':
+    unittest.main()
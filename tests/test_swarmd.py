@@ -0,0 +1,254 @@
+#!/usr/bin/env python
+#
+# test_swarmd - Tests for the swarm daemon and the commands it proxies
+#
+# Copyright 2007 Sam Hart
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+# Author: Sam Hart
+
+import os
+import sys
+import json
+import socket
+import unittest
+import threading
+from StringIO import StringIO
+
+import support
+
+swarmd_module = support.load('swarmlib.swarmd')
+cli = support.load('swarmlib.cli')
+store = support.load('swarmlib.db.docstore')
+if swarmd_module:
+    from swarmlib.swarmd import swarmd, hive_stamp, proxy, __FRAME__
+if store:
+    import swarmlib.swarm_time as swarm_time
+    from hives import docstore_hive
+
+def echo(argv):
+    # Straight to the descriptors, which the daemon points at its pipes
+    os.write(1, 'out\n')
+    os.write(2, 'err\n')
+    sys.exit(3)
+
+def big(argv):
+    os.write(1, 'x' * 100000)
+
+def pwd(argv):
+    os.write(1, os.getcwd())
+
+def crash(argv):
+    raise ValueError("crashed")
+
+class scripted_daemon(swarmd):
+    """
+    Runs the functions in commands (by the first argument) instead of
+    'swarm' commands, and opens fake hives
+    """
+    commands = {'echo' : echo, 'big' : big, 'pwd' : pwd, 'crash' : crash}
+
+    def _run_cli(self, argv):
+        self.commands[argv[0]](argv[1:])
+
+    def _open_hive(self, path):
+        return fake_hive()
+
+class fake_hive:
+    def close(self):
+        pass
+
+def read_frames(sock):
+    """
+    Returns every frame on sock until it closes, as (type, data)
+    """
+    frames = []
+    data = ''
+    while True:
+        chunk = sock.recv(4096)
+        if not chunk:
+            break
+        data = data + chunk
+    while data:
+        (kind, length) = __FRAME__.unpack(data[:__FRAME__.size])
+        start = __FRAME__.size
+        frames.append((kind, data[start:start + length]))
+        data = data[start + length:]
+    return frames
+
+class daemon_case(unittest.TestCase):
+    daemon = None
+
+    def setUp(self):
+        self.tmp = support.temp_dir()
+        self.addCleanup(self.tmp.cleanup)
+        self.addCleanup(os.chdir, os.getcwd())
+        self.log = support.captured_log()
+        self.path = self.tmp.join('socket')
+        self.server = self.daemon(self.path, self.log)
+        self.addCleanup(self.server.server_close)
+
+    def serve_one(self):
+        thread = threading.Thread(target=self.server.handle_request)
+        thread.start()
+        self.addCleanup(thread.join, 5)
+        return thread
+
+    def request(self, line):
+        thread = self.serve_one()
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(self.path)
+        sock.sendall(line)
+        frames = read_frames(sock)
+        sock.close()
+        thread.join(5)
+        return frames
+
+    def run_command(self, argv, cwd=None):
+        return self.request(json.dumps({'cwd' : cwd or self.tmp.path,
+                                         'argv' : argv}) + "\n")
+
+    def output(self, frames, kind):
+        return ''.join([data for (frame_kind, data) in frames
+                        if frame_kind == kind])
+
+    def proxied(self, argv, cwd=None):
+        """
+        Run argv through proxy(), as 'swarm' does, returning (status,
+        output, errors)
+        """
+        os.environ['SWARMD_SOCKET'] = self.path
+        self.addCleanup(os.environ.pop, 'SWARMD_SOCKET', None)
+        os.chdir(cwd or self.tmp.path)
+        saved = (sys.stdout, sys.stderr)
+        (sys.stdout, sys.stderr) = (StringIO(), StringIO())
+        try:
+            status = proxy(argv)
+            return (status, sys.stdout.getvalue(), sys.stderr.getvalue())
+        finally:
+            (sys.stdout, sys.stderr) = saved
+
+@unittest.skipIf(swarmd_module is None, support.missing('swarmlib.swarmd'))
+class test_hive_stamp(unittest.TestCase):
+    def setUp(self):
+        self.tmp = support.temp_dir()
+        self.addCleanup(self.tmp.cleanup)
+
+    def test_stamp(self):
+        self.assertEqual(hive_stamp(self.tmp.path), None)
+        os.mkdir(self.tmp.join('.swarm'))
+        open(self.tmp.join('.swarm', 'swarmrc'), 'w').write('[main]\n')
+        stamp = hive_stamp(self.tmp.path)
+        self.assertEqual(hive_stamp(self.tmp.path), stamp)
+        open(self.tmp.join('.swarm', 'swarmrc'), 'a').write('project_name = x\n')
+        self.assertNotEqual(hive_stamp(self.tmp.path), stamp)
+        stamp = hive_stamp(self.tmp.path)
+        open(self.tmp.join('.swarm', 'swarm.dcs'), 'w').close()
+        self.assertNotEqual(hive_stamp(self.tmp.path), stamp)
+
+@unittest.skipIf(swarmd_module is None, support.missing('swarmlib.swarmd'))
+class test_swarmd(daemon_case):
+    daemon = swarmd_module and scripted_daemon
+
+    def test_frames(self):
+        frames = self.run_command(['echo'])
+        self.assertEqual(self.output(frames, 'o'), 'out\n')
+        self.assertEqual(self.output(frames, 'e'), 'err\n')
+        self.assertEqual(frames[-1], ('x', '3'))
+        self.assertEqual([kind for (kind, data) in frames].count('x'), 1)
+
+    def test_output_in_many_frames(self):
+        frames = self.run_command(['big'])
+        self.assertEqual(self.output(frames, 'o'), 'x' * 100000)
+        self.assertEqual(frames[-1], ('x', '0'))
+
+    def test_runs_in_the_working_directory(self):
+        frames = self.run_command(['pwd'], self.tmp.join('.'))
+        self.assertEqual(os.path.realpath(self.output(frames, 'o')),
+                         os.path.realpath(self.tmp.path))
+
+    def test_crash(self):
+        frames = self.run_command(['crash'])
+        self.assertTrue('ValueError: crashed' in self.output(frames, 'e'))
+        self.assertEqual(frames[-1], ('x', '1'))
+
+    def test_bad_request(self):
+        self.assertEqual(self.request("not json\n"), [])
+        self.assertEqual(self.request(json.dumps({'argv' : ['echo']}) + "\n"), [])
+        self.assertTrue("Bad request" in self.log.errors.getvalue())
+
+    def test_proxy(self):
+        self.serve_one()
+        self.assertEqual(self.proxied(['echo']), (3, 'out\n', 'err\n'))
+
+    def test_no_daemon(self):
+        self.addCleanup(os.environ.pop, 'SWARMD_SOCKET', None)
+        os.environ['SWARMD_SOCKET'] = self.tmp.join('elsewhere')
+        self.assertEqual(proxy(['echo']), None)
+        os.environ['SWARMD_SOCKET'] = ''
+        self.assertEqual(proxy(['echo']), None)
+
+    def test_changed_hive_is_reopened(self):
+        os.mkdir(self.tmp.join('.swarm'))
+        hive = self.server.hives.acquire(self.tmp.path)
+        self.server.hives.release(hive)
+        self.assertTrue(self.server.hives.acquire(self.tmp.path) is hive)
+        self.server.hives.release(hive)
+        # Written to by a 'swarm' run without the daemon
+        open(self.tmp.join('.swarm', 'swarmrc'), 'w').write('[main]\n')
+        self.assertFalse(self.server.hives.acquire(self.tmp.path) is hive)
+
+class docstore_daemon(swarmd):
+    """
+    Opens the hives of tests.hives, on disk so that every open sees the
+    same one
+    """
+    def _open_hive(self, path):
+        return docstore_hive(path, self.log, hive_url(path))
+
+def hive_url(path):
+    return 'disk://' + os.path.join(path, '.swarm', 'hive.dcs')
+
+@unittest.skipIf(cli is None, support.missing('swarmlib.cli'))
+@unittest.skipIf(store is None, support.missing('swarmlib.db.docstore'))
+class test_proxied_log(daemon_case):
+    daemon = cli and store and docstore_daemon
+
+    def test_log_round_trip(self):
+        path = self.tmp.join('hive')
+        hive = docstore_hive(path, self.log, hive_url(path))
+        self.addCleanup(hive.close)
+        hive.add_issue(replies=1)
+        expected = ''.join(["[%i] %s - %s\n" % (xid,
+                                swarm_time.human_readable_from_stamp(time),
+                                hive.xactions.dispatch[xaction].description)
+                            for (xid, root, time, xaction, xdata)
+                            in hive.get_transaction_log()])
+        # The daemon runs the command in a process of its own, as it
+        # would for a real 'swarm log', so that the two don't share
+        # sys.stdout
+        pid = os.fork()
+        if pid == 0:
+            try:
+                self.server.handle_request()
+            finally:
+                os._exit(0)
+        (status, output, errors) = self.proxied(['log'], path)
+        os.waitpid(pid, 0)
+        self.assertEqual((status, output), (0, expected))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+#
+# test_xaction - Tests for the transaction encodings
+#
+# Copyright 2007 Sam Hart
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+# Author: Sam Hart
+
+import unittest
+
+import support
+
+from swarmlib.xaction import xaction_dispatch
+
+class test_compact(unittest.TestCase):
+    def setUp(self):
+        self.xactions = xaction_dispatch()
+        self.lineage = {'parent_id' : 'a' * 40, 'child_id' : 'b' * 40}
+
+    def test_round_trip(self):
+        for (xaction, data) in (('add_lineage', self.lineage),
+                                ('set_taxonomy', {'status' : ['open']})):
+            dispatch = self.xactions.dispatch[xaction]
+            self.assertEqual(dispatch.decode(dispatch.encode(data)), data)
+
+    def test_unknown_version(self):
+        xdata = self.xactions.dispatch['add_lineage'].encode(self.lineage)
+        newer = xdata[0] + '\x02' + xdata[2:]
+        self.assertRaises(ValueError, self.xactions.dispatch['add_lineage'].decode, newer)
+
+    def test_unknown_format(self):
+        xdata = self.xactions.dispatch['add_lineage'].encode(self.lineage)
+        self.assertRaises(ValueError, self.xactions.dispatch['add_lineage'].decode,
+                          xdata[:2] + 'Z' + xdata[3:])
+
+if __name__ == '__main__':
+    unittest.main()